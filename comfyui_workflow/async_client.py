@@ -0,0 +1,330 @@
+"""
+Asyncio ComfyUI client that keeps many prompts in flight.
+
+One AsyncComfyUIClient holds one aiohttp session and one /ws?clientId=
+socket. Every prompt is queued under that client_id and a single listener
+task routes completion and error events to the coroutine waiting on the
+prompt. So any number of prompts can be queued and awaited together, and
+ComfyUI's queue never runs dry between submissions. Each prompt costs one
+/history read once it is done, and its outputs are then downloaded
+concurrently: streamed to disk in chunks when an output directory is
+given, or taken straight from ComfyUI's output directory when it is on
+this host (see outputs.py).
+
+Without a socket (none available, or it dropped) waiters poll /history
+every COMFYUI_POLL_INTERVAL seconds, as comfyui_events.PromptWatcher does.
+Timeouts and retry backoff follow http_client.
+
+    async with AsyncComfyUIClient(url) as client:
+        results = await client.run_many(workflows)
+"""
+import asyncio
+import json
+import os
+import time
+import uuid
+
+import aiohttp
+
+import http_client
+from comfyui_events import COMFYUI_POLL_INTERVAL, WS_HISTORY_CHECK, finished_entry, websocket_url
+from outputs import COMFYUI_LOCAL_OUTPUTS, OUTPUT_CHUNK, detect_output_dir, link_or_copy, local_path, partial_file
+
+# Prompts queued or running in ComfyUI at once; 2 is enough to keep the GPU busy between jobs
+COMFYUI_MAX_IN_FLIGHT = int(os.getenv("COMFYUI_MAX_IN_FLIGHT", "4"))
+# Output files downloaded at once
+COMFYUI_DOWNLOADS = int(os.getenv("COMFYUI_DOWNLOADS", "4"))
+# Output keys that list files, as written by SaveImage and the video nodes
+OUTPUT_KINDS = ("images", "videos", "gifs")
+
+
+def _timeout(endpoint):
+    connect, read = http_client.TIMEOUTS.get(endpoint, http_client.TIMEOUTS["default"])
+    return aiohttp.ClientTimeout(sock_connect=connect, sock_read=read)
+
+
+class AsyncComfyUIClient:
+    """
+    ComfyUI client for use from asyncio code; see the module docstring.
+
+    At most max_in_flight prompts are queued or running at a time, and at
+    most downloads output files are transferred at a time. With events
+    False no event socket is opened, for clients that only download.
+    """
+
+    def __init__(self, server_url="http://localhost:8188", timeout=600, max_in_flight=None, downloads=None,
+                 poll_interval=None, events=True):
+        self.server_url = server_url.rstrip('/')
+        self.timeout = timeout
+        self.client_id = uuid.uuid4().hex
+        self.poll_interval = COMFYUI_POLL_INTERVAL if poll_interval is None else poll_interval
+        self.events = events
+        self._slots = asyncio.Semaphore(max_in_flight or COMFYUI_MAX_IN_FLIGHT)
+        self._downloads = asyncio.Semaphore(downloads or COMFYUI_DOWNLOADS)
+        self.session = None
+        self.ws = None
+        self._listener = None
+        # prompt_id -> future resolved by the listener: True when done, False to re-check /history
+        self._waiters = {}
+        self.history_requests = 0
+        # ComfyUI's output directory when it is on this host
+        self.comfyui_output_dir = None
+
+    async def __aenter__(self):
+        self.session = aiohttp.ClientSession()
+        if self.events:
+            await self.connect()
+        await self.detect_local_outputs()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def connect(self):
+        """Open the event socket if possible; returns whether it is open."""
+        if self.ws is not None:
+            return True
+        try:
+            self.ws = await self.session.ws_connect(websocket_url(self.server_url, self.client_id), heartbeat=30)
+        except (aiohttp.ClientError, asyncio.TimeoutError, OSError) as e:
+            print(f"ComfyUI websocket unavailable ({e}), polling /history instead")
+            return False
+        self._listener = asyncio.create_task(self._listen(self.ws))
+        return True
+
+    async def close(self):
+        ws, self.ws = self.ws, None
+        if self._listener is not None:
+            self._listener.cancel()
+            await asyncio.gather(self._listener, return_exceptions=True)
+            self._listener = None
+        if ws is not None:
+            await ws.close()
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def detect_local_outputs(self):
+        """Look for ComfyUI's output directory on this host; returns it or None."""
+        stats = None
+        if COMFYUI_LOCAL_OUTPUTS:
+            try:
+                stats = json.loads(await self._request("GET", "system_stats", "/system_stats", retries=0))
+            except (aiohttp.ClientError, asyncio.TimeoutError, RuntimeError, ValueError):
+                pass
+        self.comfyui_output_dir = detect_output_dir(self.server_url, stats)
+        if self.comfyui_output_dir:
+            print(f"ComfyUI outputs are on this host in {self.comfyui_output_dir}, using them without HTTP")
+        return self.comfyui_output_dir
+
+    def _waiter(self, prompt_id):
+        # Created by whichever comes first, the event or the waiting coroutine
+        if prompt_id not in self._waiters:
+            self._waiters[prompt_id] = asyncio.get_running_loop().create_future()
+        return self._waiters[prompt_id]
+
+    async def _listen(self, ws):
+        try:
+            async for message in ws:
+                if message.type != aiohttp.WSMsgType.TEXT:
+                    # Binary frames are latent previews
+                    continue
+                try:
+                    event = json.loads(message.data)
+                    data = event.get("data") or {}
+                except (ValueError, AttributeError):
+                    continue
+                prompt_id = data.get("prompt_id")
+                if not prompt_id:
+                    continue
+                waiter = self._waiter(prompt_id)
+                if waiter.done():
+                    continue
+                if event.get("type") == "execution_error":
+                    node = data.get("node_type") or data.get("node_id")
+                    waiter.set_exception(RuntimeError(
+                        f"Workflow execution failed: {data.get('exception_message', 'unknown error')} (node {node})"))
+                elif event.get("type") == "execution_interrupted":
+                    waiter.set_exception(RuntimeError("Workflow execution was interrupted"))
+                elif event.get("type") == "executing" and data.get("node") is None:
+                    waiter.set_result(True)
+        finally:
+            # Still current unless close() is shutting it down
+            if self.ws is ws:
+                print(f"ComfyUI websocket dropped ({ws.exception() or 'closed by server'}), polling /history instead")
+                self.ws = None
+            # Wake every waiter so it switches to polling
+            for waiter in self._waiters.values():
+                if not waiter.done():
+                    waiter.set_result(False)
+
+    async def _request(self, method, endpoint, path, retries=None, destination=None, **kwargs):
+        """
+        Response body of a request, retried like http_client for GETs. With
+        a destination the body is streamed into that file instead and its
+        size is returned.
+        """
+        retries = http_client.HTTP_RETRIES if retries is None else retries
+        retries = retries if method == "GET" else 0
+        for attempt in range(retries + 1):
+            try:
+                async with self.session.request(method, f"{self.server_url}{path}", timeout=_timeout(endpoint),
+                                                 **kwargs) as response:
+                    if response.status in http_client.RETRY_STATUSES and attempt < retries:
+                        print(f"{method} {path} returned {response.status}, retrying")
+                    elif response.status != 200:
+                        body = await response.read()
+                        raise RuntimeError(f"{method} {path} failed: {response.status} - "
+                                           f"{body.decode(errors='replace')}")
+                    elif destination is None:
+                        return await response.read()
+                    else:
+                        return await self._save(response, destination)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if attempt == retries:
+                    raise
+                print(f"{method} {path} failed ({type(e).__name__}), retrying")
+            await asyncio.sleep(http_client.backoff_delay(attempt))
+
+    async def _save(self, response, destination):
+        size = 0
+        with partial_file(destination) as f:
+            async for chunk in response.content.iter_chunked(OUTPUT_CHUNK):
+                f.write(chunk)
+                size += len(chunk)
+        return size
+
+    async def upload_image(self, image_path, filename=None):
+        """Upload an image file to ComfyUI's input directory"""
+        filename = filename or os.path.basename(image_path)
+        with open(image_path, 'rb') as f:
+            form = aiohttp.FormData()
+            form.add_field("image", f.read(), filename=filename, content_type="image/png")
+        return json.loads(await self._request("POST", "upload", "/upload/image", data=form))
+
+    async def queue(self, workflow):
+        """Queue a workflow under this client's id; returns its prompt_id"""
+        body = await self._request("POST", "prompt", "/prompt", json={"prompt": workflow, "client_id": self.client_id})
+        return json.loads(body)["prompt_id"]
+
+    async def get_history(self, prompt_id):
+        """History entry of prompt_id, or None if ComfyUI has none yet"""
+        self.history_requests += 1
+        return json.loads(await self._request("GET", "history", f"/history/{prompt_id}", retries=0)).get(prompt_id)
+
+    async def _check(self, prompt_id):
+        try:
+            return finished_entry(await self.get_history(prompt_id))
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            print(f"Error checking status: {e}")
+            return None
+
+    async def wait(self, prompt_id, timeout=None):
+        """
+        History entry of prompt_id once it has finished, or None after
+        timeout seconds. Raises RuntimeError when execution failed.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + (self.timeout if timeout is None else timeout)
+        polling = False
+        try:
+            while True:
+                waiter = self._waiter(prompt_id)
+                interval = self.poll_interval if polling or self.ws is None else WS_HISTORY_CHECK
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    return None
+                try:
+                    done = await asyncio.wait_for(asyncio.shield(waiter), min(interval, remaining))
+                except asyncio.TimeoutError:
+                    done = False
+                # Woken by completion, a dropped socket or the interval: re-arm and look at /history
+                self._waiters.pop(prompt_id, None)
+                entry = await self._check(prompt_id)
+                if entry is not None:
+                    return entry
+                # Reported done before its history entry showed up
+                polling = polling or done
+        finally:
+            self._waiters.pop(prompt_id, None)
+
+    async def download(self, node_id, kind, file_info, destination=None, not_before=None):
+        """
+        One output file as {'filename', 'node_id', 'kind', 'size', 'transfer'}
+        plus 'path' when written to destination, or 'data' otherwise. A file
+        in ComfyUI's output directory on this host written since not_before
+        is hardlinked or read in place rather than fetched ('transfer' says
+        which). Without not_before it is always fetched, since a stale file
+        of the same name could not be told apart.
+        """
+        result = {"filename": file_info["filename"], "node_id": node_id, "kind": kind}
+        local = None
+        if not_before is not None:
+            local = local_path(self.comfyui_output_dir, file_info, not_before)
+        if local is not None:
+            if destination is None:
+                with open(local, 'rb') as f:
+                    data = f.read()
+                result.update(data=data, size=len(data), transfer="local")
+            else:
+                transfer = link_or_copy(local, destination)
+                result.update(path=destination, size=os.path.getsize(destination), transfer=transfer)
+            return result
+        params = {"filename": file_info["filename"], "type": file_info.get("type", "output")}
+        if file_info.get("subfolder"):
+            params["subfolder"] = file_info["subfolder"]
+        async with self._downloads:
+            body = await self._request("GET", "view", "/view", destination=destination, params=params)
+        if destination is None:
+            result.update(data=body, size=len(body), transfer="http")
+        else:
+            result.update(path=destination, size=body, transfer="http")
+        return result
+
+    async def download_outputs(self, entry, output_dir=None, prefix="", not_before=None, kinds=OUTPUT_KINDS):
+        """
+        Fetch every output file of the given kinds in a history entry
+        concurrently, into output_dir as prefix + filename when given, else
+        into memory
+        """
+        files = [(node_id, kind, file_info)
+                 for node_id, output in entry.get("outputs", {}).items()
+                 for kind in kinds
+                 for file_info in output.get(kind, [])
+                 # Previews live in the temp folder and are not results
+                 if file_info.get("type", "output") == "output"]
+        return await asyncio.gather(*(
+            self.download(node_id, kind, file_info,
+                          os.path.join(output_dir, prefix + os.path.basename(file_info["filename"]))
+                          if output_dir else None,
+                          not_before)
+            for node_id, kind, file_info in files))
+
+    async def run(self, workflow, timeout=None, output_dir=None):
+        """
+        Queue one workflow, wait for it and fetch its outputs; returns
+        {'prompt_id', 'images', 'videos'} like ComfyUIWorker.execute_workflow.
+        With output_dir, files are saved there as <prompt_id>_<filename>
+        and carry a 'path' instead of 'data'.
+        """
+        # Hold a slot only while queued or running, so downloads overlap the next prompt
+        async with self._slots:
+            queued_at = time.time()
+            prompt_id = await self.queue(workflow)
+            print(f"Workflow queued with ID: {prompt_id}")
+            entry = await self.wait(prompt_id, timeout)
+        if entry is None:
+            timeout = self.timeout if timeout is None else timeout
+            raise RuntimeError(f"Workflow {prompt_id} timed out after {timeout} seconds")
+        files = await self.download_outputs(entry, output_dir, f"{prompt_id}_", queued_at)
+        print(f"Workflow {prompt_id} completed with {len(files)} output files")
+        return {
+            "prompt_id": prompt_id,
+            "images": [f for f in files if f["kind"] == "images"],
+            "videos": [f for f in files if f["kind"] != "images"]
+        }
+
+    async def run_many(self, workflows, timeout=None, output_dir=None):
+        """run() for every workflow, in order; failed ones are returned as their exception"""
+        return await asyncio.gather(*(self.run(workflow, timeout, output_dir) for workflow in workflows),
+                                    return_exceptions=True)
@@ -0,0 +1,122 @@
+"""
+Where ComfyUI output files live, and how to get them to disk cheaply.
+
+Outputs are fetched from /view in OUTPUT_CHUNK pieces written straight to
+a temporary file, which is renamed into place once complete, so a video
+is never held in memory whole. When the client runs on the same host as
+ComfyUI, no HTTP transfer happens at all: the file is read in place, or
+hardlinked into the output directory (copied if it is on another
+filesystem).
+
+ComfyUI's output directory as seen from this host is COMFYUI_OUTPUT_DIR.
+When that is unset and the server URL is a loopback address, it is taken
+from the server's /system_stats argv (--output-directory, or output/ next
+to an absolute main.py path). A history file is only used locally if it
+exists there and was written after its prompt was queued, so a stale file
+of the same name from another server is never picked up.
+"""
+import ipaddress
+import os
+import shutil
+import uuid
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+COMFYUI_OUTPUT_DIR = os.getenv("COMFYUI_OUTPUT_DIR", "")
+# Use ComfyUI's output files directly when they are on this host
+COMFYUI_LOCAL_OUTPUTS = os.getenv("COMFYUI_LOCAL_OUTPUTS", "true").lower() == "true"
+OUTPUT_CHUNK = 1024 * 1024
+
+
+def is_loopback(server_url):
+    host = urlparse(server_url).hostname or ""
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def detect_output_dir(server_url, system_stats):
+    """ComfyUI's output directory on this host, or None when it is elsewhere or unknown."""
+    if not COMFYUI_LOCAL_OUTPUTS:
+        return None
+    if COMFYUI_OUTPUT_DIR:
+        return COMFYUI_OUTPUT_DIR if os.path.isdir(COMFYUI_OUTPUT_DIR) else None
+    if not is_loopback(server_url):
+        return None
+    argv = (system_stats or {}).get("system", {}).get("argv") or []
+    output_dir = None
+    if "--output-directory" in argv[:-1]:
+        output_dir = argv[argv.index("--output-directory") + 1]
+    elif argv and os.path.isabs(argv[0]):
+        output_dir = os.path.join(os.path.dirname(argv[0]), "output")
+    if output_dir and os.path.isabs(output_dir) and os.path.isdir(output_dir):
+        return output_dir
+    return None
+
+
+def local_path(output_dir, file_info, not_before=None):
+    """
+    Local path of a history output file under output_dir, or None if it
+    is not there, is not an output, or predates not_before (a time.time()).
+    """
+    if output_dir is None or file_info.get("type", "output") != "output":
+        return None
+    root = os.path.realpath(output_dir)
+    path = os.path.realpath(os.path.join(root, file_info.get("subfolder", ""), file_info["filename"]))
+    # Names come from the server; never follow them out of the output directory
+    if os.path.commonpath([root, path]) != root:
+        return None
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    if not_before is not None and stat.st_mtime < not_before - 1:
+        return None
+    return path
+
+
+def link_or_copy(source, destination):
+    """Hardlink source to destination, copying when they are on different filesystems; returns which."""
+    temp_path = _temp_path(destination)
+    try:
+        try:
+            os.link(source, temp_path)
+            how = "hardlink"
+        except OSError:
+            shutil.copyfile(source, temp_path)
+            how = "copy"
+        os.replace(temp_path, destination)
+    except BaseException:
+        _remove(temp_path)
+        raise
+    return how
+
+
+@contextmanager
+def partial_file(destination):
+    """Binary file to write destination through; renamed into place only if the block succeeds."""
+    temp_path = _temp_path(destination)
+    try:
+        with open(temp_path, "xb") as f:
+            yield f
+        os.replace(temp_path, destination)
+    except BaseException:
+        _remove(temp_path)
+        raise
+
+
+def _temp_path(destination):
+    # Next to the destination, so the final rename stays on one filesystem
+    directory = os.path.dirname(os.path.abspath(destination))
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, f".part-{uuid.uuid4().hex}")
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
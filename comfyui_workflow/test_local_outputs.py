@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Same-host outputs of worker.py against the fake ComfyUI server
+(flf/fake_comfyui.py), which writes its outputs to a local directory.
+
+Checks that a prompt's fresh output file is hardlinked rather than
+downloaded, and that a file older than the prompt's submit time, or one
+from a prompt this worker did not queue, is fetched over HTTP instead.
+Also checks that execute_workflow only drops the in-memory bytes when
+asked to stream to disk.
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+sys.path.append(os.path.join(HERE, "..", "flf"))
+from fake_comfyui import FakeComfyUI
+from worker import ComfyUIWorker
+
+WORKFLOW = {"1": {"class_type": "VHS_VideoCombine", "inputs": {}}}
+
+
+def run_prompt(worker):
+    prompt_id = worker.queue_workflow(WORKFLOW)['prompt_id']
+    assert worker.wait_for_completion(prompt_id, timeout=30)
+    return prompt_id
+
+
+def test_stale_local_output_downloaded():
+    """Only files written since the prompt was queued are used in place"""
+    with tempfile.TemporaryDirectory() as comfyui_output, tempfile.TemporaryDirectory() as output_dir, \
+            FakeComfyUI(run_time=0.1, output_dir=comfyui_output) as server:
+        worker = ComfyUIWorker(server.url, timeout=30)
+        prompt_id = run_prompt(worker)
+        [fresh] = worker.get_output_videos(prompt_id, output_dir)
+        assert fresh['transfer'] in ("hardlink", "copy"), fresh
+
+        # Same name on disk, but written before the prompt was queued
+        [name] = os.listdir(comfyui_output)
+        old = time.time() - 3600
+        os.utime(os.path.join(comfyui_output, name), (old, old))
+        [stale] = worker.get_output_videos(prompt_id, output_dir)
+        assert stale['transfer'] == "http", stale
+
+        # No submit time known for a prompt queued elsewhere
+        [unknown] = ComfyUIWorker(server.url, timeout=30).get_output_videos(prompt_id, output_dir)
+        assert unknown['transfer'] == "http", unknown
+    print("✅ stale or unknown local outputs downloaded, fresh ones linked")
+
+
+def test_execute_workflow_keeps_data():
+    """Results carry the bytes by default; only stream_to_disk leaves just the saved path"""
+    with tempfile.TemporaryDirectory() as comfyui_output, tempfile.TemporaryDirectory() as output_dir, \
+            FakeComfyUI(run_time=0.1, output_dir=comfyui_output) as server:
+        worker = ComfyUIWorker(server.url, timeout=30)
+        [video] = worker.execute_workflow(WORKFLOW, output_dir=output_dir)['videos']
+        with open(video['path'], 'rb') as f:
+            assert video['data'] == f.read(), video['path']
+
+        [streamed] = worker.execute_workflow(WORKFLOW, output_dir=output_dir, stream_to_disk=True)['videos']
+        assert 'data' not in streamed and os.path.getsize(streamed['path']) == streamed['size'], streamed
+    print("✅ execute_workflow returns output bytes unless streaming to disk")
+
+
+if __name__ == "__main__":
+    test_stale_local_output_downloaded()
+    test_execute_workflow_keeps_data()
@@ -4,19 +4,25 @@ ComfyUI Workflow Worker for WAN2.2 I2V
 Executes arbitrary JSON workflows via ComfyUI API
 """
 
-import json
+import asyncio
 import requests
-import time
-import base64
-import io
 import os
-from PIL import Image
+import time
+
+import http_client
+from comfyui_events import PromptWatcher
+from async_client import AsyncComfyUIClient
+from workflow_template import load_template
 
 
 class ComfyUIWorker:
     def __init__(self, server_url="http://localhost:8188", timeout=600):
         self.server_url = server_url
         self.timeout = timeout
+        # Completion events arrive on this client's websocket (or by polling)
+        self.watcher = PromptWatcher(server_url)
+        # prompt_id -> time.time() before it was queued; older local files are not its outputs
+        self._queued_at = {}
         
     def upload_image(self, image_path, filename=None):
         """Upload image to ComfyUI server"""
@@ -24,160 +30,128 @@ class ComfyUIWorker:
             filename = os.path.basename(image_path)
             
         with open(image_path, 'rb') as f:
-            files = {'image': (filename, f, 'image/png')}
-            response = requests.post(f"{self.server_url}/upload/image", files=files)
-            return response.json()
+            files = {'image': (filename, f.read(), 'image/png')}
+        response = http_client.post(f"{self.server_url}/upload/image", "upload", files=files, idempotent=True)
+        return response.json()
     
     def queue_workflow(self, workflow_json):
         """Queue a workflow for execution"""
-        response = requests.post(f"{self.server_url}/prompt", json={"prompt": workflow_json})
+        # Connect before queueing so the completion event can't be missed
+        self.watcher.connect()
+        payload = {"prompt": workflow_json, "client_id": self.watcher.client_id}
+        queued_at = time.time()
+        response = http_client.post(f"{self.server_url}/prompt", "prompt", json=payload)
         if response.status_code == 200:
-            return response.json()
+            result = response.json()
+            self._queued_at[result['prompt_id']] = queued_at
+            return result
         else:
             raise Exception(f"Failed to queue workflow: {response.status_code} - {response.text}")
     
     def get_history(self, prompt_id):
         """Get execution history for a prompt"""
-        response = requests.get(f"{self.server_url}/history/{prompt_id}")
+        response = http_client.get(f"{self.server_url}/history/{prompt_id}", "history")
         return response.json()
     
+    def get_object_info(self):
+        """ComfyUI's node classes and their inputs, or None if they can't be fetched"""
+        try:
+            response = http_client.get(f"{self.server_url}/object_info", "default")
+            response.raise_for_status()
+            return response.json()
+        except (requests.exceptions.RequestException, ValueError) as e:
+            print(f"Could not fetch node classes, skipping class checks: {e}")
+            return None
+    
     def wait_for_completion(self, prompt_id, timeout=None):
-        """Wait for workflow completion using polling"""
+        """Wait for workflow completion; websocket events with a polling fallback"""
         if timeout is None:
             timeout = self.timeout
             
-        return self._poll_for_completion(prompt_id, timeout)
-    
-    def _poll_for_completion(self, prompt_id, timeout):
-        """Fallback polling method"""
-        start_time = time.time()
-        
-        while time.time() - start_time < timeout:
-            try:
-                history = self.get_history(prompt_id)
-                if prompt_id in history:
-                    status = history[prompt_id].get('status', {})
-                    if status.get('completed', False):
-                        return True
-                    elif 'error' in status:
-                        raise Exception(f"Workflow execution failed: {status['error']}")
-                        
-            except requests.RequestException as e:
-                print(f"Error checking status: {e}")
-                
-            time.sleep(2)
-            
-        return False
+        return self.watcher.wait(prompt_id, timeout) is not None
     
-    def get_output_images(self, prompt_id):
-        """Get output images from completed workflow"""
+    def get_outputs(self, prompt_id, kind, output_dir=None, not_before=None):
+        """
+        Output files of one kind ('images', 'videos' or 'gifs') from a
+        completed workflow, fetched in parallel by AsyncComfyUIClient. With
+        output_dir they are saved there as <prompt_id>_<filename> (entries
+        carry 'path') rather than kept in memory ('data'). Files ComfyUI
+        wrote on this host since not_before are used in place; not_before
+        defaults to when this worker queued the prompt.
+        """
+        if not_before is None:
+            not_before = self._queued_at.get(prompt_id)
         history = self.get_history(prompt_id)
         
         if prompt_id not in history:
             return []
-            
-        outputs = history[prompt_id].get('outputs', {})
-        images = []
         
-        for node_id, output in outputs.items():
-            if 'images' in output:
-                for image_info in output['images']:
-                    filename = image_info['filename']
-                    subfolder = image_info.get('subfolder', '')
-                    
-                    # Download the image
-                    img_url = f"{self.server_url}/view"
-                    params = {'filename': filename}
-                    if subfolder:
-                        params['subfolder'] = subfolder
-                        
-                    response = requests.get(img_url, params=params)
-                    if response.status_code == 200:
-                        images.append({
-                            'filename': filename,
-                            'data': response.content,
-                            'node_id': node_id
-                        })
-                        
-        return images
-    
-    def get_output_videos(self, prompt_id):
+        return asyncio.run(self._download_outputs(history[prompt_id], kind, output_dir, f"{prompt_id}_", not_before))
+    
+    async def _download_outputs(self, entry, kind, output_dir, prefix, not_before):
+        # Only downloads, so no event socket
+        async with AsyncComfyUIClient(self.server_url, self.timeout, events=False) as client:
+            return await client.download_outputs(entry, output_dir, prefix, not_before, kinds=(kind,))
+    
+    def get_output_images(self, prompt_id, output_dir=None):
+        """Get output images from completed workflow"""
+        return self.get_outputs(prompt_id, 'images', output_dir)
+    
+    def get_output_videos(self, prompt_id, output_dir=None):
         """Get output videos from completed workflow"""
-        history = self.get_history(prompt_id)
-        
-        if prompt_id not in history:
-            return []
-            
-        outputs = history[prompt_id].get('outputs', {})
-        videos = []
-        
-        for node_id, output in outputs.items():
-            if 'videos' in output:
-                for video_info in output['videos']:
-                    filename = video_info['filename']
-                    subfolder = video_info.get('subfolder', '')
-                    
-                    # Download the video
-                    video_url = f"{self.server_url}/view"
-                    params = {'filename': filename}
-                    if subfolder:
-                        params['subfolder'] = subfolder
-                        
-                    response = requests.get(video_url, params=params)
-                    if response.status_code == 200:
-                        videos.append({
-                            'filename': filename,
-                            'data': response.content,
-                            'node_id': node_id
-                        })
-                        
-        return videos
-    
-    def execute_workflow(self, workflow_json, save_outputs=True, output_dir="./output"):
+        return self.get_outputs(prompt_id, 'videos', output_dir)
+    
+    def execute_workflow(self, workflow_json, save_outputs=True, output_dir="./output", stream_to_disk=False):
         """Execute a complete workflow and return results"""
-        print("Queuing workflow for execution...")
-        
-        # Queue the workflow
-        result = self.queue_workflow(workflow_json)
-        prompt_id = result['prompt_id']
-        print(f"Workflow queued with ID: {prompt_id}")
-        
-        # Wait for completion
-        print("Waiting for workflow completion...")
-        success = self.wait_for_completion(prompt_id)
-        
-        if not success:
-            raise Exception(f"Workflow execution timed out after {self.timeout} seconds")
-            
-        print("Workflow completed successfully!")
-        
-        # Get outputs
-        images = self.get_output_images(prompt_id)
-        videos = self.get_output_videos(prompt_id)
-        
-        results = {
-            'prompt_id': prompt_id,
-            'images': images,
-            'videos': videos
-        }
-        
-        # Save outputs if requested
-        if save_outputs and (images or videos):
-            os.makedirs(output_dir, exist_ok=True)
-            
-            for img in images:
-                img_path = os.path.join(output_dir, f"{prompt_id}_{img['filename']}")
-                with open(img_path, 'wb') as f:
-                    f.write(img['data'])
-                print(f"Saved image: {img_path}")
+        result = self.execute_workflows([workflow_json], save_outputs, output_dir, stream_to_disk=stream_to_disk)[0]
+        if isinstance(result, Exception):
+            raise result
+        return result
+    
+    def execute_workflows(self, workflows, save_outputs=True, output_dir="./output", max_in_flight=None,
+                          stream_to_disk=False):
+        """
+        Execute many workflows with several queued in ComfyUI at once.
+        
+        Sync wrapper around AsyncComfyUIClient.run_many for callers without
+        an event loop. Returns one result per workflow, in order; a failed
+        workflow's entry is its exception. Output entries carry their bytes
+        in 'data', plus 'path' once saved. With stream_to_disk (and
+        save_outputs) files are streamed or linked straight into output_dir
+        and entries carry only 'path', so large videos never sit in memory.
+        """
+        print(f"Queuing {len(workflows)} workflow(s) for execution...")
+        stream_dir = output_dir if save_outputs and stream_to_disk else None
+        results = asyncio.run(self._run_many(workflows, max_in_flight, stream_dir))
+        
+        for result in results:
+            if isinstance(result, Exception):
+                print(f"Workflow failed: {result}")
+            elif save_outputs:
+                self.save_outputs(result, output_dir)
                 
-            for video in videos:
-                video_path = os.path.join(output_dir, f"{prompt_id}_{video['filename']}")
-                with open(video_path, 'wb') as f:
-                    f.write(video['data'])
-                print(f"Saved video: {video_path}")
-        
         return results
+    
+    async def _run_many(self, workflows, max_in_flight, output_dir=None):
+        async with AsyncComfyUIClient(self.server_url, self.timeout, max_in_flight=max_in_flight) as client:
+            return await client.run_many(workflows, output_dir=output_dir)
+    
+    def save_outputs(self, result, output_dir):
+        """Write a result's images and videos to output_dir; files already saved are only reported"""
+        prompt_id = result['prompt_id']
+        if not (result['images'] or result['videos']):
+            return
+        os.makedirs(output_dir, exist_ok=True)
+        
+        for label, files in (("image", result['images']), ("video", result['videos'])):
+            for output in files:
+                path = output.get('path')
+                if path is None:
+                    path = os.path.join(output_dir, f"{prompt_id}_{output['filename']}")
+                    with open(path, 'wb') as f:
+                        f.write(output['data'])
+                    output['path'] = path
+                print(f"Saved {label}: {path} ({output.get('transfer', 'http')})")
 
 
 def main():
@@ -185,7 +159,7 @@ def main():
     import argparse
     
     parser = argparse.ArgumentParser(description='ComfyUI Workflow Worker')
-    parser.add_argument('-w', '--workflow', required=True, help='Path to workflow JSON file')
+    parser.add_argument('-w', '--workflow', required=True, nargs='+', help='Path to workflow JSON file(s); several run as a batch')
     parser.add_argument('-s', '--start-image', help='Path to start image (for FLF workflows)')
     parser.add_argument('-e', '--end-image', help='Path to end image (for FLF workflows)')
     parser.add_argument('-p', '--positive-prompt', help='Positive prompt')
@@ -195,52 +169,78 @@ def main():
     parser.add_argument('--length', type=int, default=81, help='Video length in frames')
     parser.add_argument('--server', default='http://localhost:8188', help='ComfyUI server URL')
     parser.add_argument('-o', '--output', default='./output', help='Output directory')
+    parser.add_argument('--max-in-flight', type=int, help='Workflows queued in ComfyUI at once (default: COMFYUI_MAX_IN_FLIGHT)')
     
     args = parser.parse_args()
     
+    # Load and check every workflow once, before anything is uploaded or queued;
+    # slots are found from node classes and links rather than fixed node ids
+    values = {}
+    if args.positive_prompt:
+        values['positive_prompt'] = args.positive_prompt
+    if args.negative_prompt:
+        values['negative_prompt'] = args.negative_prompt
+    wanted = list(values) + [slot for slot, image in (('start_image', args.start_image),
+                                                      ('end_image', args.end_image)) if image]
+    try:
+        templates = [load_template(path) for path in args.workflow]
+        for path, template in zip(args.workflow, templates):
+            missing = [slot for slot in wanted if slot not in template.slots]
+            if missing:
+                raise ValueError(f"{path} has no {', '.join(missing)} slot (found: {', '.join(template.slots)})")
+    except (OSError, ValueError) as e:
+        print(f"Error loading workflow: {e}")
+        return 1
+    
     # Initialize worker
     worker = ComfyUIWorker(args.server)
     
-    # Load workflow
-    with open(args.workflow, 'r') as f:
-        workflow = json.load(f)
+    # Node classes can only be checked against the running server
+    object_info = worker.get_object_info()
+    if object_info is not None:
+        try:
+            for template in templates:
+                template.check_classes(object_info)
+        except ValueError as e:
+            print(f"Error loading workflow: {e}")
+            return 1
     
     # Upload images if provided
     if args.start_image:
         print(f"Uploading start image: {args.start_image}")
-        worker.upload_image(args.start_image, "start.png")
+        values['start_image'] = worker.upload_image(args.start_image, "start.png")['name']
         
     if args.end_image:
         print(f"Uploading end image: {args.end_image}")
-        worker.upload_image(args.end_image, "end.png")
+        values['end_image'] = worker.upload_image(args.end_image, "end.png")['name']
     
-    # Update workflow parameters if provided
-    if args.positive_prompt and '6' in workflow:
-        workflow['6']['inputs']['text'] = args.positive_prompt
-        
-    if args.negative_prompt and '7' in workflow:
-        workflow['7']['inputs']['text'] = args.negative_prompt
-        
-    if '67' in workflow:
-        workflow['67']['inputs']['width'] = args.width
-        workflow['67']['inputs']['height'] = args.height
-        workflow['67']['inputs']['length'] = args.length
+    # Bind parameters; size applies wherever the workflow has a size slot
+    sizes = {'width': args.width, 'height': args.height, 'length': args.length}
+    workflows = [template.render(values, **{slot: value for slot, value in sizes.items() if slot in template.slots})
+                 for template in templates]
     
-    # Execute workflow
+    # Execute workflows, keeping several queued in ComfyUI
     try:
-        results = worker.execute_workflow(workflow, output_dir=args.output)
-        print(f"Execution completed! Generated {len(results['images'])} images and {len(results['videos'])} videos.")
+        all_results = worker.execute_workflows(workflows, output_dir=args.output, max_in_flight=args.max_in_flight,
+                                               stream_to_disk=True)
+    except Exception as e:
+        print(f"Error executing workflow: {e}")
+        return 1
+    
+    failed = 0
+    for path, results in zip(args.workflow, all_results):
+        if isinstance(results, Exception):
+            print(f"Error executing workflow {path}: {results}")
+            failed += 1
+            continue
+        print(f"Execution completed ({path})! Generated {len(results['images'])} images and {len(results['videos'])} videos.")
         
         if results['videos']:
             print("Generated videos:")
             for video in results['videos']:
                 print(f"  - {video['filename']}")
-                
-    except Exception as e:
-        print(f"Error executing workflow: {e}")
-        return 1
     
-    return 0
+    return 1 if failed else 0
 
 
 if __name__ == "__main__":
@@ -0,0 +1,69 @@
+"""
+Concurrent preparation of the start and end frames for FLF jobs.
+
+Fetching, decoding, validating and uploading the two frames are independent,
+so both frames are prepared on their own thread. The whole step shares one
+timeout budget (ASSET_TIMEOUT seconds), so asset prep takes about as long as
+the slowest frame instead of the sum of every step.
+"""
+import io
+import os
+import time
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
+
+from PIL import Image
+
+ASSET_TIMEOUT = float(os.getenv("ASSET_TIMEOUT", "60"))
+# Smallest frame side we accept; anything smaller is almost certainly a bad input
+MIN_FRAME_SIDE = 16
+
+
+def remaining(deadline, minimum=1.0):
+    """Seconds left until deadline (time.monotonic()), for per-request timeouts."""
+    left = deadline - time.monotonic()
+    if left <= 0:
+        raise TimeoutError("Input frame preparation ran out of time")
+    return max(left, minimum)
+
+
+def validate_image(source, label="image"):
+    """
+    Fully decode an image (path, bytes or memoryview) and return its (width, height).
+
+    Raises ValueError for data PIL cannot decode or frames that are too small.
+    """
+    try:
+        with Image.open(io.BytesIO(source) if isinstance(source, (bytes, bytearray, memoryview)) else source) as image:
+            image.load()
+            size = image.size
+    except (OSError, SyntaxError) as e:
+        raise ValueError(f"Invalid {label}: {e}") from e
+    if min(size) < MIN_FRAME_SIDE:
+        raise ValueError(f"Invalid {label}: {size[0]}x{size[1]} is too small")
+    return size
+
+
+def prepare_frames(prepare, frames, timeout=None):
+    """
+    Call prepare(name, value, deadline) for every (name, value) pair in
+    parallel and return (results in input order, elapsed seconds).
+
+    The first failure is raised as soon as it happens. If the budget runs
+    out first, TimeoutError is raised and unfinished work is abandoned.
+    """
+    timeout = ASSET_TIMEOUT if timeout is None else timeout
+    started = time.monotonic()
+    deadline = started + timeout
+    pool = ThreadPoolExecutor(max_workers=len(frames), thread_name_prefix="frame-prep")
+    try:
+        futures = [pool.submit(prepare, name, value, deadline) for name, value in frames]
+        done, pending = wait(futures, timeout=timeout, return_when=FIRST_EXCEPTION)
+        for future in futures:
+            if future in done and future.exception() is not None:
+                raise future.exception()
+        if pending:
+            names = [name for (name, _), future in zip(frames, futures) if future in pending]
+            raise TimeoutError(f"Preparing {', '.join(names)} frame exceeded {timeout:.0f}s")
+        return [future.result() for future in futures], round(time.monotonic() - started, 2)
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
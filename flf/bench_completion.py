@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Completion latency of websocket events against /history polling.
+
+Queues prompts on the fake ComfyUI server (fake_comfyui.py) with random run
+times and measures, per job, the time from ComfyUI storing the history
+entry to the worker seeing it, plus the /history requests it took. Polling
+is measured at 0.25 s (rp_handler's old loop) and 2 s (ComfyUIWorker's old
+loop).
+
+    python bench_completion.py --jobs 20
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import http_client
+import comfyui_events
+from comfyui_events import PromptWatcher
+from fake_comfyui import FakeComfyUI
+
+WORKFLOW = {"1": {"class_type": "VHS_VideoCombine", "inputs": {}}}
+
+
+def run_jobs(server, jobs, min_run, max_run, **watcher_options):
+    """(latencies in ms, history requests per job)"""
+    latencies, requests_per_job = [], []
+    rng = random.Random(0)
+    for _ in range(jobs):
+        server.run_time = rng.uniform(min_run, max_run)
+        before = server.history_requests
+        with PromptWatcher(server.url, **watcher_options) as watcher:
+            response = http_client.post(f"{server.url}/prompt", "prompt",
+                                        json={"prompt": WORKFLOW, "client_id": watcher.client_id})
+            prompt_id = response.json()["prompt_id"]
+            entry = watcher.wait(prompt_id, timeout=max_run + 30)
+            seen = time.monotonic()
+        assert entry is not None, f"{prompt_id} timed out"
+        latencies.append((seen - server.completed_at[prompt_id]) * 1000)
+        requests_per_job.append(server.history_requests - before)
+    return latencies, requests_per_job
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare completion latency of websocket events and polling")
+    parser.add_argument("--jobs", type=int, default=20)
+    parser.add_argument("--min-run", type=float, default=1.0, help="Shortest fake prompt run time (s)")
+    parser.add_argument("--max-run", type=float, default=3.0, help="Longest fake prompt run time (s)")
+    args = parser.parse_args()
+
+    modes = [("poll 2s", {"use_websocket": False, "poll_interval": 2.0}),
+             ("poll 0.25s", {"use_websocket": False, "poll_interval": 0.25})]
+    if comfyui_events.websocket is not None:
+        modes.append(("websocket", {"use_websocket": True}))
+    else:
+        print("websocket-client not installed, measuring polling only")
+
+    print(f"{args.jobs} jobs per mode, run time {args.min_run}-{args.max_run}s")
+    with FakeComfyUI() as server:
+        for name, options in modes:
+            latencies, requests_per_job = run_jobs(server, args.jobs, args.min_run, args.max_run, **options)
+            latencies.sort()
+            print(f"{name:>11}: latency mean {statistics.mean(latencies):7.1f} ms, "
+                  f"p50 {latencies[len(latencies) // 2]:7.1f} ms, max {latencies[-1]:7.1f} ms, "
+                  f"{statistics.mean(requests_per_job):5.1f} /history requests per job")
+
+
+if __name__ == "__main__":
+    main()
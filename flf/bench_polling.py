@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark of ComfyUI polling overhead: a fresh requests.get() per poll
+(new TCP connection every time) against the shared pooled session in
+http_client (kept-alive connection).
+
+By default it polls a local stub that answers like /history/<prompt_id>;
+pass --url to poll a running ComfyUI instead, e.g.
+    python bench_polling.py --url http://127.0.0.1:8188/system_stats
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import http_client
+
+
+class HistoryStub(BaseHTTPRequestHandler):
+    # HTTP/1.1 so the client may keep the connection open; send headers and
+    # body in one segment so delayed ACKs don't stall kept-alive connections
+    protocol_version = "HTTP/1.1"
+    wbufsize = -1
+    disable_nagle_algorithm = True
+    body = json.dumps({"bench": {"status": {"completed": False}, "outputs": {}}}).encode()
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(self.body)))
+        self.end_headers()
+        self.wfile.write(self.body)
+
+    def log_message(self, *args):
+        pass
+
+
+def measure(poll, count):
+    timings = []
+    for _ in range(count):
+        start = time.perf_counter()
+        poll().raise_for_status()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare per-poll cost with and without a pooled session")
+    parser.add_argument("--url", help="Endpoint to poll (default: local /history stub)")
+    parser.add_argument("--polls", type=int, default=500)
+    args = parser.parse_args()
+
+    server = None
+    url = args.url
+    if not url:
+        server = ThreadingHTTPServer(("127.0.0.1", 0), HistoryStub)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = f"http://127.0.0.1:{server.server_port}/history/bench"
+
+    print(f"{args.polls} polls of {url}")
+    try:
+        for name, poll in (
+            ("fresh connection", lambda: requests.get(url, timeout=10)),
+            ("pooled session", lambda: http_client.get(url, "history")),
+        ):
+            # Warm-up so the pooled run starts with an open connection, like a polling loop would
+            poll()
+            timings = measure(poll, args.polls)
+            timings.sort()
+            print(f"{name:>17}: mean {statistics.mean(timings):.3f} ms, "
+                  f"p50 {timings[len(timings) // 2]:.3f} ms, p99 {timings[int(len(timings) * 0.99) - 1]:.3f} ms")
+    finally:
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+"""
+Wait for ComfyUI prompts over its websocket instead of polling /history.
+
+A PromptWatcher opens ComfyUI's /ws?clientId=<id> socket before the prompt
+is queued; the prompt is then queued with the same client_id, so ComfyUI
+sends that socket the prompt's events. The watcher returns as soon as
+ComfyUI reports the prompt done ("executing" with node None, sent after
+the history entry is stored) and reads /history once for the outputs. An
+"execution_error" or "execution_interrupted" event fails the job at once.
+
+The socket is optional: without the websocket-client package, with
+COMFYUI_WEBSOCKET=false, or when the socket cannot be opened or drops
+mid-job, the watcher polls /history every COMFYUI_POLL_INTERVAL seconds
+instead. While the socket is quiet, /history is still checked every
+WS_HISTORY_CHECK seconds in case an event was missed.
+"""
+import json
+import os
+import time
+import uuid
+from urllib.parse import urlparse
+
+import requests
+
+import http_client
+
+try:
+    import websocket
+except ImportError:
+    websocket = None
+
+COMFYUI_WEBSOCKET = os.getenv("COMFYUI_WEBSOCKET", "true").lower() == "true"
+COMFYUI_POLL_INTERVAL = float(os.getenv("COMFYUI_POLL_INTERVAL", "0.25"))
+WS_CONNECT_TIMEOUT = 5
+# Longest blocking read on the socket, so the deadline is checked regularly
+WS_RECV_TIMEOUT = 1.0
+# History check while no event for this prompt arrives
+WS_HISTORY_CHECK = 10.0
+
+
+def websocket_url(server_url, client_id):
+    """ws:// (or wss://) URL of ComfyUI's event socket for client_id."""
+    parsed = urlparse(server_url)
+    scheme = "wss" if parsed.scheme == "https" else "ws"
+    return f"{scheme}://{parsed.netloc}{parsed.path.rstrip('/')}/ws?clientId={client_id}"
+
+
+def _error_message(data):
+    node = data.get("node_type") or data.get("node_id")
+    message = data.get("exception_message") or data.get("exception_type") or "unknown error"
+    return f"{message} (node {node})" if node else message
+
+
+def finished_entry(entry):
+    """
+    The history entry once its prompt has finished, None while it has not.
+    Raises RuntimeError when ComfyUI recorded the prompt as failed.
+    """
+    if not entry:
+        return None
+    status = entry.get("status") or {}
+    if status.get("status_str") == "error":
+        for event, data in status.get("messages", []):
+            if event == "execution_error":
+                raise RuntimeError(f"Workflow execution failed: {_error_message(data)}")
+        raise RuntimeError("Workflow execution failed")
+    if status.get("completed") or entry.get("outputs"):
+        return entry
+    return None
+
+
+class PromptWatcher:
+    """
+    Completion tracking for prompts queued under one client_id.
+
+    Use as a context manager around queueing and waiting:
+
+        with PromptWatcher(url) as watcher:
+            prompt_id = queue(workflow, client_id=watcher.client_id)
+            entry = watcher.wait(prompt_id, timeout)
+
+    `mode` is "websocket" or "polling" and `history_requests` counts the
+    /history calls made, for logs and benchmarks. on_event(type, data) is
+    called for every websocket event of the prompt being waited on, e.g.
+    "executing" and "progress" for progress reporting.
+    """
+
+    def __init__(self, server_url, client_id=None, use_websocket=None, poll_interval=None, on_event=None):
+        self.server_url = server_url.rstrip('/')
+        self.client_id = client_id or uuid.uuid4().hex
+        self.use_websocket = COMFYUI_WEBSOCKET if use_websocket is None else use_websocket
+        self.poll_interval = COMFYUI_POLL_INTERVAL if poll_interval is None else poll_interval
+        self.on_event = on_event
+        self.ws = None
+        self.mode = "polling"
+        self.history_requests = 0
+
+    def __enter__(self):
+        self.connect()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def connect(self):
+        """Open the event socket if possible; returns whether it is open."""
+        if self.ws is not None or not self.use_websocket or websocket is None:
+            return self.ws is not None
+        try:
+            self.ws = websocket.create_connection(websocket_url(self.server_url, self.client_id),
+                                                  timeout=WS_CONNECT_TIMEOUT)
+            self.ws.settimeout(WS_RECV_TIMEOUT)
+        except (OSError, websocket.WebSocketException) as e:
+            print(f"ComfyUI websocket unavailable ({e}), polling /history instead")
+            self.ws = None
+        return self.ws is not None
+
+    def close(self):
+        if self.ws is not None:
+            try:
+                self.ws.close()
+            except (OSError, websocket.WebSocketException):
+                pass
+            self.ws = None
+
+    def get_history(self, prompt_id):
+        """History entry of prompt_id, or None if ComfyUI has none yet."""
+        self.history_requests += 1
+        response = http_client.get(f"{self.server_url}/history/{prompt_id}", "history", retries=0)
+        response.raise_for_status()
+        return response.json().get(prompt_id)
+
+    def wait(self, prompt_id, timeout):
+        """
+        History entry of prompt_id once it has finished, or None after
+        timeout seconds. Raises RuntimeError when execution failed.
+        """
+        deadline = time.monotonic() + timeout
+        if self.ws is not None:
+            try:
+                self.mode = "websocket"
+                return self._wait_events(prompt_id, deadline)
+            except (OSError, websocket.WebSocketException) as e:
+                print(f"ComfyUI websocket dropped ({e or type(e).__name__}), polling /history instead")
+                self.close()
+        self.mode = "polling"
+        return self._poll(prompt_id, deadline)
+
+    def _wait_events(self, prompt_id, deadline):
+        next_check = time.monotonic() + WS_HISTORY_CHECK
+        while time.monotonic() < deadline:
+            if time.monotonic() >= next_check:
+                entry = self._check(prompt_id)
+                if entry is not None:
+                    return entry
+                next_check = time.monotonic() + WS_HISTORY_CHECK
+            try:
+                message = self.ws.recv()
+            except websocket.WebSocketTimeoutException:
+                continue
+            if message == "":
+                # recv() answers a close frame with an empty string
+                raise websocket.WebSocketConnectionClosedException("closed by server")
+            if not isinstance(message, str):
+                # Binary frames are latent previews
+                continue
+            try:
+                event = json.loads(message)
+                data = event.get("data") or {}
+            except (ValueError, AttributeError):
+                continue
+            if data.get("prompt_id") != prompt_id:
+                continue
+            next_check = time.monotonic() + WS_HISTORY_CHECK
+            if self.on_event is not None:
+                self.on_event(event.get("type"), data)
+            if event.get("type") == "execution_error":
+                raise RuntimeError(f"Workflow execution failed: {_error_message(data)}")
+            if event.get("type") == "execution_interrupted":
+                raise RuntimeError("Workflow execution was interrupted")
+            if event.get("type") == "executing" and data.get("node") is None:
+                entry = self._check(prompt_id)
+                # The entry is stored before this event, but poll if it is not there
+                return entry if entry is not None else self._poll(prompt_id, deadline)
+        return None
+
+    def _check(self, prompt_id):
+        try:
+            return finished_entry(self.get_history(prompt_id))
+        except requests.RequestException as e:
+            print(f"Error checking status: {e}")
+            return None
+
+    def _poll(self, prompt_id, deadline):
+        while True:
+            entry = self._check(prompt_id)
+            if entry is not None:
+                return entry
+            if time.monotonic() + self.poll_interval > deadline:
+                return None
+            time.sleep(self.poll_interval)
@@ -0,0 +1,186 @@
+"""
+Background supervisor for the ComfyUI server a worker talks to.
+
+Handlers used to probe /system_stats at the start of every job, and some
+spawned a new ComfyUI whenever one probe failed, which could leave two
+servers fighting over the GPU. A ComfyUISupervisor starts ComfyUI once, or
+adopts one that is already listening, and a daemon thread probes /queue
+every COMFYUI_MONITOR_INTERVAL seconds, caching readiness and queue depth.
+Jobs call wait_ready(), which returns at once while the cached state is
+ready and only blocks while ComfyUI is starting or unreachable.
+
+ComfyUI is restarted only when the process the supervisor started has
+exited, with exponential backoff between attempts (COMFYUI_RESTART_BACKOFF
+doubling up to COMFYUI_RESTART_MAX_BACKOFF, reset once it is ready again).
+A server it did not start, or one that is alive but not answering, is only
+reported as not ready.
+
+    supervisor = get_supervisor(COMFYUI_URL, command=["python", "/comfyui/main.py", "--listen"])
+    if not supervisor.wait_ready():
+        raise RuntimeError("ComfyUI server is not responding")
+"""
+import os
+import shlex
+import subprocess
+import threading
+import time
+
+import requests
+
+import http_client
+
+COMFYUI_URL = os.getenv("COMFYUI_URL", "http://127.0.0.1:8188")
+# Command that starts ComfyUI when nothing is listening; empty means monitor only
+COMFYUI_COMMAND = os.getenv("COMFYUI_COMMAND", "")
+# Seconds between probes while ComfyUI is ready
+COMFYUI_MONITOR_INTERVAL = float(os.getenv("COMFYUI_MONITOR_INTERVAL", "2.0"))
+# Longest a job waits for ComfyUI to become ready, in seconds
+COMFYUI_READY_TIMEOUT = float(os.getenv("COMFYUI_READY_TIMEOUT", "120"))
+COMFYUI_RESTART_BACKOFF = float(os.getenv("COMFYUI_RESTART_BACKOFF", "2.0"))
+COMFYUI_RESTART_MAX_BACKOFF = float(os.getenv("COMFYUI_RESTART_MAX_BACKOFF", "60.0"))
+# Seconds between probes while ComfyUI is starting or unreachable
+STARTUP_PROBE_INTERVAL = 0.5
+
+
+class ComfyUISupervisor:
+    """
+    Starts or adopts ComfyUI at `url` and tracks it from a daemon thread.
+
+    command is the argv that starts ComfyUI (default COMFYUI_COMMAND); with
+    none the supervisor only monitors a server started elsewhere.
+    """
+
+    def __init__(self, url=None, command=None, interval=None, backoff=None, max_backoff=None):
+        self.url = (url or COMFYUI_URL).rstrip('/')
+        self.command = list(shlex.split(COMFYUI_COMMAND) if command is None else command) or None
+        self.interval = COMFYUI_MONITOR_INTERVAL if interval is None else interval
+        self.backoff = COMFYUI_RESTART_BACKOFF if backoff is None else backoff
+        self.max_backoff = COMFYUI_RESTART_MAX_BACKOFF if max_backoff is None else max_backoff
+        self.process = None
+        self.thread = None
+        self.lock = threading.Lock()
+        self.ready = threading.Event()
+        self.wake = threading.Event()
+        self.stopping = threading.Event()
+        self.queue_running = 0
+        self.queue_pending = 0
+        self.last_error = None
+        self.restarts = 0
+        self.restart_delay = self.backoff
+        self.restart_at = None
+
+    def start(self):
+        """Start or adopt ComfyUI and the monitor thread; later calls do nothing."""
+        with self.lock:
+            if self.thread is not None:
+                return self
+            if not self._probe() and self.command:
+                self._launch()
+            self.thread = threading.Thread(target=self._monitor, name="comfyui-supervisor", daemon=True)
+            self.thread.start()
+        return self
+
+    def stop(self, terminate=False):
+        """Stop monitoring; with terminate, also stop the ComfyUI process it started."""
+        self.stopping.set()
+        self.wake.set()
+        if self.thread is not None:
+            self.thread.join(timeout=5)
+        if terminate and self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+
+    def wait_ready(self, timeout=None):
+        """True once ComfyUI is ready, or False after timeout seconds."""
+        if self.thread is None:
+            self.start()
+        if self.ready.is_set():
+            return True
+        # Probe now rather than at the next interval
+        self.wake.set()
+        return self.ready.wait(COMFYUI_READY_TIMEOUT if timeout is None else timeout)
+
+    def state(self):
+        """Cached readiness and queue depth."""
+        return {
+            "ready": self.ready.is_set(),
+            "queue_running": self.queue_running,
+            "queue_pending": self.queue_pending,
+            "restarts": self.restarts,
+            "pid": self.process.pid if self.process is not None else None,
+            "last_error": self.last_error
+        }
+
+    def _launch(self):
+        print(f"Starting ComfyUI: {' '.join(self.command)}")
+        self.process = subprocess.Popen(self.command)
+
+    def _probe(self):
+        """Probe /queue once and cache the result; returns readiness."""
+        try:
+            response = http_client.get(f"{self.url}/queue", "system_stats", retries=0)
+            response.raise_for_status()
+            queue = response.json()
+        except (requests.exceptions.RequestException, ValueError) as e:
+            if self.ready.is_set():
+                print(f"ComfyUI server stopped answering: {e}")
+            self.last_error = str(e)
+            self.ready.clear()
+            return False
+        self.queue_running = len(queue.get("queue_running", []))
+        self.queue_pending = len(queue.get("queue_pending", []))
+        if not self.ready.is_set():
+            print(f"ComfyUI server is ready at {self.url}")
+        self.last_error = None
+        self.restart_delay = self.backoff
+        self.ready.set()
+        return True
+
+    def _check_process(self):
+        """Restart the ComfyUI process once it has exited, after a backoff delay."""
+        if self.process is None or self.process.poll() is None:
+            return
+        now = time.monotonic()
+        if self.restart_at is None:
+            print(f"ComfyUI exited with code {self.process.returncode}, restarting in {self.restart_delay:.1f}s")
+            self.ready.clear()
+            self.restart_at = now + self.restart_delay
+        if now < self.restart_at:
+            return
+        self.restart_at = None
+        # Something else may have started a server on the port meanwhile
+        if self._probe():
+            print("ComfyUI is answering without our process, monitoring it instead")
+            self.process = None
+            return
+        self.restarts += 1
+        self.restart_delay = min(self.max_backoff, self.restart_delay * 2)
+        self._launch()
+
+    def _monitor(self):
+        while not self.stopping.is_set():
+            try:
+                self._check_process()
+                if self.process is None or self.process.poll() is None:
+                    self._probe()
+            except Exception as e:
+                print(f"Warning: ComfyUI monitor error: {e}")
+            interval = self.interval if self.ready.is_set() else min(self.interval, STARTUP_PROBE_INTERVAL)
+            self.wake.wait(interval)
+            self.wake.clear()
+
+
+_supervisor = None
+_supervisor_lock = threading.Lock()
+
+
+def get_supervisor(url=None, command=None):
+    """The process-wide supervisor, created and started on first use."""
+    global _supervisor
+    with _supervisor_lock:
+        if _supervisor is None:
+            _supervisor = ComfyUISupervisor(url, command).start()
+        return _supervisor
@@ -0,0 +1,372 @@
+#!/usr/bin/env python3
+"""
+Stand-in ComfyUI server for tests and benchmarks, with no GPU or models.
+
+It speaks the parts of the API the workers use: POST /prompt, POST
+/upload/image, GET /history/<prompt_id>, GET /queue, GET /system_stats and
+the /ws?clientId= event socket (a minimal RFC 6455 server), plus /view,
+which returns `view_size` filler bytes for any output file and 404 for
+input files that were never uploaded (HEAD too). Like ComfyUI, prompts run one at a
+time in queue order on a background thread; each "runs" for `run_time`
+seconds and emits ComfyUI's event sequence to the socket of its
+client_id: execution_start, executing per node, progress (once per step
+for KSampler/KSamplerAdvanced), executed, then the history entry is
+stored and "executing" with node None is sent.
+
+Knobs on the server object:
+    run_time        seconds each prompt takes
+    fail            report an execution_error instead of outputs
+    websocket       False answers /ws with 404, like a proxy without upgrades
+    drop_websocket  close every socket once a prompt starts running
+    view_size       bytes returned by /view
+    output_dir      write each output file there (view_size bytes) and report
+                    it as --output-directory in /system_stats, like a
+                    ComfyUI on the same host
+
+Usage:
+    with FakeComfyUI(run_time=0.5) as server:
+        ... server.url ...
+"""
+import base64
+import hashlib
+import json
+import os
+import queue
+import re
+import struct
+import threading
+import time
+import uuid
+from socket import SHUT_RDWR
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+_WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+
+def _frame(opcode, payload):
+    """Unmasked server-to-client websocket frame."""
+    header = bytes([0x80 | opcode])
+    if len(payload) < 126:
+        header += bytes([len(payload)])
+    elif len(payload) < 2**16:
+        header += bytes([126]) + struct.pack(">H", len(payload))
+    else:
+        header += bytes([127]) + struct.pack(">Q", len(payload))
+    return header + payload
+
+
+def _sampler_steps(node):
+    """Steps a KSampler/KSamplerAdvanced node reports progress for; 1 for other nodes."""
+    inputs = node.get("inputs", {})
+    if node.get("class_type") == "KSamplerAdvanced":
+        return max(1, min(inputs.get("end_at_step", 10000), inputs.get("steps", 1)) - inputs.get("start_at_step", 0))
+    if node.get("class_type") == "KSampler":
+        return max(1, inputs.get("steps", 1))
+    return 1
+
+
+class _Socket:
+    def __init__(self, connection):
+        self.connection = connection
+        self.lock = threading.Lock()
+        self.closed = False
+
+    def send_json(self, message):
+        self.send(0x1, json.dumps(message).encode())
+
+    def send(self, opcode, payload):
+        with self.lock:
+            if not self.closed:
+                try:
+                    self.connection.sendall(_frame(opcode, payload))
+                except OSError:
+                    self.closed = True
+
+    def close(self):
+        with self.lock:
+            if not self.closed:
+                self.closed = True
+                try:
+                    self.connection.sendall(_frame(0x8, struct.pack(">H", 1000)))
+                except OSError:
+                    pass
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def _json(self, body, status=200):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+        self.wfile.flush()
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == "/ws":
+            return self._websocket(parse_qs(url.query).get("clientId", [""])[0])
+        if url.path.startswith("/history/"):
+            prompt_id = url.path[len("/history/"):]
+            with self.server.lock:
+                self.server.history_requests += 1
+                entry = self.server.history.get(prompt_id)
+            return self._json({prompt_id: entry} if entry else {})
+        if url.path == "/view":
+            if not self._view_exists(url):
+                return self._json({"error": "not found"}, 404)
+            data = self.server.read_output(parse_qs(url.query).get("filename", [""])[0])
+            self.send_response(200)
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+            return self.wfile.flush()
+        if url.path == "/queue":
+            with self.server.lock:
+                running = [[0, self.server.running]] if self.server.running else []
+            pending = [[0, item[0]] for item in list(self.server.queue.queue) if item]
+            return self._json({"queue_running": running, "queue_pending": pending})
+        if url.path == "/system_stats":
+            argv = ["main.py"] + (["--output-directory", self.server.output_dir] if self.server.output_dir else [])
+            return self._json({"system": {"comfyui_version": "fake", "argv": argv}, "devices": []})
+        self._json({"error": "not found"}, 404)
+
+    def do_HEAD(self):
+        url = urlparse(self.path)
+        exists = url.path == "/view" and self._view_exists(url)
+        self.send_response(200 if exists else 404)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+        self.wfile.flush()
+
+    def _view_exists(self, url):
+        query = parse_qs(url.query)
+        if query.get("type", ["output"])[0] != "input":
+            return True
+        with self.server.lock:
+            return query.get("filename", [""])[0] in self.server.inputs
+
+    def _upload(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        match = re.search(rb'name="image"; filename="([^"]+)"', body)
+        if not match:
+            return self._json({"error": "no image"}, 400)
+        name = match.group(1).decode()
+        with self.server.lock:
+            self.server.inputs[name] = len(body)
+            self.server.upload_bytes += len(body)
+        self._json({"name": name, "subfolder": "", "type": "input"})
+
+    def do_POST(self):
+        if urlparse(self.path).path == "/upload/image":
+            return self._upload()
+        if urlparse(self.path).path != "/prompt":
+            return self._json({"error": "not found"}, 404)
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        prompt = body.get("prompt")
+        if not isinstance(prompt, dict) or not prompt:
+            return self._json({"error": {"type": "prompt_no_outputs", "message": "Prompt has no outputs"}}, 400)
+        prompt_id = str(uuid.uuid4())
+        with self.server.lock:
+            number = self.server.queued
+            self.server.queued += 1
+        self.server.queue.put((prompt_id, prompt, body.get("client_id")))
+        self._json({"prompt_id": prompt_id, "number": number, "node_errors": {}})
+
+    def _websocket(self, client_id):
+        key = self.headers.get("Sec-WebSocket-Key")
+        if not self.server.websocket or not key or self.headers.get("Upgrade", "").lower() != "websocket":
+            return self._json({"error": "websocket not available"}, 404)
+        accept = base64.b64encode(hashlib.sha1((key + _WS_GUID).encode()).digest()).decode()
+        self.send_response(101, "Switching Protocols")
+        self.send_header("Upgrade", "websocket")
+        self.send_header("Connection", "Upgrade")
+        self.send_header("Sec-WebSocket-Accept", accept)
+        self.end_headers()
+        self.wfile.flush()
+        self.close_connection = True
+
+        socket = _Socket(self.connection)
+        with self.server.lock:
+            self.server.sockets.setdefault(client_id, []).append(socket)
+        socket.send_json({"type": "status", "data": {"status": {"exec_info": {"queue_remaining": 0}},
+                                                     "sid": client_id}})
+        try:
+            self._read_frames(socket)
+        except OSError:
+            pass
+        finally:
+            with self.server.lock:
+                self.server.sockets[client_id].remove(socket)
+            socket.close()
+
+    def _read_frames(self, socket):
+        """Answer pings and close frames until the client goes away."""
+        while not socket.closed:
+            header = self.rfile.read(2)
+            if len(header) < 2:
+                return
+            opcode, length = header[0] & 0x0F, header[1] & 0x7F
+            if length == 126:
+                length = struct.unpack(">H", self.rfile.read(2))[0]
+            elif length == 127:
+                length = struct.unpack(">Q", self.rfile.read(8))[0]
+            mask = self.rfile.read(4) if header[1] & 0x80 else b"\0\0\0\0"
+            payload = bytes(b ^ mask[i % 4] for i, b in enumerate(self.rfile.read(length)))
+            if opcode == 0x8:
+                return
+            if opcode == 0x9:
+                socket.send(0xA, payload)
+
+
+class FakeComfyUI(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, run_time=0.5, fail=False, websocket=True, drop_websocket=False, view_size=256 * 1024, port=0,
+                 output_dir=None):
+        super().__init__(("127.0.0.1", port), _Handler)
+        self.run_time = run_time
+        self.fail = fail
+        self.websocket = websocket
+        self.drop_websocket = drop_websocket
+        self.view_size = view_size
+        self.output_dir = output_dir
+        self.view_requests = 0
+        self.queue = queue.Queue()
+        self.queued = 0
+        self.running = None
+        self.lock = threading.Lock()
+        self.history = {}
+        self.sockets = {}
+        # prompt_id -> time.monotonic() when it started running / its history entry was stored
+        self.started_at = {}
+        self.completed_at = {}
+        self.history_requests = 0
+        # Uploaded input file name -> request size, and bytes received by /upload/image
+        self.inputs = {}
+        self.upload_bytes = 0
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_port}"
+
+    def __enter__(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        threading.Thread(target=self._execute, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.queue.put(None)
+        self.shutdown()
+        with self.lock:
+            sockets = [socket for group in self.sockets.values() for socket in group]
+        for socket in sockets:
+            socket.close()
+        self.server_close()
+
+    def read_output(self, filename):
+        with self.lock:
+            self.view_requests += 1
+        if self.output_dir:
+            path = os.path.join(self.output_dir, os.path.basename(filename))
+            if os.path.exists(path):
+                with open(path, "rb") as f:
+                    return f.read()
+        return b"\0" * self.view_size
+
+    def send(self, client_id, event, data):
+        with self.lock:
+            sockets = list(self.sockets.get(client_id, []))
+        for socket in sockets:
+            socket.send_json({"type": event, "data": data})
+
+    def _execute(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            with self.lock:
+                self.running = item[0]
+            self.run_prompt(*item)
+            with self.lock:
+                self.running = None
+
+    def run_prompt(self, prompt_id, prompt, client_id):
+        started = time.monotonic()
+        with self.lock:
+            self.started_at[prompt_id] = started
+        self.send(client_id, "execution_start", {"prompt_id": prompt_id, "timestamp": int(time.time() * 1000)})
+        if self.drop_websocket:
+            with self.lock:
+                sockets = list(self.sockets.get(client_id, []))
+            for socket in sockets:
+                socket.close()
+                try:
+                    socket.connection.shutdown(SHUT_RDWR)
+                except OSError:
+                    pass
+
+        nodes = list(prompt)
+        outputs, messages = {}, [["execution_start", {"prompt_id": prompt_id}]]
+        for index, node in enumerate(nodes):
+            self.send(client_id, "executing", {"node": node, "display_node": node, "prompt_id": prompt_id})
+            if self.fail and index == len(nodes) - 1:
+                error = {"prompt_id": prompt_id, "node_id": node,
+                         "node_type": prompt[node].get("class_type", "Unknown"),
+                         "exception_message": "Allocation on device", "exception_type": "torch.OutOfMemoryError"}
+                self.send(client_id, "execution_error", error)
+                messages.append(["execution_error", error])
+                break
+            # A binary preview frame, like KSampler previews
+            with self.lock:
+                sockets = list(self.sockets.get(client_id, []))
+            for socket in sockets:
+                socket.send(0x2, b"\x00\x00\x00\x01preview")
+            # Spread the run time over the nodes, and a sampler's share over its steps
+            steps = _sampler_steps(prompt[node])
+            for step in range(1, steps + 1):
+                time.sleep(max(0.0, started + self.run_time * (index + step / steps) / len(nodes) - time.monotonic()))
+                self.send(client_id, "progress", {"value": step, "max": steps, "prompt_id": prompt_id, "node": node})
+            output = {"videos": [{"filename": f"{prompt_id}_{node}.mp4", "subfolder": "", "type": "output"}]}
+            if self.output_dir:
+                with open(os.path.join(self.output_dir, f"{prompt_id}_{node}.mp4"), "wb") as f:
+                    f.write(b"\0" * self.view_size)
+            outputs[node] = output
+            self.send(client_id, "executed", {"node": node, "display_node": node, "output": output,
+                                              "prompt_id": prompt_id})
+        else:
+            messages.append(["execution_success", {"prompt_id": prompt_id}])
+            self.send(client_id, "execution_success", {"prompt_id": prompt_id})
+
+        status = {"status_str": "error" if self.fail else "success", "completed": not self.fail,
+                  "messages": messages}
+        with self.lock:
+            self.history[prompt_id] = {"prompt": [0, prompt_id, prompt, {}, nodes], "outputs": outputs,
+                                       "status": status}
+            self.completed_at[prompt_id] = time.monotonic()
+        self.send(client_id, "executing", {"node": None, "prompt_id": prompt_id})
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run a fake ComfyUI server")
+    parser.add_argument("--port", type=int, default=8188)
+    parser.add_argument("--run-time", type=float, default=5.0, help="Seconds each prompt runs")
+    args = parser.parse_args()
+    with FakeComfyUI(run_time=args.run_time, port=args.port) as server:
+        print(f"Fake ComfyUI listening on {server.url}")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,247 @@
+"""
+Content-addressed disk cache for input images downloaded by URL.
+
+The same start image is often reused across many prompt or seed variations,
+so downloads are kept on disk and shared by every job in the container:
+
+    blobs/<sha256>          image bytes, stored once per distinct content
+    urls/<sha256(url)>.json URL entry: blob digest, ETag, Last-Modified, fetch time
+    locks/<key>.lock        flock(2) locks serializing work on one URL
+
+A URL fetched less than IMAGE_CACHE_TTL seconds ago is served without any
+network access. Older entries are revalidated with If-None-Match /
+If-Modified-Since, so an unchanged image costs a 304 instead of a download.
+Files are written to a temporary name and renamed into place, so readers
+never see partial data. Blobs are evicted least recently used first once
+the cache grows past IMAGE_CACHE_MAX_BYTES.
+"""
+import fcntl
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+import requests
+
+import http_client
+
+IMAGE_CACHE_DIR = os.getenv("IMAGE_CACHE_DIR") or os.path.join(tempfile.gettempdir(), "wan-image-cache")
+# Byte budget for cached blobs; 0 disables the cache
+IMAGE_CACHE_MAX_BYTES = int(os.getenv("IMAGE_CACHE_MAX_BYTES", str(2 * 2**30)))
+# Seconds a cached URL is trusted before it is revalidated with the server
+IMAGE_CACHE_TTL = float(os.getenv("IMAGE_CACHE_TTL", "86400"))
+
+# read() status -> counter in stats()
+_STATUS_COUNTERS = {"hit": "hits", "revalidated": "revalidated", "miss": "misses", "stale": "stale_served"}
+
+
+def _sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def _atomic_write(path, data):
+    fd, tmp_path = tempfile.mkstemp(prefix=".tmp-", dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _read_file(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+class ImageCache:
+    """
+    Disk cache for URL downloads, safe to share between threads and processes.
+
+    read() returns the image bytes and how the request was served: "hit" (no network access),
+    "revalidated" (server answered 304 Not Modified), "miss" (downloaded),
+    "stale" (revalidation failed, cached copy used) or "bypass" (cache
+    disabled). Counters for this process are in stats().
+    """
+
+    def __init__(self, root=None, max_bytes=None, ttl=None):
+        self.root = root or IMAGE_CACHE_DIR
+        self.max_bytes = IMAGE_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+        self.ttl = IMAGE_CACHE_TTL if ttl is None else ttl
+        self.enabled = self.max_bytes > 0
+        for sub in ("blobs", "urls", "locks"):
+            os.makedirs(os.path.join(self.root, sub), exist_ok=True)
+        self._counters = {"hits": 0, "revalidated": 0, "misses": 0, "evictions": 0, "stale_served": 0,
+                          "bytes_downloaded": 0, "bytes_served": 0}
+        self._counters_lock = threading.Lock()
+
+    def read(self, url, timeout=None):
+        """(image bytes, status) for url, without writing a per-job file."""
+        if not self.enabled:
+            data = self._download(url, timeout=timeout)[0]
+            self._count(bytes_downloaded=len(data))
+            return data, "bypass"
+        return self._serve(url, _read_file, timeout)
+
+    def _serve(self, url, consume, timeout=None):
+        """Make sure url is cached, call consume(blob path) and return (its result, status)."""
+        key = _sha256(url.encode())
+        # The shared eviction lock keeps blobs in place until they are consumed
+        with self._lock(key), self._lock("evict", shared=True):
+            entry = self._read_entry(key)
+            blob = self._blob_path(entry["blob"]) if entry else None
+            if blob is None or not os.path.exists(blob):
+                entry = None
+
+            if entry and time.time() - entry["fetched_at"] < self.ttl:
+                status = "hit"
+            else:
+                status, entry = self._refresh(url, key, entry, timeout)
+                blob = self._blob_path(entry["blob"])
+
+            # Touch the blob so eviction sees it as recently used
+            os.utime(blob)
+            result = consume(blob)
+
+        self._count(**{_STATUS_COUNTERS[status]: 1}, bytes_served=entry["size"])
+        if status == "miss":
+            self._evict(keep=entry["blob"])
+        return result, status
+
+    def stats(self):
+        """Hit/miss counters for this process plus the current cache size."""
+        with self._counters_lock:
+            stats = dict(self._counters)
+        lookups = stats["hits"] + stats["revalidated"] + stats["misses"]
+        stats["hit_rate"] = round((stats["hits"] + stats["revalidated"]) / lookups, 3) if lookups else None
+        stats["cache_bytes"] = sum(size for _, size, _ in self._blobs())
+        return stats
+
+    def _refresh(self, url, key, entry, timeout=None):
+        headers = {}
+        if entry:
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+        try:
+            data, response = self._download(url, headers, timeout)
+        except requests.RequestException as e:
+            if entry is None:
+                raise
+            # The server is unreachable but we still hold a copy
+            print(f"Revalidating {url} failed ({e}), serving cached copy")
+            return "stale", entry
+
+        if response.status_code == 304:
+            entry = {**entry, "fetched_at": time.time()}
+            self._write_entry(key, entry)
+            return "revalidated", entry
+
+        digest = _sha256(data)
+        blob = self._blob_path(digest)
+        if not os.path.exists(blob):
+            _atomic_write(blob, data)
+        entry = {
+            "url": url,
+            "blob": digest,
+            "size": len(data),
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "fetched_at": time.time()
+        }
+        self._write_entry(key, entry)
+        self._count(bytes_downloaded=len(data))
+        return "miss", entry
+
+    def _download(self, url, headers=None, timeout=None):
+        response = http_client.get(url, "download", headers=headers, timeout=timeout)
+        if response.status_code != 304:
+            response.raise_for_status()
+        return response.content, response
+
+    def _evict(self, keep=None):
+        """Delete least recently used blobs until the cache fits its byte budget."""
+        with self._lock("evict"):
+            blobs = self._blobs()
+            total = sum(size for _, size, _ in blobs)
+            for path, size, _ in sorted(blobs, key=lambda blob: blob[2]):
+                if total <= self.max_bytes:
+                    break
+                if os.path.basename(path) == keep:
+                    continue
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    continue
+                total -= size
+                self._count(evictions=1)
+
+    def _blobs(self):
+        """(path, size, last used) for every cached blob."""
+        blobs = []
+        with os.scandir(os.path.join(self.root, "blobs")) as entries:
+            for entry in entries:
+                if entry.name.startswith(".tmp-"):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                blobs.append((entry.path, stat.st_size, stat.st_mtime))
+        return blobs
+
+    def _blob_path(self, digest):
+        return os.path.join(self.root, "blobs", digest)
+
+    def _read_entry(self, key):
+        try:
+            with open(os.path.join(self.root, "urls", f"{key}.json")) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _write_entry(self, key, entry):
+        _atomic_write(os.path.join(self.root, "urls", f"{key}.json"), json.dumps(entry).encode())
+
+    @contextmanager
+    def _lock(self, key, shared=False):
+        with open(os.path.join(self.root, "locks", f"{key}.lock"), 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _count(self, **increments):
+        with self._counters_lock:
+            for name, value in increments.items():
+                self._counters[name] += value
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def default_cache():
+    """Process-wide ImageCache configured from the environment."""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = ImageCache()
+        return _default_cache
+
+
+def read_image(url, timeout=None):
+    """Bytes of the image at url through the shared cache; returns (data, cache status)."""
+    return default_cache().read(url, timeout)
+
+
+def cache_stats():
+    """Counters of the shared cache."""
+    return default_cache().stats()
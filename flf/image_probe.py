@@ -0,0 +1,175 @@
+"""
+Read image dimensions from the first bytes of a file or URL.
+
+Remote images are requested with an HTTP Range header and read only until
+the PNG, JPEG, WebP or GIF header yields width and height, so the CLI can
+pick a resolution without transferring the image. Servers that ignore Range
+are handled too: the body is streamed and the connection closed as soon as
+the size is known. Other formats fall back to PIL on the bytes read so far.
+
+Probed sizes are cached in IMAGE_PROBE_CACHE, keyed by URL for remote
+images and by path, size and mtime for local files.
+"""
+import io
+import json
+import os
+import struct
+import tempfile
+
+import requests
+from PIL import Image
+
+IMAGE_PROBE_CACHE = os.getenv("IMAGE_PROBE_CACHE",
+                              os.path.join(os.path.expanduser("~"), ".cache", "wan-cli", "image_sizes.json"))
+IMAGE_PROBE_CACHE_ENTRIES = 1000
+PROBE_CHUNK = 16 * 1024
+# Give up on header parsing after this much data (large EXIF/ICC blocks come before the JPEG SOF)
+PROBE_LIMIT = 1024 * 1024
+PROBE_TIMEOUT = (5, 15)
+
+# JPEG start-of-frame markers carrying the image size (not DHT, JPG or DAC)
+_JPEG_SOF = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+class UnknownImageFormat(ValueError):
+    pass
+
+
+def _jpeg_size(data):
+    position = 2
+    while True:
+        # Skip to the next marker, including any 0xFF fill bytes
+        while position < len(data) and data[position] != 0xFF:
+            position += 1
+        while position < len(data) and data[position] == 0xFF:
+            position += 1
+        if position >= len(data):
+            return None
+        marker = data[position]
+        position += 1
+        if marker == 0xD8 or marker == 0x01 or 0xD0 <= marker <= 0xD7:
+            continue
+        if marker == 0xD9:
+            raise UnknownImageFormat("JPEG ended before a frame header")
+        if position + 2 > len(data):
+            return None
+        length = struct.unpack(">H", data[position:position + 2])[0]
+        if marker in _JPEG_SOF:
+            if position + 7 > len(data):
+                return None
+            height, width = struct.unpack(">HH", data[position + 3:position + 7])
+            return width, height
+        position += length
+
+
+def _webp_size(data):
+    if len(data) < 30:
+        return None
+    chunk = data[12:16]
+    if chunk == b"VP8 ":
+        width, height = struct.unpack("<HH", data[26:30])
+        return width & 0x3FFF, height & 0x3FFF
+    if chunk == b"VP8L":
+        bits = struct.unpack("<I", data[21:25])[0]
+        return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+    if chunk == b"VP8X":
+        return int.from_bytes(data[24:27], "little") + 1, int.from_bytes(data[27:30], "little") + 1
+    raise UnknownImageFormat(f"Unsupported WebP chunk {chunk!r}")
+
+
+def parse_image_size(data):
+    """
+    (width, height) from the leading bytes of an image, or None if more
+    bytes are needed. Raises UnknownImageFormat for unrecognized data.
+    """
+    if data.startswith(b"\x89PNG\r\n\x1a\n"):
+        return struct.unpack(">II", data[16:24]) if len(data) >= 24 else None
+    if data.startswith(b"\xff\xd8"):
+        return _jpeg_size(data)
+    if data.startswith(b"RIFF") and data[8:12] == b"WEBP":
+        return _webp_size(data)
+    if data[:6] in (b"GIF87a", b"GIF89a"):
+        return struct.unpack("<HH", data[6:10]) if len(data) >= 10 else None
+    if len(data) < 12:
+        return None
+    raise UnknownImageFormat("Not a PNG, JPEG, WebP or GIF header")
+
+
+def _size_from_chunks(chunks):
+    """Consume byte chunks until the size is known; returns (size, bytes read)."""
+    data = b""
+    for chunk in chunks:
+        data += chunk
+        try:
+            size = parse_image_size(data)
+        except UnknownImageFormat:
+            break
+        if size is not None:
+            return tuple(size), len(data)
+        if len(data) >= PROBE_LIMIT:
+            break
+    # Let PIL try whatever format this is from the bytes we have
+    with Image.open(io.BytesIO(data)) as image:
+        return image.size, len(data)
+
+
+def probe_remote(url):
+    """(width, height, bytes read) of a remote image without downloading all of it."""
+    headers = {"Range": f"bytes=0-{PROBE_LIMIT - 1}"}
+    with requests.get(url, headers=headers, stream=True, timeout=PROBE_TIMEOUT) as response:
+        response.raise_for_status()
+        size, read = _size_from_chunks(response.iter_content(PROBE_CHUNK))
+        return size[0], size[1], read
+
+
+def probe_local(path):
+    """(width, height) of a local image, reading only its header."""
+    with open(path, 'rb') as f:
+        size, _ = _size_from_chunks(iter(lambda: f.read(PROBE_CHUNK), b""))
+    return size
+
+
+def _load_cache():
+    try:
+        with open(IMAGE_PROBE_CACHE) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_cache(cache):
+    # Keep the most recently added entries
+    if len(cache) > IMAGE_PROBE_CACHE_ENTRIES:
+        cache = dict(list(cache.items())[-IMAGE_PROBE_CACHE_ENTRIES:])
+    directory = os.path.dirname(IMAGE_PROBE_CACHE)
+    try:
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix=".tmp-", dir=directory)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(cache, f)
+        os.replace(tmp_path, IMAGE_PROBE_CACHE)
+    except OSError as e:
+        print(f"Warning: Could not save image size cache: {e}")
+
+
+def probe_image_size(image_path):
+    """(width, height) of a local path or http(s) URL, served from the cache when possible."""
+    cache = _load_cache()
+    remote = image_path.startswith(('http://', 'https://'))
+    if remote:
+        key = image_path
+    else:
+        stat = os.stat(image_path)
+        key = f"{os.path.abspath(image_path)}:{stat.st_size}:{int(stat.st_mtime)}"
+
+    if key in cache:
+        return tuple(cache[key]["size"])
+
+    if remote:
+        width, height, read = probe_remote(image_path)
+        print(f"Probed {width}x{height} from the first {read} bytes of {image_path}")
+    else:
+        width, height = probe_local(image_path)
+    cache[key] = {"size": [width, height]}
+    _save_cache(cache)
+    return width, height
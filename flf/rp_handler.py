@@ -12,8 +12,7 @@ import random
 import base64
 import requests
 import subprocess
-from typing import Dict, Any, Optional
-from urllib.parse import urlsplit
+from typing import Dict, Any, Iterator, Optional, Tuple
 
 # Add ComfyUI to path
 sys.path.append('/comfyui')
@@ -21,78 +20,83 @@ sys.path.append('/comfyui')
 # Import RunPod
 import runpod
 
+import http_client
+from video_io import get_output_preset, remux_fragments, DEFAULT_OUTPUT_PRESET, OUTPUT_PRESETS
+from image_cache import cache_stats
+from image_source import resolve_image
+from assets import prepare_frames, remaining, validate_image
+from resolution_plan import plan_generation, describe_plan
+from comfyui_events import PromptWatcher
+from progress import ProgressReporter, workflow_stages
+from comfyui_supervisor import get_supervisor
+from upload_index import get_index, upload_stats
+from workflow_template import OMIT, WorkflowTemplate
+
 # ComfyUI API settings
 COMFYUI_API_URL = "http://127.0.0.1:8188"
+# Longest wait for a queued workflow, in seconds
+WORKFLOW_TIMEOUT = float(os.getenv("WORKFLOW_TIMEOUT", "125"))
+# Relay the output as fragmented MP4 pieces from a generator handler
+STREAM_OUTPUT = os.getenv("STREAM_OUTPUT", "false").lower() == "true"
 
-def check_server(url: str = COMFYUI_API_URL, retries: int = 500, delay: float = 0.05) -> bool:
-    """Check if ComfyUI server is running"""
-    for i in range(retries):
+def check_server(url: str = COMFYUI_API_URL) -> bool:
+    """Check if ComfyUI server is ready, from the supervisor's cached state"""
+    supervisor = get_supervisor(url)
+    if not supervisor.wait_ready():
+        print(f"Failed to connect to ComfyUI server at {url}: {supervisor.last_error}")
+        return False
+    if not FLF_TEMPLATE.classes_checked:
+        # Once per process, as soon as ComfyUI can list its node classes; a
+        # mismatch fails the job with the offending node named
         try:
-            response = requests.get(f"{url}/system_stats")
-            if response.status_code == 200:
-                print(f"ComfyUI server is ready at {url}")
-                return True
-        except requests.exceptions.RequestException:
-            pass
-        
-        if i % 10 == 0:
-            print(f"Waiting for ComfyUI server... ({i}/{retries})")
-        time.sleep(delay)
-    
-    print(f"Failed to connect to ComfyUI server at {url}")
-    return False
+            response = http_client.get(f"{url}/object_info", "default")
+            response.raise_for_status()
+            FLF_TEMPLATE.check_classes(response.json())
+        except requests.exceptions.RequestException as e:
+            print(f"Could not fetch node classes, checking on the next job: {e}")
+    if supervisor.queue_running or supervisor.queue_pending:
+        print(f"ComfyUI queue: {supervisor.queue_running} running, {supervisor.queue_pending} pending")
+    return True
 
-def download_image(url: str, save_path: str) -> str:
-    """Download image from URL and save to disk"""
+def upload_image(image_data: memoryview, filename: str, subfolder: str = "", overwrite: bool = True,
+                 timeout: Optional[float] = None) -> Dict[str, Any]:
+    """Upload in-memory image bytes to ComfyUI server"""
     try:
-        response = requests.get(url, timeout=30)
-        response.raise_for_status()
+        # Bytes rather than a file object, so a retried upload resends the whole image
+        files = {
+            'image': (filename, image_data, 'image/png')
+        }
+        data = {
+            'subfolder': subfolder,
+            'overwrite': str(overwrite).lower()
+        }
         
-        os.makedirs(os.path.dirname(save_path), exist_ok=True)
-        with open(save_path, 'wb') as f:
-            f.write(response.content)
+        response = http_client.post(
+            f"{COMFYUI_API_URL}/upload/image",
+            "upload",
+            files=files,
+            data=data,
+            timeout=timeout,
+            idempotent=overwrite
+        )
+        response.raise_for_status()
+        result = response.json()
         
-        print(f"Downloaded image to {save_path}")
-        return save_path
+        print(f"Uploaded image: {result}")
+        return result
     except Exception as e:
-        print(f"Failed to download image from {url}: {e}")
+        print(f"Failed to upload image {filename}: {e}")
         raise
 
-def upload_image(image_path: str, subfolder: str = "", overwrite: bool = True) -> Dict[str, Any]:
-    """Upload image to ComfyUI server"""
-    try:
-        with open(image_path, 'rb') as f:
-            files = {
-                'image': (os.path.basename(image_path), f, 'image/png')
-            }
-            data = {
-                'subfolder': subfolder,
-                'overwrite': str(overwrite).lower()
-            }
-            
-            response = requests.post(
-                f"{COMFYUI_API_URL}/upload/image",
-                files=files,
-                data=data
-            )
-            response.raise_for_status()
-            result = response.json()
-            
-            print(f"Uploaded image: {result}")
-            return result
-    except Exception as e:
-        print(f"Failed to upload image {image_path}: {e}")
-        raise
-
-def queue_workflow(workflow: Dict[str, Any]) -> str:
-    """Queue workflow for execution"""
+def queue_workflow(workflow: Dict[str, Any], client_id: str) -> str:
+    """Queue workflow for execution; ComfyUI sends its events to client_id's websocket"""
     try:
         payload = {
             "prompt": workflow,
-            "client_id": f"runpod-{random.randint(1000, 9999)}"
+            "client_id": client_id
         }
         
-        response = requests.post(f"{COMFYUI_API_URL}/prompt", json=payload)
+        response = http_client.post(f"{COMFYUI_API_URL}/prompt", "prompt", json=payload)
         response.raise_for_status()
         result = response.json()
         
@@ -103,25 +107,14 @@ def queue_workflow(workflow: Dict[str, Any]) -> str:
         print(f"Failed to queue workflow: {e}")
         raise
 
-def get_history(prompt_id: str, retries: int = 500, delay: float = 0.25) -> Optional[Dict[str, Any]]:
-    """Get workflow execution history"""
-    for i in range(retries):
-        try:
-            response = requests.get(f"{COMFYUI_API_URL}/history/{prompt_id}")
-            if response.status_code == 200:
-                history = response.json()
-                if prompt_id in history and history[prompt_id].get('outputs'):
-                    print(f"Workflow completed: {prompt_id}")
-                    return history[prompt_id]
-        except requests.exceptions.RequestException:
-            pass
-        
-        if i % 10 == 0:
-            print(f"Waiting for workflow completion... ({i}/{retries})")
-        time.sleep(delay)
-    
-    print(f"Workflow timeout: {prompt_id}")
-    return None
+def get_history(prompt_id: str, watcher: PromptWatcher, timeout: float = WORKFLOW_TIMEOUT) -> Optional[Dict[str, Any]]:
+    """Wait for the workflow to finish and return its execution history"""
+    history = watcher.wait(prompt_id, timeout)
+    if history is None:
+        print(f"Workflow timeout: {prompt_id}")
+    else:
+        print(f"Workflow completed: {prompt_id} ({watcher.mode}, {watcher.history_requests} history requests)")
+    return history
 
 def process_output_videos(outputs: Dict[str, Any]) -> Optional[str]:
     """Process and return the output video path"""
@@ -157,195 +150,289 @@ def validate_input(job_input: Dict[str, Any]) -> Dict[str, Any]:
         'steps': job_input.get('steps', 20),
         'cfg': job_input.get('cfg', 4.0),
         'sampler_name': job_input.get('sampler_name', 'euler'),
-        'scheduler': job_input.get('scheduler', 'simple')
+        'scheduler': job_input.get('scheduler', 'simple'),
+        'output_preset': job_input.get('output_preset', DEFAULT_OUTPUT_PRESET)
     }
     
+    # Fail fast on an unknown preset before anything is queued
+    get_output_preset(params['output_preset'])
+    
     # If seed is 0, generate random seed
     if params['seed'] == 0:
         params['seed'] = random.randint(0, 2**32 - 1)
     
+    # Snap size and length to the model's buckets within this GPU's budget
+    plan = plan_generation("wan2.2-flf", params['width'], params['height'], params['length'], params['batch_size'])
+    params.update(width=plan['width'], height=plan['height'], length=plan['length'], plan=plan)
+    print(f"Resolution plan: {describe_plan(plan)}")
+    
     return params
 
-def prepare_workflow(params: Dict[str, Any], start_image_name: str, end_image_name: str) -> Dict[str, Any]:
-    """Prepare the FLF workflow with dynamic parameters"""
+# The FLF graph, compiled once at import; per-job values are bound through FLF_SLOTS.
+# Values here are only placeholders.
+FLF_WORKFLOW = {
+    # Load CLIP text encoder
+    "38": {
+        "inputs": {
+            "clip_name": "umt5_xxl_fp8_e4m3fn_scaled.safetensors",
+            "type": "wan",
+            "key": "default"
+        },
+        "class_type": "CLIPLoader"
+    },
     
-    workflow = {
-        # Load CLIP text encoder
-        "38": {
-            "inputs": {
-                "clip_name": "umt5_xxl_fp8_e4m3fn_scaled.safetensors",
-                "type": "wan",
-                "key": "default"
-            },
-            "class_type": "CLIPLoader"
+    # Load VAE
+    "39": {
+        "inputs": {
+            "vae_name": "wan2.2_vae.safetensors"
         },
-        
-        # Load VAE
-        "39": {
-            "inputs": {
-                "vae_name": "wan2.2_vae.safetensors"
-            },
-            "class_type": "VAELoader"
+        "class_type": "VAELoader"
+    },
+    
+    # Load HIGH noise model
+    "37": {
+        "inputs": {
+            "unet_name": "wan2.2-flf-high.safetensors",
+            "weight_dtype": "fp8_e4m3fn"
         },
-        
-        # Load HIGH noise model
-        "37": {
-            "inputs": {
-                "unet_name": "wan2.2-flf-high.safetensors",
-                "weight_dtype": "fp8_e4m3fn"
-            },
-            "class_type": "UNETLoader"
+        "class_type": "UNETLoader"
+    },
+    
+    # Load LOW noise model
+    "56": {
+        "inputs": {
+            "unet_name": "wan2.2-flf-low.safetensors",
+            "weight_dtype": "fp8_e4m3fn"
         },
-        
-        # Load LOW noise model
-        "56": {
-            "inputs": {
-                "unet_name": "wan2.2-flf-low.safetensors",
-                "weight_dtype": "fp8_e4m3fn"
-            },
-            "class_type": "UNETLoader"
+        "class_type": "UNETLoader"
+    },
+    
+    # Model sampling for HIGH noise
+    "54": {
+        "inputs": {
+            "model": ["37", 0],
+            "shift": 8.0
         },
-        
-        # Model sampling for HIGH noise
-        "54": {
-            "inputs": {
-                "model": ["37", 0],
-                "shift": 8.0
-            },
-            "class_type": "ModelSamplingSD3"
+        "class_type": "ModelSamplingSD3"
+    },
+    
+    # Model sampling for LOW noise
+    "55": {
+        "inputs": {
+            "model": ["56", 0],
+            "shift": 8.0
         },
-        
-        # Model sampling for LOW noise
-        "55": {
-            "inputs": {
-                "model": ["56", 0],
-                "shift": 8.0
-            },
-            "class_type": "ModelSamplingSD3"
+        "class_type": "ModelSamplingSD3"
+    },
+    
+    # Load start image
+    "52": {
+        "inputs": {
+            "image": "start.png",
+            "upload": "image"
         },
-        
-        # Load start image
-        "52": {
-            "inputs": {
-                "image": start_image_name,
-                "upload": "image"
-            },
-            "class_type": "LoadImage"
+        "class_type": "LoadImage"
+    },
+    
+    # Load end image
+    "67": {
+        "inputs": {
+            "image": "end.png",
+            "upload": "image"
         },
-        
-        # Load end image
-        "67": {
-            "inputs": {
-                "image": end_image_name,
-                "upload": "image"
-            },
-            "class_type": "LoadImage"
+        "class_type": "LoadImage"
+    },
+    
+    # Positive prompt encoding
+    "6": {
+        "inputs": {
+            "text": "",
+            "clip": ["38", 0]
         },
-        
-        # Positive prompt encoding
-        "6": {
-            "inputs": {
-                "text": params['positive_prompt'],
-                "clip": ["38", 0]
-            },
-            "class_type": "CLIPTextEncode"
+        "class_type": "CLIPTextEncode"
+    },
+    
+    # Negative prompt encoding
+    "7": {
+        "inputs": {
+            "text": "",
+            "clip": ["38", 0]
         },
-        
-        # Negative prompt encoding
-        "7": {
-            "inputs": {
-                "text": params['negative_prompt'],
-                "clip": ["38", 0]
-            },
-            "class_type": "CLIPTextEncode"
+        "class_type": "CLIPTextEncode"
+    },
+    
+    # WAN First-Last Frame node
+    "66": {
+        "inputs": {
+            "positive": ["6", 0],
+            "negative": ["7", 0],
+            "vae": ["39", 0],
+            "start_image": ["52", 0],
+            "end_image": ["67", 0],
+            "width": 720,
+            "height": 1280,
+            "length": 81,
+            "batch_size": 1
         },
-        
-        # WAN First-Last Frame node
-        "66": {
-            "inputs": {
-                "positive": ["6", 0],
-                "negative": ["7", 0],
-                "vae": ["39", 0],
-                "start_image": ["52", 0],
-                "end_image": ["67", 0],
-                "width": params['width'],
-                "height": params['height'],
-                "length": params['length'],
-                "batch_size": params['batch_size']
-            },
-            "class_type": "WanFirstLastFrameToVideo"
+        "class_type": "WanFirstLastFrameToVideo"
+    },
+    
+    # First KSampler (HIGH noise, steps 0-10)
+    "57": {
+        "inputs": {
+            "model": ["54", 0],
+            "positive": ["66", 0],
+            "negative": ["66", 1],
+            "latent_image": ["66", 2],
+            "seed": 0,
+            "steps": 20,
+            "cfg": 4.0,
+            "sampler_name": "euler",
+            "scheduler": "simple",
+            "add_noise": "enable",
+            "noise_seed": 0,
+            "start_at_step": 0,
+            "end_at_step": 10,
+            "return_with_leftover_noise": "enable"
         },
-        
-        # First KSampler (HIGH noise, steps 0-10)
-        "57": {
-            "inputs": {
-                "model": ["54", 0],
-                "positive": ["66", 0],
-                "negative": ["66", 1],
-                "latent_image": ["66", 2],
-                "seed": params['seed'],
-                "steps": params['steps'],
-                "cfg": params['cfg'],
-                "sampler_name": params['sampler_name'],
-                "scheduler": params['scheduler'],
-                "add_noise": "enable",
-                "noise_seed": params['seed'],
-                "start_at_step": 0,
-                "end_at_step": 10,
-                "return_with_leftover_noise": "enable"
-            },
-            "class_type": "KSamplerAdvanced"
+        "class_type": "KSamplerAdvanced"
+    },
+    
+    # Second KSampler (LOW noise, steps 10-20)
+    "58": {
+        "inputs": {
+            "model": ["55", 0],
+            "positive": ["66", 0],
+            "negative": ["66", 1],
+            "latent_image": ["57", 0],
+            "seed": 0,
+            "steps": 20,
+            "cfg": 4.0,
+            "sampler_name": "euler",
+            "scheduler": "simple",
+            "add_noise": "disable",
+            "noise_seed": 0,
+            "start_at_step": 10,
+            "end_at_step": 10000,
+            "return_with_leftover_noise": "disable"
         },
-        
-        # Second KSampler (LOW noise, steps 10-20)
-        "58": {
-            "inputs": {
-                "model": ["55", 0],
-                "positive": ["66", 0],
-                "negative": ["66", 1],
-                "latent_image": ["57", 0],
-                "seed": 0,
-                "steps": params['steps'],
-                "cfg": params['cfg'],
-                "sampler_name": params['sampler_name'],
-                "scheduler": params['scheduler'],
-                "add_noise": "disable",
-                "noise_seed": 0,
-                "start_at_step": 10,
-                "end_at_step": 10000,
-                "return_with_leftover_noise": "disable"
-            },
-            "class_type": "KSamplerAdvanced"
+        "class_type": "KSamplerAdvanced"
+    },
+    
+    # VAE Decode
+    "8": {
+        "inputs": {
+            "samples": ["58", 0],
+            "vae": ["39", 0]
         },
-        
-        # VAE Decode
-        "8": {
-            "inputs": {
-                "samples": ["58", 0],
-                "vae": ["39", 0]
-            },
-            "class_type": "VAEDecode"
+        "class_type": "VAEDecode"
+    },
+    
+    # Video Combine (format, pix_fmt and crf come from the output preset)
+    "61": {
+        "inputs": {
+            "images": ["8", 0],
+            "frame_rate": 16,
+            "loop_count": 0,
+            "filename_prefix": "wan-flf",
+            **get_output_preset(DEFAULT_OUTPUT_PRESET)['vhs'],
+            "save_metadata": True,
+            "pingpong": False,
+            "save_output": True
         },
-        
-        # Video Combine
-        "61": {
-            "inputs": {
-                "images": ["8", 0],
-                "frame_rate": params['fps'],
-                "loop_count": 0,
-                "filename_prefix": f"wan-flf-{params['seed']}",
-                "format": "video/h264-mp4",
-                "pix_fmt": "yuv420p",
-                "crf": 19,
-                "save_metadata": True,
-                "pingpong": False,
-                "save_output": True
-            },
-            "class_type": "VHS_VideoCombine"
-        }
+        "class_type": "VHS_VideoCombine"
     }
+}
+
+# VHS_VideoCombine options set by output presets; presets without one leave it out
+VHS_OPTIONS = sorted({option for preset in OUTPUT_PRESETS.values() for option in preset['vhs']})
+
+FLF_SLOTS = {
+    "positive_prompt": [("6", "text")],
+    "negative_prompt": [("7", "text")],
+    "start_image": [("52", "image")],
+    "end_image": [("67", "image")],
+    "width": [("66", "width")],
+    "height": [("66", "height")],
+    "length": [("66", "length")],
+    "batch_size": [("66", "batch_size")],
+    "seed": [("57", "seed"), ("57", "noise_seed")],
+    "steps": [("57", "steps"), ("58", "steps")],
+    "cfg": [("57", "cfg"), ("58", "cfg")],
+    "sampler_name": [("57", "sampler_name"), ("58", "sampler_name")],
+    "scheduler": [("57", "scheduler"), ("58", "scheduler")],
+    "fps": [("61", "frame_rate")],
+    "filename_prefix": [("61", "filename_prefix")],
+    **{option: [("61", option)] for option in VHS_OPTIONS}
+}
+
+# Wrong node ids or inputs fail here, at startup, rather than in a job
+FLF_TEMPLATE = WorkflowTemplate(FLF_WORKFLOW, FLF_SLOTS, name="FLF workflow")
+
+def prepare_workflow(params: Dict[str, Any], start_image_name: str, end_image_name: str) -> Dict[str, Any]:
+    """Bind a job's parameters to the precompiled FLF workflow"""
+    vhs = get_output_preset(params['output_preset'])['vhs']
+    return FLF_TEMPLATE.render(
+        {slot: params[slot] for slot in ("positive_prompt", "negative_prompt", "width", "height", "length",
+                                         "batch_size", "seed", "steps", "cfg", "sampler_name", "scheduler", "fps")},
+        start_image=start_image_name,
+        end_image=end_image_name,
+        filename_prefix=f"wan-flf-{params['seed']}",
+        **{option: vhs.get(option, OMIT) for option in VHS_OPTIONS}
+    )
+
+def prepare_frame(name: str, image: str, deadline: float) -> str:
+    """Resolve (URL, data URI, base64 or path), validate and upload one input frame; returns its ComfyUI name"""
+    # Kept in memory from download to upload; nothing is written to the scratch directory
+    source = resolve_image(image, timeout=remaining(deadline))
     
-    return workflow
+    width, height = validate_image(source.data, f"{name} image")
+    print(f"Validated {name} image: {width}x{height}")
+    
+    # Named by content hash, so concurrent jobs can't overwrite each other and a
+    # frame this ComfyUI already holds is not sent again
+    return get_index(COMFYUI_API_URL).ensure(
+        source.data, lambda data, filename: upload_image(data, filename, timeout=remaining(deadline)),
+        timeout=remaining(deadline)
+    )
+
+def generate_video(params: Dict[str, Any], job: Dict[str, Any]) -> Tuple[str, float, Dict[str, float]]:
+    """Run the FLF workflow in ComfyUI; returns the output video path, the asset prep time and stage times"""
+    # The stage layout only depends on params, so read it off a workflow with placeholder frames
+    stages, node_stages = workflow_stages(prepare_workflow(params, "start", "end"))
+    progress = ProgressReporter(job, stages, params['plan']['pixel_frames'])
+    progress.stage("prepare")
+    
+    # Check if ComfyUI server is ready
+    if not check_server():
+        raise RuntimeError("ComfyUI server is not responding")
+    
+    # Prepare the start and end frames concurrently under one timeout budget
+    (start_image_name, end_image_name), asset_time = prepare_frames(
+        prepare_frame,
+        [("start", params['start_image']), ("end", params['end_image'])]
+    )
+    print(f"Input frames ready in {asset_time}s")
+    
+    # Prepare workflow
+    workflow = prepare_workflow(params, start_image_name, end_image_name)
+    
+    # Open the event socket before queueing so no completion event is missed
+    # Sampler steps and node changes are relayed to RunPod as progress updates
+    with PromptWatcher(COMFYUI_API_URL, on_event=progress.relay(node_stages)) as watcher:
+        prompt_id = queue_workflow(workflow, watcher.client_id)
+        history = get_history(prompt_id, watcher)
+    if not history:
+        raise RuntimeError("Workflow execution timed out")
+    
+    # Process outputs
+    outputs = history.get('outputs', {})
+    video_path = process_output_videos(outputs)
+    
+    if not video_path:
+        raise RuntimeError("No video output found")
+    
+    return video_path, asset_time, progress.finish()
 
 def handler(job: Dict[str, Any]) -> Dict[str, Any]:
     """RunPod handler function"""
@@ -359,50 +446,7 @@ def handler(job: Dict[str, Any]) -> Dict[str, Any]:
         params = validate_input(job_input)
         print(f"Processing FLF job with params: {params}")
         
-        # Check if ComfyUI server is ready
-        if not check_server():
-            raise RuntimeError("ComfyUI server is not responding")
-        
-        # Handle start image
-        start_image_name = "start_image.png"
-        if params['start_image'].startswith(('http://', 'https://')):
-            start_image_path = "/tmp/start_image.png"
-            download_image(params['start_image'], start_image_path)
-        else:
-            start_image_path = params['start_image']
-        
-        # Handle end image
-        end_image_name = "end_image.png"
-        if params['end_image'].startswith(('http://', 'https://')):
-            end_image_path = "/tmp/end_image.png"
-            download_image(params['end_image'], end_image_path)
-        else:
-            end_image_path = params['end_image']
-        
-        # Upload images to ComfyUI
-        start_upload = upload_image(start_image_path)
-        start_image_name = start_upload['name']
-        
-        end_upload = upload_image(end_image_path)
-        end_image_name = end_upload['name']
-        
-        # Prepare workflow
-        workflow = prepare_workflow(params, start_image_name, end_image_name)
-        
-        # Queue workflow
-        prompt_id = queue_workflow(workflow)
-        
-        # Wait for completion
-        history = get_history(prompt_id)
-        if not history:
-            raise RuntimeError("Workflow execution timed out")
-        
-        # Process outputs
-        outputs = history.get('outputs', {})
-        video_path = process_output_videos(outputs)
-        
-        if not video_path:
-            raise RuntimeError("No video output found")
+        video_path, asset_time, stage_times = generate_video(params, job)
         
         # Read video file and encode to base64
         with open(video_path, 'rb') as f:
@@ -416,6 +460,13 @@ def handler(job: Dict[str, Any]) -> Dict[str, Any]:
             "video_path": video_path,
             "seed": params['seed'],
             "execution_time": execution_time,
+            "output_preset": params['output_preset'],
+            "asset_time": asset_time,
+            "plan": params['plan'],
+            "stage_times": stage_times,
+            "output_size": len(video_data),
+            "image_cache": cache_stats(),
+            "uploads": upload_stats(),
             "status": "success"
         }
         
@@ -428,6 +479,67 @@ def handler(job: Dict[str, Any]) -> Dict[str, Any]:
             "status": "failed"
         }
 
+def stream_handler(job: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    """
+    Streaming RunPod handler (STREAM_OUTPUT=true).
+    
+    This is chunked delivery of a finished file, not progressive streaming:
+    VHS_VideoCombine writes the whole video inside ComfyUI, and only then is
+    it stream-copied into fragmented MP4 and relayed one fragment at a time
+    instead of as a single base64 blob. Nothing is sent while ComfyUI is
+    sampling or encoding. Fragment 0 is the init segment; the last message
+    carries the job summary, with "delivery": "chunked".
+    """
+    start_time = time.time()
+    
+    try:
+        params = validate_input(job.get('input', {}))
+        if get_output_preset(params['output_preset'])['ext'] != "mp4":
+            raise ValueError(f"Streaming output needs an mp4 output preset, got {params['output_preset']}")
+        print(f"Processing streaming FLF job with params: {params}")
+        
+        video_path, asset_time, stage_times = generate_video(params, job)
+        
+        output_size = 0
+        fragment_count = 0
+        for fragment in remux_fragments(video_path):
+            yield {
+                "fragment_index": fragment_count,
+                "data": base64.b64encode(fragment).decode('utf-8')
+            }
+            output_size += len(fragment)
+            fragment_count += 1
+        
+        yield {
+            "video_path": video_path,
+            "seed": params['seed'],
+            "execution_time": round(time.time() - start_time, 2),
+            "output_preset": params['output_preset'],
+            "asset_time": asset_time,
+            "plan": params['plan'],
+            "stage_times": stage_times,
+            "output_size": output_size,
+            "fragment_count": fragment_count,
+            # Fragments were cut from the finished file, not sent during generation
+            "delivery": "chunked",
+            "image_cache": cache_stats(),
+            "uploads": upload_stats(),
+            "status": "success"
+        }
+        
+    except Exception as e:
+        print(f"Error in stream handler: {str(e)}")
+        yield {
+            "error": str(e),
+            "execution_time": round(time.time() - start_time, 2),
+            "status": "failed"
+        }
+
 # RunPod serverless start
 if __name__ == "__main__":
-    runpod.serverless.start({"handler": handler})
\ No newline at end of file
+    # Track ComfyUI from startup so the first job finds its state cached
+    get_supervisor(COMFYUI_API_URL)
+    if STREAM_OUTPUT:
+        runpod.serverless.start({"handler": stream_handler, "return_aggregate_stream": True})
+    else:
+        runpod.serverless.start({"handler": handler})
\ No newline at end of file
@@ -10,33 +10,34 @@ import json
 import time
 import random
 import base64
-import requests
-import subprocess
 from typing import Dict, Any, Optional
 
 # Import RunPod
 import runpod
 
+import http_client
+from workspace import JobWorkspace
+from image_source import resolve_image
+from resolution_plan import plan_generation, describe_plan
+from comfyui_supervisor import get_supervisor
+
 # Configuration
 COMFYUI_URL = os.getenv("COMFYUI_URL", "http://localhost:8188")
+COMFYUI_COMMAND = ["python", "/comfyui/main.py", "--listen", "--port", "8188"]
 
 def check_comfyui_server():
-    """Check if ComfyUI server is available"""
-    try:
-        response = requests.get(f"{COMFYUI_URL}/system_stats", timeout=5)
-        return response.status_code == 200
-    except:
-        return False
+    """Check if ComfyUI server is available; the supervisor starts it once and restarts it if it dies"""
+    return get_supervisor(COMFYUI_URL, COMFYUI_COMMAND).wait_ready()
 
 def queue_prompt(prompt):
     """Queue a prompt to ComfyUI"""
     p = {"prompt": prompt}
-    response = requests.post(f"{COMFYUI_URL}/prompt", json=p)
+    response = http_client.post(f"{COMFYUI_URL}/prompt", "prompt", json=p)
     return response.json()
 
 def get_image(filename, subfolder, folder_type):
     """Get image from ComfyUI output"""
-    response = requests.get(f"{COMFYUI_URL}/view", params={
+    response = http_client.get(f"{COMFYUI_URL}/view", "view", params={
         "filename": filename,
         "subfolder": subfolder,
         "type": folder_type
@@ -45,23 +46,19 @@ def get_image(filename, subfolder, folder_type):
 
 def get_history(prompt_id):
     """Get history for a prompt"""
-    response = requests.get(f"{COMFYUI_URL}/history/{prompt_id}")
+    response = http_client.get(f"{COMFYUI_URL}/history/{prompt_id}", "history")
     return response.json()
 
 def upload_image(image_data, filename):
     """Upload an image to ComfyUI"""
     files = {"image": (filename, image_data, "image/png")}
     data = {"overwrite": "true"}
-    response = requests.post(f"{COMFYUI_URL}/upload/image", files=files, data=data)
+    response = http_client.post(f"{COMFYUI_URL}/upload/image", "upload", files=files, data=data, idempotent=True)
     return response.json()
 
-def download_image_from_url(url):
-    """Download image from URL"""
-    response = requests.get(url)
-    return response.content
-
 def generate(job):
     """Main generation function for RunPod"""
+    workspace = JobWorkspace(job.get("id"))
     try:
         job_input = job.get("input", {})
         
@@ -74,30 +71,33 @@ def generate(job):
         height = job_input.get("height", 576)
         length = job_input.get("length", 49)
         seed = job_input.get("seed", random.randint(0, 2**32-1))
+        # Snap size and length to the model's buckets within this GPU's budget
+        plan = plan_generation("wan2.2-flf", width, height, length)
+        width, height, length = plan["width"], plan["height"], plan["length"]
+        print(f"Resolution plan: {describe_plan(plan)}")
         
         # Check ComfyUI server
         if not check_comfyui_server():
-            # Try to start ComfyUI
-            print("Starting ComfyUI server...")
-            subprocess.Popen(["python", "/comfyui/main.py", "--listen", "--port", "8188"])
-            time.sleep(10)
-            
-            if not check_comfyui_server():
-                return {"error": "ComfyUI server not available"}
+            return {"error": "ComfyUI server not available"}
         
         # Handle image uploads
         start_image_name = "start_image.png"
         end_image_name = "end_image.png"
         
-        if start_image.startswith(("http://", "https://")):
-            image_data = download_image_from_url(start_image)
-            upload_result = upload_image(image_data, start_image_name)
-            start_image_name = upload_result.get("name", start_image_name)
-        
-        if end_image.startswith(("http://", "https://")):
-            image_data = download_image_from_url(end_image)
-            upload_result = upload_image(image_data, end_image_name)
-            end_image_name = upload_result.get("name", end_image_name)
+        # URLs and inline (data URI / base64) images are uploaded from memory;
+        # anything else names a file already in ComfyUI's input directory
+        if start_image.startswith(("http://", "https://", "data:")):
+            image_data = resolve_image(start_image).data
+            # Per-job upload name so concurrent jobs don't overwrite each other
+            upload_name = workspace.unique_name(start_image_name)
+            upload_result = upload_image(image_data, upload_name)
+            start_image_name = upload_result.get("name", upload_name)
+        
+        if end_image.startswith(("http://", "https://", "data:")):
+            image_data = resolve_image(end_image).data
+            upload_name = workspace.unique_name(end_image_name)
+            upload_result = upload_image(image_data, upload_name)
+            end_image_name = upload_result.get("name", upload_name)
         
         # Load workflow template
         workflow_path = "/workflow.json"
@@ -154,6 +154,7 @@ def generate(job):
                                 "video": video_base64,
                                 "filename": video['filename'],
                                 "seed": seed,
+                                "plan": plan,
                                 "status": "success"
                             }
             
@@ -164,6 +165,8 @@ def generate(job):
     except Exception as e:
         print(f"Error in generate: {str(e)}")
         return {"error": str(e)}
+    finally:
+        workspace.cleanup()
 
 def create_minimal_flf_workflow():
     """Create a minimal FLF workflow if template is missing"""
@@ -225,4 +228,6 @@ def update_workflow_params(workflow, params):
             node["inputs"]["seed"] = params["seed"]
 
 # RunPod handler
+# Start ComfyUI before the first job arrives
+get_supervisor(COMFYUI_URL, COMFYUI_COMMAND)
 runpod.serverless.start({"handler": generate})
\ No newline at end of file
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Completion tracking against the fake ComfyUI server (fake_comfyui.py).
+
+Runs locally without a GPU: each test queues a prompt on a throwaway fake
+server and checks that PromptWatcher returns its history entry through the
+websocket, falls back to polling when the socket is missing or drops,
+surfaces execution errors and honours the timeout, and that its events
+are relayed as progress updates.
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import http_client
+import comfyui_events
+from comfyui_events import PromptWatcher
+from fake_comfyui import FakeComfyUI
+from progress import ProgressReporter, workflow_stages
+
+WORKFLOW = {
+    "1": {"class_type": "LoadImage", "inputs": {"image": "start.png"}},
+    "2": {"class_type": "VHS_VideoCombine", "inputs": {"images": ["1", 0]}},
+}
+
+
+def queue(server, client_id):
+    response = http_client.post(f"{server.url}/prompt", "prompt", json={"prompt": WORKFLOW, "client_id": client_id})
+    response.raise_for_status()
+    return response.json()["prompt_id"]
+
+
+def test_websocket_completion():
+    """Completion arrives over the socket with a single /history read"""
+    if comfyui_events.websocket is None:
+        print("⚠️  websocket-client not installed, skipping")
+        return
+    with FakeComfyUI(run_time=0.3) as server, PromptWatcher(server.url) as watcher:
+        prompt_id = queue(server, watcher.client_id)
+        entry = watcher.wait(prompt_id, timeout=10)
+        assert entry is not None and set(entry["outputs"]) == {"1", "2"}, entry
+        assert watcher.mode == "websocket", watcher.mode
+        assert server.history_requests == 1, server.history_requests
+    print("✅ websocket completion read /history once")
+
+
+def test_execution_error():
+    """An execution_error fails the wait with the node's message"""
+    for use_websocket in (True, False):
+        with FakeComfyUI(run_time=0.1, fail=True) as server, \
+                PromptWatcher(server.url, use_websocket=use_websocket) as watcher:
+            prompt_id = queue(server, watcher.client_id)
+            try:
+                watcher.wait(prompt_id, timeout=10)
+            except RuntimeError as e:
+                assert "Allocation on device" in str(e), e
+            else:
+                raise AssertionError("failed prompt did not raise")
+    print("✅ execution errors raise over websocket and polling")
+
+
+def test_socket_drop_falls_back():
+    """A socket closed mid-job falls back to polling and still completes"""
+    with FakeComfyUI(run_time=0.5, drop_websocket=True) as server, PromptWatcher(server.url) as watcher:
+        prompt_id = queue(server, watcher.client_id)
+        entry = watcher.wait(prompt_id, timeout=10)
+        assert entry is not None and entry["outputs"], entry
+        assert watcher.mode == "polling", watcher.mode
+    print("✅ dropped websocket fell back to polling")
+
+
+def test_no_websocket_endpoint():
+    """Servers (or proxies) without /ws are polled"""
+    with FakeComfyUI(run_time=0.3, websocket=False) as server, PromptWatcher(server.url) as watcher:
+        assert watcher.ws is None
+        prompt_id = queue(server, watcher.client_id)
+        entry = watcher.wait(prompt_id, timeout=10)
+        assert entry is not None and entry["outputs"], entry
+        assert watcher.mode == "polling", watcher.mode
+    print("✅ missing websocket endpoint fell back to polling")
+
+
+def test_timeout():
+    """wait() gives up at the timeout in both modes"""
+    for use_websocket in (True, False):
+        with FakeComfyUI(run_time=5) as server, PromptWatcher(server.url, use_websocket=use_websocket) as watcher:
+            prompt_id = queue(server, watcher.client_id)
+            start = time.monotonic()
+            assert watcher.wait(prompt_id, timeout=0.5) is None
+            elapsed = time.monotonic() - start
+            assert elapsed < 2.0, elapsed
+    print("✅ wait() timed out on schedule")
+
+
+def test_progress_relay():
+    """Websocket events become stage/step progress updates"""
+    if comfyui_events.websocket is None:
+        print("⚠️  websocket-client not installed, skipping")
+        return
+    workflow = {
+        "1": {"class_type": "WanFirstLastFrameToVideo", "inputs": {}},
+        "2": {"class_type": "KSamplerAdvanced", "inputs": {"steps": 8, "start_at_step": 0, "end_at_step": 4}},
+        "3": {"class_type": "KSamplerAdvanced", "inputs": {"steps": 8, "start_at_step": 4, "end_at_step": 10000}},
+        "4": {"class_type": "VAEDecode", "inputs": {}},
+        "5": {"class_type": "VHS_VideoCombine", "inputs": {}},
+    }
+    stages, node_stages = workflow_stages(workflow)
+    assert [name for name, _ in stages] == ["prepare", "high_noise", "low_noise", "decode", "encode"], stages
+    updates = []
+    progress = ProgressReporter({"id": "test"}, stages, 1000, send=lambda job, update: updates.append(update),
+                                interval=0)
+    progress.stage("prepare")
+    with FakeComfyUI(run_time=0.5) as server, \
+            PromptWatcher(server.url, on_event=progress.relay(node_stages)) as watcher:
+        response = http_client.post(f"{server.url}/prompt", "prompt",
+                                    json={"prompt": workflow, "client_id": watcher.client_id})
+        assert watcher.wait(response.json()["prompt_id"], timeout=10) is not None
+    stage_times = progress.finish()
+
+    seen = [update["stage"] for update in updates]
+    assert seen == sorted(seen, key=[name for name, _ in stages].index), seen
+    assert set(seen) == set(stage_times) == {"prepare", "high_noise", "low_noise", "decode", "encode"}, seen
+    low = [update for update in updates if update["stage"] == "low_noise" and update.get("step")]
+    assert low[-1]["step"] == low[-1]["steps"] == 4, low
+    assert low[-1]["eta"] is not None and 0 < low[-1]["percent"] <= 100, low[-1]
+    print(f"✅ {len(updates)} progress updates: {' -> '.join(dict.fromkeys(seen))}")
+
+
+if __name__ == "__main__":
+    test_websocket_completion()
+    test_execution_error()
+    test_socket_drop_falls_back()
+    test_no_websocket_endpoint()
+    test_timeout()
+    test_progress_relay()
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Stress test for running many FLF jobs in one container at the same time.
+
+test_workspace_isolation runs locally and checks that parallel jobs get
+separate scratch directories that are always cleaned up.
+test_image_cache runs locally against a throwaway HTTP server and checks
+that parallel jobs asking for the same image URL download it only once.
+test_parallel_jobs submits concurrent jobs to the local RunPod API.
+"""
+
+import os
+import sys
+import time
+import tempfile
+import threading
+import pytest
+import requests
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from workspace import JobWorkspace, active_usage
+from image_cache import ImageCache
+
+def test_workspace_isolation(jobs=64):
+    """Run many fake handler invocations in parallel against one scratch root"""
+    with tempfile.TemporaryDirectory() as root:
+        barrier = threading.Barrier(jobs)
+
+        def fake_handler(index):
+            workspace = JobWorkspace("same-job-id", root=root)
+            try:
+                payload = f"job-{index}".encode() * 1024
+                path = workspace.file("start_image.png")
+                with open(path, 'wb') as f:
+                    f.write(payload)
+                # Make every job hold its files at the same moment
+                barrier.wait(timeout=30)
+                with open(path, 'rb') as f:
+                    assert f.read() == payload, f"job {index} read another job's file"
+                if index % 2:
+                    raise RuntimeError("simulated job failure")
+                return workspace.disk_usage()
+            except RuntimeError:
+                return None
+            finally:
+                workspace.cleanup()
+
+        with ThreadPoolExecutor(max_workers=jobs) as pool:
+            usages = list(pool.map(fake_handler, range(jobs)))
+
+        assert all(usage and usage >= 1024 for usage in usages[::2]), usages
+        assert os.listdir(root) == [], f"workspaces left behind: {os.listdir(root)}"
+        assert active_usage()["active_workspaces"] == 0
+
+    print(f"✅ {jobs} parallel workspaces isolated and cleaned up")
+
+def test_image_cache(jobs=32):
+    """Many jobs fetch the same URL at once; only one request reaches the server"""
+    requests_served = []
+    payload = os.urandom(64 * 1024)
+
+    class ImageServer(BaseHTTPRequestHandler):
+        def do_GET(self):
+            requests_served.append(self.path)
+            if self.headers.get("If-None-Match") == '"v1"':
+                self.send_response(304)
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header("ETag", '"v1"')
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), ImageServer)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/start.png"
+
+    try:
+        with tempfile.TemporaryDirectory() as root:
+            cache = ImageCache(os.path.join(root, "cache"), max_bytes=10 * 2**20, ttl=3600)
+
+            def fake_handler(index):
+                data, status = cache.read(url)
+                assert data == payload, f"job {index} got a corrupted image"
+                return status
+
+            with ThreadPoolExecutor(max_workers=jobs) as pool:
+                statuses = list(pool.map(fake_handler, range(jobs)))
+
+            assert len(requests_served) == 1, f"{len(requests_served)} downloads for one URL"
+            assert statuses.count("miss") == 1 and statuses.count("hit") == jobs - 1, statuses
+
+            # An expired entry is revalidated with the stored ETag instead of re-downloaded
+            cache.ttl = 0
+            assert cache.read(url) == (payload, "revalidated")
+            assert len(requests_served) == 2
+            stats = cache.stats()
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    print(f"✅ {jobs} parallel jobs shared one download: {stats}")
+
+def test_parallel_jobs(jobs=4):
+    """Submit several FLF jobs at once to the local RunPod API"""
+    api_url = os.getenv("API_URL", "http://localhost:8081")
+    payload = {
+        "input": {
+            "start_image": "girl1.jpg",
+            "end_image": "girl2.jpg",
+            "positive_prompt": "smooth morphing transition between two faces",
+            "negative_prompt": "static, blurry, low quality",
+            "width": 480,
+            "height": 480,
+            "length": 17,
+            "seed": 42,
+            "fps": 16
+        }
+    }
+
+    try:
+        requests.get(f"{api_url}/health", timeout=5)
+    except requests.exceptions.RequestException:
+        pytest.skip(f"API server not responding at {api_url}")
+
+    def run_job(index):
+        response = requests.post(f"{api_url}/run", json=payload, timeout=30)
+        response.raise_for_status()
+        job_id = response.json()["id"]
+        while True:
+            time.sleep(2)
+            status = requests.get(f"{api_url}/status/{job_id}", timeout=30).json()
+            if status.get("status") in ("COMPLETED", "FAILED"):
+                return status
+
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        results = list(pool.map(run_job, range(jobs)))
+
+    failed = [r for r in results if r.get("status") != "COMPLETED" or r.get("output", {}).get("status") == "failed"]
+    print(f"{jobs - len(failed)}/{jobs} jobs completed in {time.time() - start:.1f}s")
+    assert not failed, f"Failed jobs: {failed}"
+
+if __name__ == "__main__":
+    test_workspace_isolation()
+    test_image_cache()
+    try:
+        test_parallel_jobs()
+    except pytest.skip.Exception as e:
+        print(f"⚠️  {e}, skipping")
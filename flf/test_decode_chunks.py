@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Temporal VAE decode windows (video_io.decode_chunks), without a GPU.
+
+A stand-in decode maps latent frames to images the way the WAN VAE does
+(1 image for the first latent frame, 4 for every later one), so only the
+indexing is checked here, not how closely windowed frames match a
+whole-clip decode of the real, stateful VAE (rapid-i2v/misc/bench_decode.py
+measures that, along with peak memory).
+
+Checks that a window splits a single video into several chunks, so the
+encoder thread gets frames while later windows are still decoding, that
+the windows add up to the whole clip, and that settings which would lose
+frames are rejected.
+"""
+
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from video_io import (VAE_DECODE_WINDOW, VAE_TEMPORAL_COMPRESSION, decode_chunks, decoded_frame_count,
+                      resolve_decode_window)
+
+
+def fake_decode(samples):
+    """[1,C,T,H,W] latents -> [F,H,W,3] frames, each valued its latent index"""
+    latent = samples["samples"]
+    first = latent[0, 0, :, 0, 0]
+    frames = np.concatenate([first[:1]] + [np.repeat(first[1:], VAE_TEMPORAL_COMPRESSION)])
+    return np.broadcast_to(frames[:, None, None, None], (len(frames), 2, 2, 3))
+
+
+def latents(batch_size, length):
+    """81 pixel frames are 21 latent frames"""
+    latent_frames = (length - 1) // VAE_TEMPORAL_COMPRESSION + 1
+    samples = np.zeros((batch_size, 16, latent_frames, 2, 2), dtype=np.float32)
+    samples[:] = np.arange(latent_frames, dtype=np.float32)[None, None, :, None, None]
+    return {"samples": samples}
+
+
+def test_window_chunks_single_video():
+    """With a window, one video is decoded in several chunks"""
+    samples = latents(1, 81)
+    assert len(list(decode_chunks(fake_decode, samples, 0))) == 1
+    chunks = list(decode_chunks(fake_decode, samples, 8))
+    assert len(chunks) > 1, "window 8 decoded a single video in one chunk"
+    assert all(index == 0 for index, _ in chunks)
+    frames = np.concatenate([frames for _, frames in chunks])
+    assert len(frames) == decoded_frame_count(samples) == 81, len(frames)
+    print(f"✅ single video decoded in {len(chunks)} chunks of {[len(f) for _, f in chunks]} frames")
+
+
+def test_windows_match_whole_decode():
+    """Windowed frames equal the whole-clip decode for every batch item"""
+    samples = latents(2, 49)
+    whole = {index: frames for index, frames in decode_chunks(fake_decode, samples, 0)}
+    for window in (1, 3, 5):
+        windowed = {}
+        for index, frames in decode_chunks(fake_decode, samples, window):
+            windowed.setdefault(index, []).append(frames)
+        for index, frames in whole.items():
+            assert np.array_equal(np.concatenate(windowed[index]), frames), (window, index)
+    print("✅ windowed decode matches the whole-clip decode")
+
+
+def test_bad_settings_rejected():
+    """Windows that are not non-negative ints, and windowing without overlap, fail up front"""
+    for window in ("8", 8.0, -1, True):
+        try:
+            resolve_decode_window(window)
+        except ValueError as e:
+            assert "vae_decode_window" in str(e), e
+        else:
+            raise AssertionError(f"window {window!r} accepted")
+    assert resolve_decode_window(None) == VAE_DECODE_WINDOW and resolve_decode_window(0, overlap=0) == 0
+    try:
+        next(decode_chunks(fake_decode, latents(1, 81), 8, overlap=0))
+    except ValueError as e:
+        assert "VAE_DECODE_OVERLAP" in str(e), e
+    else:
+        raise AssertionError("overlap 0 accepted")
+    print("✅ bad decode window and overlap rejected")
+
+
+if __name__ == "__main__":
+    test_window_chunks_single_video()
+    test_windows_match_whole_decode()
+    test_bad_settings_rejected()
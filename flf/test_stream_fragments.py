@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""
+Fragment relay of the streaming handlers (video_io.stream_fragments),
+with a stand-in generate() instead of a model.
+
+Checks that fragments arrive in order before the job result, and that a
+generate() that raises fails the stream rather than ending it with an
+empty result.
+"""
+
+import base64
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from video_io import stream_fragments
+
+
+def test_fragments_then_result():
+    """Every fragment is relayed with its index, then the result"""
+    def generate(job, on_fragment):
+        for index in range(3):
+            on_fragment(0, f"piece-{index}".encode())
+        return {"status": "DONE", "jobId": job["id"]}
+
+    messages = list(stream_fragments(generate, {"id": "job-1"}))
+    assert [m["fragment_index"] for m in messages[:-1]] == [0, 1, 2], messages
+    assert base64.b64decode(messages[1]["data"]) == b"piece-1"
+    assert messages[-1] == {"status": "DONE", "jobId": "job-1"}
+    print("✅ fragments relayed before the job result")
+
+
+def test_generate_error_fails_stream():
+    """A failure in generate() reaches the consumer after the fragments already sent"""
+    def generate(job, on_fragment):
+        on_fragment(0, b"init")
+        raise RuntimeError("workspace setup failed")
+
+    stream = stream_fragments(generate, {"id": "job-2"})
+    assert next(stream)["fragment_index"] == 0
+    try:
+        message = next(stream)
+    except RuntimeError as e:
+        assert "workspace setup failed" in str(e), e
+    else:
+        raise AssertionError(f"stream ended with {message} instead of the error")
+    print("✅ generate() error fails the stream")
+
+
+if __name__ == "__main__":
+    test_fragments_then_result()
+    test_generate_error_fails_stream()
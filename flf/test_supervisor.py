@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+ComfyUI supervision against the fake ComfyUI server (fake_comfyui.py).
+
+Runs locally without a GPU: the supervisor starts the fake server as its
+ComfyUI process and the tests check that readiness is served from the
+cached state, that a killed process is restarted once, that a server
+already listening is adopted rather than duplicated, and that a process
+that keeps crashing is restarted with backoff.
+"""
+
+import os
+import socket
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import http_client
+from comfyui_supervisor import ComfyUISupervisor
+from fake_comfyui import FakeComfyUI
+
+FAKE_COMFYUI = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fake_comfyui.py")
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def fake_command(port):
+    return [sys.executable, FAKE_COMFYUI, "--port", str(port), "--run-time", "1"]
+
+
+def test_cached_readiness():
+    """wait_ready() answers from the cached state without probing ComfyUI"""
+    port = free_port()
+    supervisor = ComfyUISupervisor(f"http://127.0.0.1:{port}", fake_command(port), interval=5).start()
+    try:
+        assert supervisor.wait_ready(timeout=20), supervisor.state()
+        start = time.monotonic()
+        for _ in range(1000):
+            assert supervisor.wait_ready()
+        elapsed = time.monotonic() - start
+        assert elapsed < 0.1, elapsed
+
+        http_client.post(f"{supervisor.url}/prompt", "prompt", json={"prompt": {"1": {"class_type": "SaveVideo"}}})
+        http_client.post(f"{supervisor.url}/prompt", "prompt", json={"prompt": {"1": {"class_type": "SaveVideo"}}})
+        supervisor.wake.set()
+        time.sleep(0.5)
+        state = supervisor.state()
+        assert (state["queue_running"], state["queue_pending"]) == (1, 1), state
+    finally:
+        supervisor.stop(terminate=True)
+    print(f"✅ 1000 readiness checks in {elapsed * 1000:.1f} ms")
+
+
+def test_restart_on_death():
+    """A killed ComfyUI process is restarted once and becomes ready again"""
+    port = free_port()
+    supervisor = ComfyUISupervisor(f"http://127.0.0.1:{port}", fake_command(port), interval=0.2,
+                                   backoff=0.2).start()
+    try:
+        assert supervisor.wait_ready(timeout=20), supervisor.state()
+        first_pid = supervisor.process.pid
+        supervisor.process.kill()
+        deadline = time.monotonic() + 20
+        while supervisor.restarts == 0 and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert supervisor.wait_ready(timeout=20), supervisor.state()
+        assert supervisor.restarts == 1 and supervisor.process.pid != first_pid, supervisor.state()
+    finally:
+        supervisor.stop(terminate=True)
+    print("✅ killed ComfyUI was restarted once")
+
+
+def test_adopts_running_server():
+    """A server already listening is monitored, not started a second time"""
+    with FakeComfyUI(run_time=0.1) as server:
+        supervisor = ComfyUISupervisor(server.url, fake_command(server.server_port), interval=0.2).start()
+        try:
+            assert supervisor.wait_ready(timeout=5), supervisor.state()
+            assert supervisor.process is None, supervisor.state()
+        finally:
+            supervisor.stop()
+    print("✅ running server adopted without a duplicate")
+
+
+def test_crash_loop_backoff():
+    """A process that keeps exiting is restarted with growing delays"""
+    port = free_port()
+    command = [sys.executable, "-c", "import sys; sys.exit(1)"]
+    supervisor = ComfyUISupervisor(f"http://127.0.0.1:{port}", command, interval=0.05, backoff=0.1).start()
+    try:
+        assert not supervisor.wait_ready(timeout=1.6)
+        # Delays 0.1, 0.2, 0.4, 0.8: about four restarts, not one per probe
+        assert 2 <= supervisor.restarts <= 5, supervisor.state()
+    finally:
+        supervisor.stop(terminate=True)
+    print(f"✅ crashing ComfyUI restarted {supervisor.restarts} times in 1.6s")
+
+
+if __name__ == "__main__":
+    test_cached_readiness()
+    test_restart_on_death()
+    test_adopts_running_server()
+    test_crash_loop_backoff()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Content-hash upload dedupe against the fake ComfyUI server (fake_comfyui.py).
+
+Runs locally without a GPU: checks that a repeated image is uploaded once
+per backend, that concurrent jobs share one upload, and that an entry is
+re-uploaded once the server no longer has the file.
+"""
+
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import http_client
+from fake_comfyui import FakeComfyUI
+from upload_index import UploadIndex, content_name
+
+IMAGE = os.urandom(64 * 1024)
+
+
+def uploader(server):
+    def upload(data, name):
+        response = http_client.post(f"{server.url}/upload/image", "upload",
+                                    files={"image": (name, data, "image/png")}, data={"overwrite": "true"},
+                                    idempotent=True)
+        response.raise_for_status()
+        return response.json()
+    return upload
+
+
+def test_repeat_upload_skipped():
+    """A repeated image costs no upload bytes; another backend gets its own copy"""
+    with FakeComfyUI() as first, FakeComfyUI() as second:
+        indexes = {server: UploadIndex(server.url) for server in (first, second)}
+        name = indexes[first].ensure(IMAGE, uploader(first))
+        assert name == content_name(IMAGE) and name in first.inputs, name
+        sent = first.upload_bytes
+        for _ in range(3):
+            assert indexes[first].ensure(IMAGE, uploader(first)) == name
+        assert first.upload_bytes == sent, first.upload_bytes
+        assert indexes[first].stats["hits"] == 3 and indexes[first].stats["bytes_uploaded"] == len(IMAGE)
+
+        assert second.upload_bytes == 0
+        indexes[second].ensure(IMAGE, uploader(second))
+        assert name in second.inputs and second.upload_bytes > 0
+    print(f"✅ repeated image sent once per backend, {sent} bytes")
+
+
+def test_concurrent_jobs_share_upload():
+    """Jobs uploading the same image at once send it once"""
+    with FakeComfyUI() as server:
+        index = UploadIndex(server.url)
+        threads = [threading.Thread(target=index.ensure, args=(IMAGE, uploader(server))) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert index.stats["uploads"] == 1 and index.stats["hits"] == 3, index.stats
+    print("✅ concurrent jobs shared one upload")
+
+
+def test_stale_entry_reuploaded():
+    """Old entries are checked with HEAD /view and re-uploaded if the file is gone"""
+    with FakeComfyUI() as server:
+        index = UploadIndex(server.url, verify_after=0)
+        name = index.ensure(IMAGE, uploader(server))
+        index.ensure(IMAGE, uploader(server))
+        assert index.stats["verified"] == 1 and index.stats["uploads"] == 1, index.stats
+        server.inputs.pop(name)
+        index.ensure(IMAGE, uploader(server))
+        assert index.stats["uploads"] == 2 and name in server.inputs, index.stats
+    print("✅ stale entry verified, missing file re-uploaded")
+
+
+if __name__ == "__main__":
+    test_repeat_upload_skipped()
+    test_concurrent_jobs_share_upload()
+    test_stale_entry_reuploaded()
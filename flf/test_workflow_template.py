@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Workflow templates (workflow_template.py), without ComfyUI.
+
+Checks that broken graphs and slots fail when the template is built, that
+rendering copies only the bound nodes and leaves the template untouched,
+and that slots are inferred from the API-format FLF workflow.
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from workflow_template import OMIT, WorkflowTemplate, load_template
+
+WORKFLOW = {
+    "6": {"class_type": "CLIPTextEncode", "inputs": {"text": "", "clip": ["38", 0]}},
+    "38": {"class_type": "CLIPLoader", "inputs": {"clip_name": "umt5.safetensors", "type": "wan"}},
+    "61": {"class_type": "VHS_VideoCombine", "inputs": {"images": ["6", 0], "format": "video/h264-mp4", "crf": 19}},
+}
+SLOTS = {"prompt": [("6", "text")], "format": [("61", "format")], "crf": [("61", "crf")]}
+API_WORKFLOW = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "comfyui_workflow",
+                            "wan22_flf2v_workflow.json")
+
+
+def expect_error(build, text):
+    try:
+        build()
+    except ValueError as e:
+        assert text in str(e), e
+    else:
+        raise AssertionError(f"no error mentioning {text!r}")
+
+
+def test_invalid_templates_fail_at_build():
+    """Wrong node ids, inputs and links are reported when the template is built"""
+    expect_error(lambda: WorkflowTemplate(WORKFLOW, {"prompt": [("7", "text")]}), "missing node 7")
+    expect_error(lambda: WorkflowTemplate(WORKFLOW, {"prompt": [("6", "txt")]}), "has no input txt")
+    expect_error(lambda: WorkflowTemplate(WORKFLOW, {"clip": [("6", "clip")]}), "is a link")
+    broken = dict(WORKFLOW, **{"8": {"class_type": "VAEDecode", "inputs": {"samples": ["58", 0]}}})
+    expect_error(lambda: WorkflowTemplate(broken, SLOTS), "links to missing node 58")
+    template = WorkflowTemplate(WORKFLOW, SLOTS)
+    expect_error(lambda: template.render(seed=1), "Unknown slots")
+    expect_error(lambda: template.check_classes({"CLIPTextEncode": {"input": {"required": {"text": [], "clip": []}},
+                                                                    "output": ["CONDITIONING"]}}),
+                 "no node class CLIPLoader")
+    print("✅ bad node ids, inputs and links fail at build time")
+
+
+def test_render_copies_bound_nodes_only():
+    """Rendered graphs share unbound nodes and never change the template"""
+    template = WorkflowTemplate(WORKFLOW, SLOTS)
+    graph = template.render({"prompt": "a cat"}, crf=OMIT)
+    assert graph["6"]["inputs"] == {"text": "a cat", "clip": ["38", 0]}, graph["6"]
+    assert "crf" not in graph["61"]["inputs"] and graph["61"]["inputs"]["format"] == "video/h264-mp4"
+    assert graph["38"] is template.nodes["38"]
+    assert template.nodes["6"]["inputs"]["text"] == "" and template.nodes["61"]["inputs"]["crf"] == 19
+    assert template.render() == template.nodes
+    print("✅ render copies only bound nodes")
+
+
+def test_inferred_slots():
+    """Slots of the API-format FLF workflow are found from classes and links"""
+    template = load_template(API_WORKFLOW)
+    assert template.slots["positive_prompt"] == [("6", "text")], template.slots
+    assert template.slots["start_image"] == [("68", "image")] and template.slots["end_image"] == [("62", "image")]
+    assert template.slots["width"] == [("67", "width")] and template.slots["seed"] == [("57", "noise_seed")]
+    print(f"✅ inferred slots: {', '.join(template.slots)}")
+
+
+if __name__ == "__main__":
+    test_invalid_templates_fail_at_build()
+    test_render_copies_bound_nodes_only()
+    test_inferred_slots()
@@ -0,0 +1,116 @@
+"""
+Content-addressed uploads to ComfyUI's input directory.
+
+Input images are uploaded as `sha256-<digest>.png`, so identical bytes
+always map to one name. Concurrent jobs can share a name safely because
+the name fixes the content. An UploadIndex remembers which of those names
+one ComfyUI backend already holds, and a hit skips the upload, so a job
+that reuses earlier assets sends no image bytes at all.
+
+Each backend (server URL) has its own index, since one server holding a
+file says nothing about another. Entries older than UPLOAD_VERIFY_AFTER
+seconds are confirmed with a HEAD /view?type=input before they are trusted
+again, in case the input directory was cleaned. That costs a round trip
+but still no upload.
+
+    name = get_index(COMFYUI_URL).ensure(data, lambda data, name: upload_image(data, name))
+"""
+import hashlib
+import os
+import threading
+import time
+
+import requests
+
+import http_client
+
+# Seconds an index entry is trusted before ComfyUI is asked whether it still has the file
+UPLOAD_VERIFY_AFTER = float(os.getenv("UPLOAD_VERIFY_AFTER", "600"))
+
+
+def content_name(data, ext=".png"):
+    """Upload name for image bytes: their SHA-256 digest."""
+    return f"sha256-{hashlib.sha256(data).hexdigest()}{ext}"
+
+
+class UploadIndex:
+    """
+    Names one ComfyUI backend holds in its input directory, with when each
+    was last uploaded or confirmed.
+    """
+
+    def __init__(self, server_url, verify_after=None):
+        self.server_url = server_url.rstrip('/')
+        self.verify_after = UPLOAD_VERIFY_AFTER if verify_after is None else verify_after
+        self.entries = {}
+        self.lock = threading.Lock()
+        # name -> lock held while it is checked or uploaded, so concurrent jobs upload it once
+        self.name_locks = {}
+        self.stats = {"uploads": 0, "hits": 0, "verified": 0, "bytes_uploaded": 0, "bytes_skipped": 0}
+
+    def _name_lock(self, name):
+        with self.lock:
+            return self.name_locks.setdefault(name, threading.Lock())
+
+    def _count(self, **counters):
+        with self.lock:
+            for counter, value in counters.items():
+                self.stats[counter] += value
+
+    def exists(self, name, timeout=None):
+        """Whether ComfyUI still has `name` in its input directory."""
+        try:
+            response = http_client.request("HEAD", f"{self.server_url}/view", "system_stats", timeout=timeout,
+                                           retries=0, params={"filename": name, "type": "input"})
+        except requests.exceptions.RequestException as e:
+            print(f"Could not check uploaded image {name}: {e}")
+            return False
+        return response.status_code == 200
+
+    def ensure(self, data, upload, timeout=None, ext=".png"):
+        """
+        Make sure ComfyUI holds `data` and return its name, calling
+        upload(data, name) only when it does not have it yet.
+        """
+        name = content_name(data, ext)
+        with self._name_lock(name):
+            confirmed = self.entries.get(name)
+            if confirmed is not None:
+                fresh = time.monotonic() - confirmed < self.verify_after
+                if fresh or self.exists(name, timeout):
+                    if not fresh:
+                        self._count(verified=1)
+                        self.entries[name] = time.monotonic()
+                    self._count(hits=1, bytes_skipped=len(data))
+                    print(f"Image {name} already on ComfyUI, skipped upload")
+                    return name
+                self.entries.pop(name, None)
+            upload(data, name)
+            self.entries[name] = time.monotonic()
+            self._count(uploads=1, bytes_uploaded=len(data))
+        return name
+
+    def forget(self):
+        """Drop every entry, e.g. after the backend's input directory was wiped."""
+        with self.lock:
+            self.entries.clear()
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_index(server_url):
+    """The process-wide UploadIndex of one ComfyUI backend."""
+    key = server_url.rstrip('/')
+    with _indexes_lock:
+        if key not in _indexes:
+            _indexes[key] = UploadIndex(key)
+        return _indexes[key]
+
+
+def upload_stats():
+    """Upload counters per backend."""
+    with _indexes_lock:
+        indexes = list(_indexes.values())
+    return {index.server_url: dict(index.stats, held=len(index.entries)) for index in indexes}
@@ -9,50 +9,69 @@ import json
 import time
 import random
 import base64
-import requests
 import subprocess
-import tempfile
 from typing import Dict, Any
 
 import runpod
 
+import http_client
+from video_io import get_output_preset, preset_ffmpeg_args
+from workspace import JobWorkspace
+from assets import prepare_frames, remaining, validate_image
+from image_source import resolve_image
+from resolution_plan import plan_generation, describe_plan
+from comfyui_supervisor import get_supervisor
+from upload_index import get_index, upload_stats
+
 # ComfyUI API
 COMFYUI_URL = os.getenv("COMFYUI_URL", "http://127.0.0.1:8188")
+COMFYUI_COMMAND = ["python", "/comfyui/main.py", "--disable-auto-launch", "--listen", "--port", "8188"]
 
 def check_server():
-    """Check if ComfyUI server is running"""
-    try:
-        response = requests.get(f"{COMFYUI_URL}/system_stats", timeout=5)
-        return response.status_code == 200
-    except:
-        return False
+    """Check if ComfyUI server is running; the supervisor starts it once and restarts it if it dies"""
+    return get_supervisor(COMFYUI_URL, COMFYUI_COMMAND).wait_ready()
 
-def upload_image(image_data, filename):
+def upload_image(image_data, filename, timeout=None):
     """Upload image to ComfyUI"""
     files = {"image": (filename, image_data, "image/png")}
-    response = requests.post(f"{COMFYUI_URL}/upload/image", files=files)
+    # Overwrite so a content-named file keeps its name instead of getting a "(1)" suffix
+    data = {"overwrite": "true"}
+    response = http_client.post(f"{COMFYUI_URL}/upload/image", "upload", files=files, data=data, timeout=timeout,
+                                idempotent=True)
+    response.raise_for_status()
     return response.json()
 
+def prepare_frame(name, image_data, deadline):
+    """Fetch, validate and upload one input frame; returns its ComfyUI name"""
+    # Data URI, URL, bare base64 or path, kept in memory until it is uploaded
+    data = resolve_image(image_data, timeout=remaining(deadline)).data
+    width, height = validate_image(data, f"{name} image")
+    print(f"Validated {name} image: {width}x{height}")
+    # Named by content hash, so concurrent jobs can't overwrite each other's
+    # inputs and a frame this ComfyUI already holds is not sent again
+    return get_index(COMFYUI_URL).ensure(
+        data, lambda data, filename: upload_image(data, filename, timeout=remaining(deadline)),
+        timeout=remaining(deadline)
+    )
+
 def queue_prompt(workflow):
     """Queue workflow to ComfyUI"""
-    response = requests.post(f"{COMFYUI_URL}/prompt", json={"prompt": workflow})
+    response = http_client.post(f"{COMFYUI_URL}/prompt", "prompt", json={"prompt": workflow})
     return response.json()
 
 def get_history(prompt_id):
     """Get workflow execution history"""
-    response = requests.get(f"{COMFYUI_URL}/history/{prompt_id}")
+    response = http_client.get(f"{COMFYUI_URL}/history/{prompt_id}", "history")
     return response.json()
 
-def frames_to_video_in_container(frame_pattern, output_path, fps=24):
+def frames_to_video_in_container(frame_pattern, output_path, fps=24, preset=None):
     """Convert frames to video using ffmpeg IN CONTAINER"""
     cmd = [
         "ffmpeg", "-y",
         "-framerate", str(fps),
         "-pattern_type", "sequence",
         "-i", frame_pattern,
-        "-c:v", "libx264",
-        "-pix_fmt", "yuv420p",
-        "-crf", "19",
+        *preset_ffmpeg_args(preset),
         output_path
     ]
     
@@ -66,6 +85,7 @@ def handler(job: Dict[str, Any]) -> Dict[str, Any]:
     """RunPod handler - all processing in container"""
     
     start_time = time.time()
+    workspace = JobWorkspace(job.get("id"))
     
     try:
         job_input = job.get("input", {})
@@ -80,44 +100,22 @@ def handler(job: Dict[str, Any]) -> Dict[str, Any]:
         length = job_input.get("length", 49)  # frames
         fps = job_input.get("fps", 24)
         seed = job_input.get("seed", random.randint(0, 2**32-1))
+        output_preset = job_input.get("output_preset")
+        output_ext = get_output_preset(output_preset)["ext"]
+        # Snap size and length to the model's buckets within this GPU's budget
+        plan = plan_generation("wan2.2-flf", width, height, length)
+        width, height, length = plan["width"], plan["height"], plan["length"]
+        print(f"Resolution plan: {describe_plan(plan)}")
         
         # Ensure ComfyUI is running
         if not check_server():
-            # Start ComfyUI in container
-            subprocess.Popen([
-                "python", "/comfyui/main.py",
-                "--disable-auto-launch",
-                "--listen", "--port", "8188"
-            ])
-            
-            # Wait for startup
-            for _ in range(30):
-                if check_server():
-                    break
-                time.sleep(1)
-            else:
-                raise RuntimeError("ComfyUI failed to start")
+            raise RuntimeError("ComfyUI failed to start")
         
-        # Handle image inputs (base64 decode if needed)
-        if start_image_data.startswith("data:"):
-            start_image_data = base64.b64decode(start_image_data.split(",")[1])
-        elif start_image_data.startswith("http"):
-            response = requests.get(start_image_data)
-            start_image_data = response.content
-        else:
-            start_image_data = base64.b64decode(start_image_data)
-        
-        if end_image_data.startswith("data:"):
-            end_image_data = base64.b64decode(end_image_data.split(",")[1])
-        elif end_image_data.startswith("http"):
-            response = requests.get(end_image_data)
-            end_image_data = response.content
-        else:
-            end_image_data = base64.b64decode(end_image_data)
-        
-        # Upload images to ComfyUI
-        start_upload = upload_image(start_image_data, "start.png")
-        end_upload = upload_image(end_image_data, "end.png")
+        # Fetch, decode, validate and upload both frames concurrently under one timeout budget
+        (start_name, end_name), asset_time = prepare_frames(
+            prepare_frame,
+            [("start", start_image_data), ("end", end_image_data)]
+        )
         
         # FLF workflow with GGUF quantized model
         workflow = {
@@ -126,11 +124,11 @@ def handler(job: Dict[str, Any]) -> Dict[str, Any]:
                 "class_type": "CheckpointLoaderSimple"
             },
             "2": {
-                "inputs": {"image": start_upload["name"], "upload": "image"},
+                "inputs": {"image": start_name, "upload": "image"},
                 "class_type": "LoadImage"
             },
             "3": {
-                "inputs": {"image": end_upload["name"], "upload": "image"},
+                "inputs": {"image": end_name, "upload": "image"},
                 "class_type": "LoadImage"
             },
             "4": {
@@ -180,7 +178,7 @@ def handler(job: Dict[str, Any]) -> Dict[str, Any]:
         workflow["9"] = {
             "inputs": {
                 "images": ["8", 0],
-                "filename_prefix": f"flf_{seed}"
+                "filename_prefix": f"flf_{seed}_{workspace.token}"
             },
             "class_type": "SaveImage"
         }
@@ -194,7 +192,7 @@ def handler(job: Dict[str, Any]) -> Dict[str, Any]:
             workflow["9"] = {
                 "inputs": {
                     "images": ["8", 0],
-                    "filename_prefix": f"flf_{seed}"
+                    "filename_prefix": f"flf_{seed}_{workspace.token}"
                 },
                 "class_type": "SaveImage"
             }
@@ -227,6 +225,9 @@ def handler(job: Dict[str, Any]) -> Dict[str, Any]:
                             "format": "mp4",
                             "seed": seed,
                             "execution_time": time.time() - start_time,
+                            "asset_time": asset_time,
+                            "plan": plan,
+                            "uploads": upload_stats(),
                             "status": "success"
                         }
                 
@@ -240,23 +241,27 @@ def handler(job: Dict[str, Any]) -> Dict[str, Any]:
                             frame_pattern = f"/comfyui/output/{first_frame.replace('00001', '%05d')}"
                             
                             # Create video IN CONTAINER
-                            with tempfile.NamedTemporaryFile(suffix=".mp4", delete=False) as tmp:
-                                video_path = tmp.name
+                            video_path = workspace.file(f"flf_{seed}.{output_ext}")
                             
-                            frames_to_video_in_container(frame_pattern, video_path, fps)
+                            encode_start = time.time()
+                            frames_to_video_in_container(frame_pattern, video_path, fps, output_preset)
+                            encode_time = round(time.time() - encode_start, 2)
                             
                             # Read and encode video
                             with open(video_path, "rb") as f:
-                                video_base64 = base64.b64encode(f.read()).decode()
-                            
-                            # Clean up
-                            os.unlink(video_path)
+                                video_data = f.read()
+                                video_base64 = base64.b64encode(video_data).decode()
                             
                             return {
                                 "video": video_base64,
-                                "format": "mp4",
+                                "format": output_ext,
                                 "seed": seed,
                                 "execution_time": time.time() - start_time,
+                                "asset_time": asset_time,
+                                "plan": plan,
+                                "encode_time": encode_time,
+                                "output_size": len(video_data),
+                                "uploads": upload_stats(),
                                 "status": "success",
                                 "note": "converted from frames in container"
                             }
@@ -273,6 +278,10 @@ def handler(job: Dict[str, Any]) -> Dict[str, Any]:
             "execution_time": time.time() - start_time,
             "status": "failed"
         }
+    finally:
+        workspace.cleanup()
 
 if __name__ == "__main__":
+    # Start ComfyUI before the first job arrives
+    get_supervisor(COMFYUI_URL, COMFYUI_COMMAND)
     runpod.serverless.start({"handler": handler})
\ No newline at end of file
@@ -1,6 +1,5 @@
-import os, json, requests, random, time, cv2, ffmpeg, runpod
+import os, json, shutil, random, time, runpod
 from moviepy.video.io.VideoFileClip import VideoFileClip
-from urllib.parse import urlsplit
 
 import sys
 sys.path.append('/content/ComfyUI')
@@ -8,6 +7,17 @@ sys.path.append('/content/ComfyUI')
 import torch
 import numpy as np
 
+from workspace import JobWorkspace
+from image_cache import cache_stats
+from image_source import resolve_image
+from image_prep import load_input_image, decode_cache_stats
+from resolution_plan import plan_generation, describe_plan
+from assets import prepare_frames, remaining
+from video_io import (decode_chunks, decoded_frame_count, images_to_videos, interpolation_stats, stream_fragments,
+                      resolve_decode_window, get_output_preset, DEFAULT_OUTPUT_PRESET)
+from interpolation import FrameInterpolator
+from progress import ProgressReporter
+
 from nodes import NODE_CLASS_MAPPINGS
 from comfy_extras import nodes_wan, nodes_model_advanced
 
@@ -15,7 +25,6 @@ from comfy_extras import nodes_wan, nodes_model_advanced
 UNETLoader = NODE_CLASS_MAPPINGS["UNETLoader"]()
 CLIPLoader = NODE_CLASS_MAPPINGS["CLIPLoader"]()
 VAELoader = NODE_CLASS_MAPPINGS["VAELoader"]()
-LoadImage = NODE_CLASS_MAPPINGS["LoadImage"]()
 CLIPTextEncode = NODE_CLASS_MAPPINGS["CLIPTextEncode"]()
 WanFirstLastFrameToVideo = nodes_wan.NODE_CLASS_MAPPINGS["WanFirstLastFrameToVideo"]()
 KSamplerAdvanced = NODE_CLASS_MAPPINGS["KSamplerAdvanced"]()
@@ -34,72 +43,26 @@ with torch.inference_mode():
     # Load VAE
     vae = VAELoader.load_vae("wan_2.1_vae.safetensors")[0]
 
-def get_input_image_path(input_image):
-    """
-    Get the path to the input image.
-    Supports both URLs and local file paths.
-    """
-    # Check if it's a local file path
-    if not input_image.startswith(('http://', 'https://')):
-        # Assume it's a local file path relative to /content/ComfyUI/input/
-        local_path = f"/content/ComfyUI/input/{input_image}"
-        if os.path.exists(local_path):
-            print(f"Using local image: {local_path}")
-            return local_path
-        else:
-            # Check if it's an absolute path
-            if os.path.exists(input_image):
-                print(f"Using absolute path image: {input_image}")
-                return input_image
-            else:
-                raise FileNotFoundError(f"Local image not found: {input_image}")
-    
-    # It's a URL, download it
-    print(f"Downloading image from URL: {input_image}")
-    os.makedirs("/content/ComfyUI/input", exist_ok=True)
-    file_suffix = os.path.splitext(urlsplit(input_image).path)[1]
-    if not file_suffix:
-        file_suffix = '.jpg'  # Default extension
-    file_name_with_suffix = f"downloaded_image{file_suffix}"
-    file_path = os.path.join("/content/ComfyUI/input", file_name_with_suffix)
-    
-    response = requests.get(input_image)
-    response.raise_for_status()
-    with open(file_path, 'wb') as file:
-        file.write(response.content)
-    print(f"Image downloaded to: {file_path}")
-    return file_path
-
-def images_to_mp4(images, output_path, fps=24):
-    try:
-        frames = []
-        for image in images:
-            i = 255. * image.cpu().numpy()
-            img = np.clip(i, 0, 255).astype(np.uint8)
-            if img.shape[0] in [1, 3, 4]:
-                img = np.transpose(img, (1, 2, 0))
-            if img.shape[-1] == 4:
-                img = img[:, :, :3]
-            frames.append(img)
-        temp_files = [f"temp_{i:04d}.png" for i in range(len(frames))]
-        for i, frame in enumerate(frames):
-            success = cv2.imwrite(temp_files[i], frame[:, :, ::-1])
-            if not success:
-                raise ValueError(f"Failed to write {temp_files[i]}")
-        if not os.path.exists(temp_files[0]):
-            raise FileNotFoundError("Temporary PNG files were not created")
-        stream = ffmpeg.input('temp_%04d.png', framerate=fps)
-        stream = ffmpeg.output(stream, output_path, vcodec='libx264', pix_fmt='yuv420p')
-        ffmpeg.run(stream, overwrite_output=True)
-        for temp_file in temp_files:
-            os.remove(temp_file)
-    except Exception as e:
-        print(f"Error: {e}")
+# Relative input image paths are looked up here
+INPUT_DIR = "/content/ComfyUI/input"
+
+def prepare_frame(image, width, height, deadline):
+    """Resolve one frame (URL, data URI, base64 or path) and decode it in memory to width x height"""
+    source = resolve_image(image, [INPUT_DIR], timeout=remaining(deadline))
+    tensor, info = load_input_image(source.data, width, height)
+    return tensor, {**source.describe(), **info}
+
+# Stream fragmented MP4 pieces from a generator handler instead of returning once done
+STREAM_OUTPUT = os.getenv("STREAM_OUTPUT", "false").lower() == "true"
+
+def vae_decode(samples):
+    return VAEDecode.decode(vae, samples)[0].detach()
 
 @torch.inference_mode()
-def generate(input):
+def generate(input, on_fragment=None):
     # Start timing the entire generation process
     start_time = time.time()
+    workspace = JobWorkspace(input.get('id'))
     
     try:
         values = input["input"]
@@ -107,8 +70,6 @@ def generate(input):
         # FLF-specific parameters
         start_image = values['start_image']
         end_image = values['end_image']
-        start_image_path = get_input_image_path(start_image)
-        end_image_path = get_input_image_path(end_image)
         
         positive_prompt = values['positive_prompt']
         negative_prompt = values['negative_prompt']
@@ -116,6 +77,19 @@ def generate(input):
         height = values['height']
         length = values['length']
         batch_size = values.get('batch_size', 1)
+        # Snap size and length to the model's buckets within this GPU's budget
+        plan = plan_generation("wan2.2-flf", width, height, length, batch_size)
+        width, height, length = plan['width'], plan['height'], plan['length']
+        print(f"Resolution plan: {describe_plan(plan)}")
+        progress = ProgressReporter(input, [("prepare", 0), ("high_noise", 10), ("low_noise", 10), ("decode", 0), ("encode", 0)],
+                                    plan['pixel_frames'])
+        progress.stage("prepare")
+        # Download and decode both frames concurrently under one timeout budget,
+        # straight to width x height (reduced-size JPEG decode, cached by content)
+        ((start_img, start_info), (end_img, end_info)), asset_time = prepare_frames(
+            lambda name, image, deadline: prepare_frame(image, width, height, deadline),
+            [("start", start_image), ("end", end_image)]
+        )
         shift = values.get('shift', 8.0)
         cfg = values.get('cfg', 4.0)
         seed = values['seed']
@@ -123,6 +97,16 @@ def generate(input):
             random.seed(int(time.time()))
             seed = random.randint(0, 18446744073709551615)
         fps = values.get('fps', 24)
+        output_preset = values.get('output_preset')
+        output_ext = get_output_preset(output_preset)['ext']
+        encoder_backend = values.get('encoder_backend')
+        interpolate = int(values.get('interpolate', 1))
+        interpolation_method = values.get('interpolation_method')
+        # Reject bad interpolation and decode settings before spending time on sampling
+        FrameInterpolator(interpolate, interpolation_method)
+        decode_window = resolve_decode_window(values.get('vae_decode_window'))
+        if on_fragment is not None and output_ext != "mp4":
+            raise ValueError(f"Streaming output needs an mp4 output preset, got {output_preset}")
 
         # Apply model sampling to both high and low noise models
         model_high = ModelSamplingSD3.patch(unet_high, shift)[0]
@@ -132,10 +116,6 @@ def generate(input):
         positive = CLIPTextEncode.encode(clip, positive_prompt)[0]
         negative = CLIPTextEncode.encode(clip, negative_prompt)[0]
 
-        # Load start and end images
-        start_img = LoadImage.load_image(start_image_path)[0]
-        end_img = LoadImage.load_image(end_image_path)[0]
-
         # Use WanFirstLastFrameToVideo for FLF processing
         positive, negative, out_latent = WanFirstLastFrameToVideo.encode(
             positive, negative, vae, width, height, length, batch_size,
@@ -143,25 +123,41 @@ def generate(input):
         )
         
         # Dual-stage sampling: First with high noise model (steps 0-10)
-        intermediate_samples = KSamplerAdvanced.sample(
-            model_high, seed, 20, cfg, "euler", "simple",
-            positive, negative, out_latent,
-            add_noise="enable", noise_seed=seed, start_at_step=0, end_at_step=10, return_with_leftover_noise="enable"
-        )[0]
+        with progress.sampling("high_noise"):
+            intermediate_samples = KSamplerAdvanced.sample(
+                model_high, seed, 20, cfg, "euler", "simple",
+                positive, negative, out_latent,
+                add_noise="enable", noise_seed=seed, start_at_step=0, end_at_step=10, return_with_leftover_noise="enable"
+            )[0]
         
         # Second stage with low noise model (steps 10-20)
-        out_samples = KSamplerAdvanced.sample(
-            model_low, seed, 20, cfg, "euler", "simple",
-            positive, negative, intermediate_samples,
-            add_noise="disable", noise_seed=seed, start_at_step=10, end_at_step=10000, return_with_leftover_noise="disable"
-        )[0]
+        with progress.sampling("low_noise"):
+            out_samples = KSamplerAdvanced.sample(
+                model_low, seed, 20, cfg, "euler", "simple",
+                positive, negative, intermediate_samples,
+                add_noise="disable", noise_seed=seed, start_at_step=10, end_at_step=10000, return_with_leftover_noise="disable"
+            )[0]
 
-        decoded_images = VAEDecode.decode(vae, out_samples)[0].detach()
-        
         # Create output directory and save video locally
         os.makedirs("/content/ComfyUI/output", exist_ok=True)
-        result = f"/content/ComfyUI/output/wan2.2-flf-{seed}-local.mp4"
-        images_to_mp4(decoded_images, result, fps)
+        if torch.cuda.is_available():
+            torch.cuda.reset_peak_memory_stats()
+        # One video per batch item, encoded inside the job workspace and only
+        # moved into the output directory once finished
+        batch_count = out_samples["samples"].shape[0]
+        suffixes = [""] if batch_count == 1 else [f"-{i}" for i in range(batch_count)]
+        result_paths = [f"/content/ComfyUI/output/wan2.2-flf-{seed}{suffix}-local.{output_ext}" for suffix in suffixes]
+        scratch_paths = [workspace.file(path) for path in result_paths]
+        encode_stats = images_to_videos(progress.track(decode_chunks(vae_decode, out_samples, decode_window)), scratch_paths, fps, output_preset, encoder_backend,
+                                        decoded_frame_count(out_samples), values.get('parallel_encode', "auto"),
+                                        interpolate, interpolation_method, on_fragment)
+        scratch_bytes = workspace.disk_usage()
+        videos = []
+        for batch_index, (scratch_path, result_path, stats) in enumerate(zip(scratch_paths, result_paths, encode_stats)):
+            shutil.move(scratch_path, result_path)
+            videos.append({"result": result_path, "seed": seed, "batch_index": batch_index, **interpolation_stats(stats)})
+        decode_peak_memory_mb = round(torch.cuda.max_memory_allocated() / 2**20) if torch.cuda.is_available() else None
+        stage_times = progress.finish()
         
         job_id = values.get('job_id', f'flf-job-{seed}')
         
@@ -171,10 +167,23 @@ def generate(input):
         # Return local file path with execution time
         return {
             "jobId": job_id,
-            "result": result,
+            "result": result_paths[0],
             "status": "DONE",
             "message": "FLF video saved locally",
-            "execution_time": execution_time
+            "execution_time": execution_time,
+            "asset_time": asset_time,
+            "plan": plan,
+            "stage_times": stage_times,
+            "vae_decode_window": decode_window,
+            "decode_peak_memory_mb": decode_peak_memory_mb,
+            "output_preset": output_preset or DEFAULT_OUTPUT_PRESET,
+            "interpolate": interpolate,
+            "output_fps": fps * interpolate,
+            "videos": videos,
+            "scratch_bytes": scratch_bytes,
+            "input_images": [start_info, end_info],
+            "image_cache": cache_stats(),
+            "decode_cache": decode_cache_stats()
         }
     except Exception as e:
         job_id = values.get('job_id', 'unknown-flf-job') if 'values' in locals() else 'unknown-flf-job'
@@ -186,5 +195,17 @@ def generate(input):
             "status": "FAILED",
             "execution_time": execution_time
         }
+    finally:
+        workspace.cleanup()
+
+def generate_stream(input):
+    """
+    Streaming handler (STREAM_OUTPUT=true). Yields every fragmented MP4 piece
+    as soon as it is encoded, then the job result (see stream_fragments).
+    """
+    yield from stream_fragments(generate, input)
 
-runpod.serverless.start({"handler": generate})
\ No newline at end of file
+if STREAM_OUTPUT:
+    runpod.serverless.start({"handler": generate_stream, "return_aggregate_stream": True})
+else:
+    runpod.serverless.start({"handler": generate})
\ No newline at end of file
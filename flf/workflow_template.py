@@ -0,0 +1,207 @@
+"""
+Precompiled ComfyUI workflow templates with named parameter slots.
+
+A WorkflowTemplate wraps an API-format workflow ({node_id: {"class_type",
+"inputs"}}) that is loaded and checked once, at startup:
+
+- every node has a class_type and an inputs dict,
+- every link [node_id, output] points at an existing node,
+- every slot names a node input that holds a value rather than a link,
+- once ComfyUI's /object_info is at hand (check_classes()), every class
+  exists, has its required inputs and the outputs its links use.
+
+render() then builds a job's graph by copying only the nodes that bound
+slots touch. Every other node is shared with the template, so a graph
+costs O(slots) instead of a rebuilt or deep-copied dict, and rendered
+graphs must be treated as read-only (they are only sent to /prompt).
+
+Slots map a name to the (node_id, input) fields it sets. Binding a slot to
+OMIT leaves its fields out of the graph, for inputs that only some
+settings take:
+
+    template = WorkflowTemplate(workflow, {"seed": [("57", "noise_seed")], "prompt": [("6", "text")]})
+    graph = template.render(seed=7, prompt="a cat walking")
+
+infer_slots() finds the usual slots of a WAN video workflow from its node
+classes and links, for workflow files that come without a slot map.
+"""
+import copy
+import json
+import os
+
+# Slot value that removes the slot's inputs from a rendered graph
+OMIT = object()
+
+
+def _is_link(value):
+    return isinstance(value, list) and len(value) == 2 and isinstance(value[0], str) and isinstance(value[1], int)
+
+
+def validate_workflow(workflow):
+    """Structural problems of an API-format workflow, as a list of messages."""
+    if not isinstance(workflow, dict) or not workflow:
+        return ["workflow must be a non-empty object"]
+    if "nodes" in workflow and "links" in workflow:
+        return ["this is a UI-format workflow; export it with 'Save (API Format)'"]
+    errors = []
+    for node_id, node in workflow.items():
+        if not isinstance(node, dict) or not isinstance(node.get("class_type"), str) or not node["class_type"]:
+            errors.append(f"node {node_id} has no class_type")
+            continue
+        if not isinstance(node.get("inputs"), dict):
+            errors.append(f"node {node_id} ({node['class_type']}) has no inputs")
+            continue
+        for input_name, value in node["inputs"].items():
+            if _is_link(value) and value[0] not in workflow:
+                errors.append(f"node {node_id}.{input_name} links to missing node {value[0]}")
+    return errors
+
+
+class WorkflowTemplate:
+    """
+    An API-format workflow checked once, with named slots bound per job.
+
+    slots maps each slot name to a list of (node_id, input) fields. Raises
+    ValueError listing every problem when the workflow or a slot is invalid.
+    """
+
+    def __init__(self, workflow, slots, name="workflow"):
+        self.name = name
+        # Private copy: the template must not change when the caller's dict does
+        self.nodes = copy.deepcopy(workflow)
+        self.slots = {slot: [tuple(field) for field in fields] for slot, fields in slots.items()}
+        self.classes_checked = False
+
+        errors = validate_workflow(self.nodes)
+        if not errors:
+            errors = self._slot_errors()
+        if errors:
+            raise ValueError(f"Invalid {name}: " + "; ".join(errors))
+
+        # node_id -> [(input, slot)], so render() visits only bound nodes
+        self.bindings = {}
+        for slot, fields in self.slots.items():
+            for node_id, input_name in fields:
+                self.bindings.setdefault(node_id, []).append((input_name, slot))
+
+    def _slot_errors(self):
+        errors = []
+        for slot, fields in self.slots.items():
+            if not fields:
+                errors.append(f"slot {slot} sets no fields")
+            for node_id, input_name in fields:
+                node = self.nodes.get(node_id)
+                if node is None:
+                    errors.append(f"slot {slot} names missing node {node_id}")
+                elif input_name not in node["inputs"]:
+                    errors.append(f"slot {slot}: node {node_id} ({node['class_type']}) has no input {input_name}")
+                elif _is_link(node["inputs"][input_name]):
+                    errors.append(f"slot {slot}: node {node_id}.{input_name} is a link, not a value")
+        return errors
+
+    def check_classes(self, object_info):
+        """
+        Check node classes, required inputs and link outputs against
+        ComfyUI's /object_info; raises ValueError on any mismatch.
+        """
+        errors = []
+        for node_id, node in self.nodes.items():
+            info = object_info.get(node["class_type"])
+            if info is None:
+                errors.append(f"node {node_id}: ComfyUI has no node class {node['class_type']}")
+                continue
+            for input_name in info.get("input", {}).get("required", {}):
+                if input_name not in node["inputs"]:
+                    errors.append(f"node {node_id} ({node['class_type']}) is missing required input {input_name}")
+            for input_name, value in node["inputs"].items():
+                if not _is_link(value):
+                    continue
+                source = object_info.get(self.nodes[value[0]]["class_type"])
+                if source is not None and value[1] >= len(source.get("output", [])):
+                    errors.append(f"node {node_id}.{input_name} uses output {value[1]} of node {value[0]}, "
+                                  f"which has {len(source.get('output', []))}")
+        if errors:
+            raise ValueError(f"Invalid {self.name}: " + "; ".join(errors))
+        self.classes_checked = True
+
+    def defaults(self):
+        """Each slot's value in the template itself."""
+        return {slot: self.nodes[fields[0][0]]["inputs"][fields[0][1]] for slot, fields in self.slots.items()}
+
+    def render(self, values=None, **more):
+        """
+        A job's graph with the given slot values; unbound slots keep the
+        template's value. Only nodes touched by a bound slot are copied.
+        """
+        values = {**values, **more} if values else more
+        if not self.slots.keys() >= values.keys():
+            unknown = sorted(values.keys() - self.slots.keys())
+            raise ValueError(f"Unknown slots for {self.name}: {', '.join(unknown)}")
+        graph = self.nodes.copy()
+        for node_id, fields in self.bindings.items():
+            inputs = None
+            for input_name, slot in fields:
+                if slot not in values:
+                    continue
+                if inputs is None:
+                    inputs = graph[node_id]["inputs"].copy()
+                value = values[slot]
+                if value is OMIT:
+                    inputs.pop(input_name, None)
+                else:
+                    inputs[input_name] = value
+            if inputs is not None:
+                graph[node_id] = {**graph[node_id], "inputs": inputs}
+        return graph
+
+
+_SIZE_INPUTS = ("width", "height", "length")
+_SAVE_CLASSES = ("SaveVideo", "SaveImage", "SaveAnimatedWEBP", "VHS_VideoCombine")
+
+
+def infer_slots(workflow):
+    """
+    Slots of a WAN image/text-to-video workflow, found from node classes
+    and links: positive_prompt, negative_prompt, start_image, end_image,
+    image, width, height, length, seed and filename_prefix, where present.
+    """
+    slots = {}
+
+    def add(slot, node_id, input_name):
+        slots.setdefault(slot, []).append((node_id, input_name))
+
+    for node_id, node in workflow.items():
+        class_type, inputs = node.get("class_type"), node.get("inputs", {})
+        for input_name, value in inputs.items():
+            if not _is_link(value) or value[0] not in workflow:
+                continue
+            source = workflow[value[0]]
+            if source.get("class_type") == "CLIPTextEncode" and input_name in ("positive", "negative"):
+                if (value[0], "text") not in slots.get(f"{input_name}_prompt", []):
+                    add(f"{input_name}_prompt", value[0], "text")
+            elif source.get("class_type") == "LoadImage" and input_name in ("start_image", "end_image", "image"):
+                if (value[0], "image") not in slots.get(input_name, []):
+                    add(input_name, value[0], "image")
+        # The latent or video conditioning node sizes the output; image resize nodes are left alone
+        if class_type.endswith("ToVideo") or "Latent" in class_type:
+            for input_name in _SIZE_INPUTS:
+                if input_name in inputs and not _is_link(inputs[input_name]):
+                    add(input_name, node_id, input_name)
+        if class_type == "KSampler" and "seed" in inputs:
+            add("seed", node_id, "seed")
+        elif class_type == "KSamplerAdvanced" and inputs.get("add_noise") == "enable":
+            add("seed", node_id, "noise_seed")
+        elif class_type == "RandomNoise" and "noise_seed" in inputs:
+            add("seed", node_id, "noise_seed")
+        if class_type in _SAVE_CLASSES and "filename_prefix" in inputs:
+            add("filename_prefix", node_id, "filename_prefix")
+    return slots
+
+
+def load_template(path, slots=None):
+    """WorkflowTemplate for an API-format workflow file; slots default to infer_slots()."""
+    with open(path, 'r') as f:
+        workflow = json.load(f)
+    if slots is None and not validate_workflow(workflow):
+        slots = infer_slots(workflow)
+    return WorkflowTemplate(workflow, slots or {}, name=os.path.basename(path))
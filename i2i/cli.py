@@ -9,76 +9,32 @@ import json
 import argparse
 import requests
 import time
-from PIL import Image
+from image_probe import probe_image_size
+from resolution_plan import plan_generation, GPU_CLASS, DEFAULT_GPU_CLASS
 from urllib.parse import urlparse
 
 def get_image_dimensions(image_path):
-    """Get dimensions of an image from URL or local path."""
+    """Get dimensions of an image from URL or local path, reading only its header."""
     try:
-        if image_path.startswith(('http://', 'https://')):
-            # Download image temporarily to get dimensions
-            response = requests.get(image_path, stream=True)
-            response.raise_for_status()
-            img = Image.open(response.raw)
-        else:
-            # Local file
-            if not os.path.isabs(image_path):
-                # Check in input directory first
-                input_path = os.path.join("..", "input", image_path)
-                if os.path.exists(input_path):
-                    image_path = input_path
-            img = Image.open(image_path)
-        
-        return img.width, img.height
+        if not image_path.startswith(('http://', 'https://')) and not os.path.isabs(image_path):
+            # Check in input directory first
+            input_path = os.path.join("..", "input", image_path)
+            if os.path.exists(input_path):
+                image_path = input_path
+        # Range request / header parse, cached locally; no full image transfer
+        return probe_image_size(image_path)
     except Exception as e:
         print(f"Warning: Could not read image dimensions: {e}")
         return None, None
 
-def calculate_optimal_resolution(orig_width, orig_height, max_pixels=576*576):
+def calculate_optimal_resolution(orig_width, orig_height):
     """
-    Calculate optimal resolution maintaining aspect ratio while staying within VRAM limits.
-    For static images, we can use slightly higher resolutions than video.
+    Bucket resolution the server will plan for an image of this size (see
+    resolution_plan.py), for the GPU class in GPU_CLASS (default 24gb).
+    Raises ValueError when the length does not fit that class at all.
     """
-    aspect_ratio = orig_width / orig_height
-    
-    # Define safe resolution limits based on aspect ratio
-    if aspect_ratio > 1.5:  # Wide/horizontal image
-        # Maximum safe: 768x512
-        target_width = 768
-        target_height = 512
-    elif aspect_ratio < 0.67:  # Tall/vertical image  
-        # Maximum safe: 512x768
-        target_width = 512
-        target_height = 768
-    else:  # Near square or moderate aspect ratio
-        # Maximum safe: 640x640 for reliability
-        if orig_width * orig_height > max_pixels:
-            # Scale down to fit within max_pixels
-            scale = (max_pixels / (orig_width * orig_height)) ** 0.5
-            target_width = int(orig_width * scale)
-            target_height = int(orig_height * scale)
-        else:
-            target_width = orig_width
-            target_height = orig_height
-    
-    # Ensure dimensions are multiples of 8 (required by model)
-    target_width = (target_width // 8) * 8
-    target_height = (target_height // 8) * 8
-    
-    # Final safety check - ensure we don't exceed 768 in any dimension
-    if target_width > 768:
-        scale = 768 / target_width
-        target_width = 768
-        target_height = int(target_height * scale)
-        target_height = (target_height // 8) * 8
-    
-    if target_height > 768:
-        scale = 768 / target_height
-        target_height = 768
-        target_width = int(target_width * scale)
-        target_width = (target_width // 8) * 8
-    
-    return target_width, target_height
+    plan = plan_generation("wan2.2-ti2v-5b-image", orig_width, orig_height, gpu_class=GPU_CLASS or DEFAULT_GPU_CLASS)
+    return plan["width"], plan["height"]
 
 def main():
     # Parse command line arguments
@@ -113,7 +69,11 @@ def main():
     if not is_t2i and args.auto_resize and (args.width is None or args.height is None):
         orig_width, orig_height = get_image_dimensions(input_image)
         if orig_width and orig_height:
-            auto_width, auto_height = calculate_optimal_resolution(orig_width, orig_height)
+            try:
+                auto_width, auto_height = calculate_optimal_resolution(orig_width, orig_height)
+            except ValueError as e:
+                # A length too long for the GPU class is a usage error, not a traceback
+                parser.error(str(e))
             if args.width is None:
                 args.width = auto_width
             if args.height is None:
@@ -126,8 +86,8 @@ def main():
             "positive_prompt": args.positive_prompt or os.getenv("POSITIVE_PROMPT", "A beautiful artistic rendition"),
             "negative_prompt": args.negative_prompt or os.getenv("NEGATIVE_PROMPT", "blurry, low quality"),
             "crop": args.crop or os.getenv("CROP", "center"),
-            "width": args.width or int(os.getenv("WIDTH", "576")),
-            "height": args.height or int(os.getenv("HEIGHT", "576")),
+            "width": args.width or int(os.getenv("WIDTH", "640")),
+            "height": args.height or int(os.getenv("HEIGHT", "640")),
             "batch_size": args.batch_size or int(os.getenv("BATCH_SIZE", "1")),
             "shift": args.shift or float(os.getenv("SHIFT", "8.0")),
             "cfg": args.cfg or float(os.getenv("CFG", "1.0")),
@@ -204,6 +164,9 @@ def main():
         print(f"Total Time (including network): {total_time:.2f} seconds")
         if 'message' in result:
             print(f"Message: {result['message']}")
+        # e.g. the server moved the job to a smaller tier to fit its GPU
+        for warning in (result.get('plan') or {}).get('warnings', []):
+            print(f"⚠️ {warning}")
             
     except requests.exceptions.RequestException as e:
         print(f"\nL API Error: {str(e)}")
@@ -0,0 +1,118 @@
+"""
+One resolver for every way a job can pass an input image.
+
+resolve_image() accepts an http(s) URL, a data URI, a bare base64 string or
+a local path and returns the image bytes in memory as an ImageInput. The
+bytes go straight to a ComfyUI upload or a PIL decode; nothing is written
+to the job's scratch directory unless a node can only take a filename
+(ImageInput.as_file). URLs are read through the shared image cache.
+"""
+import base64
+import binascii
+import io
+import os
+
+from PIL import Image
+
+from image_cache import read_image
+
+# Leading bytes -> file suffix, for the few cases that need a file name
+_SIGNATURES = (
+    (b"\x89PNG\r\n\x1a\n", ".png"),
+    (b"\xff\xd8", ".jpg"),
+    (b"GIF8", ".gif"),
+    (b"RIFF", ".webp"),
+    (b"BM", ".bmp"),
+)
+
+
+class ImageInput:
+    """
+    Bytes of one input image plus where they came from.
+
+    `data` is a memoryview; `kind` is "url", "data_uri", "base64" or "path".
+    `path` is set when the image already is a file on disk and
+    `cache_status` when it was read through the image cache.
+    """
+
+    def __init__(self, data, kind, path=None, cache_status=None):
+        self.data = memoryview(data)
+        self.kind = kind
+        self.path = path
+        self.cache_status = cache_status
+
+    @property
+    def suffix(self):
+        header = self.data[:8].tobytes()
+        for signature, suffix in _SIGNATURES:
+            if header.startswith(signature):
+                return suffix
+        return ".png"
+
+    def open(self):
+        """PIL image decoded from memory."""
+        return Image.open(io.BytesIO(self.data))
+
+    def as_file(self, workspace, name="input"):
+        """
+        Path of a file holding the image, for nodes that only take file
+        names. Local files are used in place; anything else is written to
+        the job's workspace.
+        """
+        if self.path:
+            return self.path
+        path = workspace.file(f"{name}{self.suffix}")
+        with open(path, 'wb') as f:
+            f.write(self.data)
+        return path
+
+    def describe(self):
+        """Summary for job results and logs."""
+        info = {"kind": self.kind, "bytes": self.data.nbytes}
+        if self.cache_status:
+            info["cache"] = self.cache_status
+        return info
+
+
+def _decode_base64(text, kind):
+    try:
+        return ImageInput(base64.b64decode(text), kind)
+    except binascii.Error as e:
+        raise ValueError(f"Invalid base64 image data: {e}") from e
+
+
+def resolve_image(source, search_dirs=(), timeout=None):
+    """
+    Resolve an input image reference to an ImageInput.
+
+    Relative paths are looked up in each of search_dirs, then as given.
+    A string that is neither a URL, a data URI nor an existing file is
+    decoded as base64. Raises FileNotFoundError for a path-like string that
+    does not exist and ValueError for data that is not valid base64.
+    """
+    if source.startswith(('http://', 'https://')):
+        data, status = read_image(source, timeout)
+        print(f"Read image from URL: {source} ({len(data)} bytes, cache {status})")
+        return ImageInput(data, "url", cache_status=status)
+
+    if source.startswith("data:"):
+        header, separator, payload = source.partition(",")
+        if not separator or not header.endswith(";base64"):
+            raise ValueError("Image data URIs must be base64 encoded")
+        return _decode_base64(payload, "data_uri")
+
+    for directory in search_dirs:
+        path = os.path.join(directory, source)
+        if os.path.isfile(path):
+            break
+    else:
+        path = source
+    if os.path.isfile(path):
+        print(f"Using local image: {path}")
+        with open(path, 'rb') as f:
+            return ImageInput(f.read(), "path", path=path)
+
+    # Short strings with a file extension are missing files, not base64
+    if len(source) < 256 and os.path.splitext(source)[1]:
+        raise FileNotFoundError(f"Local image not found: {source}")
+    return _decode_base64(source, "base64")
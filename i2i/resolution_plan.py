@@ -0,0 +1,163 @@
+"""
+Resolution and length planning shared by the workers and the CLIs.
+
+Each model has a fixed set of resolution buckets, grouped in tiers from small
+to large, with one bucket per aspect ("wide", "vertical", "square"). A job's
+requested size is snapped to the bucket closest in aspect ratio, in the
+largest tier that is no bigger than the request and fits the GPU's budget.
+Length is snapped to a valid latent frame count (4n+1 for the WAN VAE).
+
+Budgets are in pixel-frames (width * height * length * batch_size) per GPU
+class, so long clips drop to a smaller tier instead of running out of
+memory. A job is only moved to a smaller tier when the GPU class is known
+(GPU_CLASS, or detected from the CUDA device); the drop is reported in the
+plan's "warnings". When the class is unknown, for example in a handler that
+talks to ComfyUI over HTTP and cannot see the GPU, sizes are snapped but
+never cut for budget. Sticking to a few fixed shapes also lets compiled
+kernels and cached tensors be reused between jobs. Every plan is returned
+as a dict that the workers include in their results.
+"""
+import math
+import os
+
+try:
+    import torch
+except ImportError:
+    torch = None
+
+MODELS = {
+    # WAN2.2 I2V 14B (rapid AIO, fp8)
+    "wan2.2-i2v": {
+        "tiers": {
+            "480p": {"wide": (720, 480), "vertical": (480, 720), "square": (576, 576)},
+            "720p": {"wide": (1280, 720), "vertical": (720, 1280), "square": (960, 960)},
+        },
+        "temporal_compression": 4,
+        "max_length": 121,
+        "budgets": {"24gb": 28_000_000, "48gb": 75_000_000, "80gb": 112_000_000},
+    },
+    # WAN2.2 first-last-frame, 14B high/low noise (fp8)
+    "wan2.2-flf": {
+        "tiers": {
+            "480p": {"wide": (720, 480), "vertical": (480, 720), "square": (576, 576)},
+            "720p": {"wide": (1280, 720), "vertical": (720, 1280), "square": (960, 960)},
+        },
+        "temporal_compression": 4,
+        "max_length": 121,
+        "budgets": {"24gb": 28_000_000, "48gb": 75_000_000, "80gb": 112_000_000},
+    },
+    # WAN2.2 TI2V 5B used for single images (16x VAE, so sides are multiples of 32)
+    "wan2.2-ti2v-5b-image": {
+        "tiers": {
+            "sd": {"wide": (768, 512), "vertical": (512, 768), "square": (640, 640)},
+            "hd": {"wide": (1280, 704), "vertical": (704, 1280), "square": (1024, 1024)},
+        },
+        "temporal_compression": 4,
+        "max_length": 1,
+        "budgets": {"24gb": 1_100_000, "48gb": 2_100_000, "80gb": 4_200_000},
+    },
+}
+
+# GPU classes by total VRAM in GiB, largest first
+GPU_CLASSES = [("80gb", 70), ("48gb", 40), ("24gb", 0)]
+# Class the CLIs plan auto-detected sizes for when GPU_CLASS is unset
+DEFAULT_GPU_CLASS = "24gb"
+# Force a GPU class instead of detecting it (e.g. for the CLIs or shared GPUs)
+GPU_CLASS = os.getenv("GPU_CLASS")
+# With false, requested sizes are only checked and reported, not snapped
+ENFORCE_BUCKETS = os.getenv("ENFORCE_BUCKETS", "true").lower() == "true"
+
+
+def detect_gpu_class(vram_bytes=None):
+    """
+    GPU class from GPU_CLASS, the given VRAM size or the first CUDA device;
+    None when none of them is available.
+    """
+    if GPU_CLASS:
+        return GPU_CLASS
+    if vram_bytes is None and torch is not None and torch.cuda.is_available():
+        vram_bytes = torch.cuda.get_device_properties(0).total_memory
+    if vram_bytes is None:
+        return None
+    for name, min_gib in GPU_CLASSES:
+        if vram_bytes >= min_gib * 2**30:
+            return name
+    return GPU_CLASSES[-1][0]
+
+
+def snap_length(length, model):
+    """Nearest valid frame count (1 + temporal_compression * n) within the model's limit."""
+    config = MODELS[model]
+    step = config["temporal_compression"]
+    length = 1 + step * max(0, round((int(length) - 1) / step))
+    return min(length, config["max_length"])
+
+
+def nearest_bucket(model, width, height, tier):
+    """(aspect, (width, height)) of the bucket in tier closest to width:height."""
+    aspect = math.log(width / height)
+    return min(MODELS[model]["tiers"][tier].items(),
+               key=lambda item: abs(math.log(item[1][0] / item[1][1]) - aspect))
+
+
+def plan_generation(model, width, height, length=1, batch_size=1, gpu_class=None):
+    """
+    Size, length and tier a job will run with.
+
+    Without a known GPU class (gpu_class, GPU_CLASS or a CUDA device) there
+    is no budget: the request is snapped to a bucket but never moved to a
+    smaller tier. Raises ValueError for an unknown model or GPU class, or
+    when even the smallest bucket does not fit the GPU budget at the
+    requested length.
+    """
+    if model not in MODELS:
+        raise ValueError(f"Unknown model {model!r}; expected one of {', '.join(MODELS)}")
+    config = MODELS[model]
+    gpu_class = gpu_class or detect_gpu_class()
+    if gpu_class is not None and gpu_class not in config["budgets"]:
+        raise ValueError(f"Unknown GPU class {gpu_class!r}; expected one of {', '.join(config['budgets'])}")
+    budget = config["budgets"][gpu_class] if gpu_class else None
+    requested = {"width": width, "height": height, "length": length, "batch_size": batch_size}
+    warnings = [] if gpu_class else ["GPU class unknown (set GPU_CLASS); size not checked against a memory budget"]
+    plan = {"model": model, "gpu_class": gpu_class, "budget": budget, "requested": requested,
+            "enforced": ENFORCE_BUCKETS, "warnings": warnings}
+
+    if not ENFORCE_BUCKETS:
+        return {**plan, "tier": None, "aspect": None, "width": width, "height": height, "length": length,
+                "pixel_frames": width * height * length * batch_size}
+
+    length = snap_length(length, model)
+    choice = None
+    over_budget = None
+    for tier in config["tiers"]:
+        aspect, (bucket_width, bucket_height) = nearest_bucket(model, width, height, tier)
+        pixel_frames = bucket_width * bucket_height * length * batch_size
+        # The smallest tier always qualifies; larger ones only up to the requested area
+        if choice is not None and bucket_width * bucket_height > width * height:
+            break
+        if budget is not None and pixel_frames > budget:
+            over_budget = (tier, bucket_width, bucket_height)
+            break
+        choice = (tier, aspect, bucket_width, bucket_height, pixel_frames)
+    if choice is None:
+        _, (bucket_width, bucket_height) = nearest_bucket(model, width, height, next(iter(config["tiers"])))
+        step = config["temporal_compression"]
+        max_length = 1 + step * ((budget // (bucket_width * bucket_height * batch_size) - 1) // step)
+        raise ValueError(f"{length} frames x {batch_size} does not fit the {gpu_class} budget for {model}; "
+                         f"use at most {max_length} frames")
+
+    tier, aspect, width, height, pixel_frames = choice
+    if over_budget is not None:
+        wanted_tier, wanted_width, wanted_height = over_budget
+        warnings.append(f"{wanted_width}x{wanted_height}x{length} ({wanted_tier}) exceeds the {gpu_class} budget; "
+                        f"running at {width}x{height} ({tier})")
+    return {**plan, "tier": tier, "aspect": aspect, "width": width, "height": height, "length": length,
+            "pixel_frames": pixel_frames}
+
+
+def describe_plan(plan):
+    """One-line summary for logs."""
+    requested = plan["requested"]
+    summary = (f"{requested['width']}x{requested['height']}x{requested['length']} -> "
+               f"{plan['width']}x{plan['height']}x{plan['length']} ({plan['tier']} {plan['aspect']}, {plan['gpu_class']})")
+    return "; ".join([summary] + plan.get("warnings", []))
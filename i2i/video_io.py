@@ -0,0 +1,34 @@
+"""
+Frame conversion for the in-process WAN2.2 image workers.
+"""
+import numpy as np
+
+
+def frames_to_uint8(images, rgb=True):
+    """
+    Quantize decoded frames into one contiguous uint8 array of shape [F,H,W,C].
+
+    Accepts the float [F,H,W,C] tensor returned by VAEDecode, or a numpy
+    array. Channel-first and 5D [B,F,...] inputs are normalized first. For
+    tensors the scale, clamp and cast run on the tensor's device, so only
+    the uint8 result is copied to host memory. With rgb=True alpha is
+    dropped and grayscale is expanded to three channels.
+    """
+    if images.ndim == 5:
+        images = images.reshape(-1, *images.shape[2:])
+    if images.ndim == 3:
+        images = images[None]
+    if images.shape[-1] not in (1, 3, 4) and images.shape[1] in (1, 3, 4):
+        images = images.permute(0, 2, 3, 1) if hasattr(images, 'permute') else images.transpose(0, 2, 3, 1)
+    if rgb and images.shape[-1] == 4:
+        images = images[..., :3]
+
+    if hasattr(images, 'detach'):
+        frames = (images.detach() * 255).clamp_(0, 255).byte().cpu().numpy()
+    else:
+        frames = np.clip(np.asarray(images, dtype=np.float32) * 255, 0, 255).astype(np.uint8)
+    frames = np.ascontiguousarray(frames)
+
+    if rgb and frames.shape[-1] == 1:
+        frames = np.repeat(frames, 3, axis=-1)
+    return frames
@@ -1,10 +1,15 @@
-import os, json, requests, random, time, runpod
+import os, json, random, time, runpod
 from PIL import Image
-from urllib.parse import urlsplit
 
 import torch
 import numpy as np
 
+from workspace import JobWorkspace
+from image_cache import cache_stats
+from image_source import resolve_image
+from resolution_plan import plan_generation, describe_plan
+from video_io import frames_to_uint8
+
 from nodes import NODE_CLASS_MAPPINGS
 from comfy_extras import nodes_wan, nodes_flux, nodes_model_sampling
 
@@ -30,51 +35,32 @@ with torch.inference_mode():
     vae = Wan2VAELoader.load_vae("wan2.2_vae.safetensors")[0]
     clip = DualCLIPLoader.load_clip("umt5_xxl_fp8_e4m3fn_scaled.safetensors", "flux", local_files_only=False)[0]
 
-def get_input_image_path(input_image):
-    """Get the path to the input image."""
-    if not input_image.startswith(('http://', 'https://')):
-        local_path = f"/content/ComfyUI/input/{input_image}"
-        if os.path.exists(local_path):
-            print(f"Using local image: {local_path}")
-            return local_path
-        else:
-            if os.path.exists(input_image):
-                print(f"Using absolute path image: {input_image}")
-                return input_image
-            else:
-                raise FileNotFoundError(f"Local image not found: {input_image}")
-    
-    print(f"Downloading image from URL: {input_image}")
-    os.makedirs("/content/ComfyUI/input", exist_ok=True)
-    file_suffix = os.path.splitext(urlsplit(input_image).path)[1]
-    if not file_suffix:
-        file_suffix = '.jpg'
-    file_name_with_suffix = f"downloaded_image{file_suffix}"
-    file_path = os.path.join("/content/ComfyUI/input", file_name_with_suffix)
-    
-    response = requests.get(input_image)
-    response.raise_for_status()
-    with open(file_path, 'wb') as file:
-        file.write(response.content)
-    print(f"Image downloaded to: {file_path}")
-    return file_path
+# Relative input image paths are looked up here
+INPUT_DIR = "/content/ComfyUI/input"
+
+def get_input_image_path(input_image, workspace, name="input"):
+    """
+    Path of the input image (URL, data URI, base64 or local path) for LoadImage.
+    Local files are used in place; other inputs are written to the job workspace.
+    """
+    return resolve_image(input_image, [INPUT_DIR]).as_file(workspace, name)
 
 def save_image(images, output_path):
     """Save the first frame as a static image"""
     try:
-        first_frame = images[0]
-        i = 255. * first_frame.cpu().numpy()
-        img = np.clip(i, 0, 255).astype(np.uint8)
-        
-        if img.shape[0] in [1, 3, 4]:
-            img = np.transpose(img, (1, 2, 0))
+        # Only quantize the first frame of a [F,H,W,C] or [B,F,H,W,C] stack
+        if images.ndim == 5:
+            images = images[:1, :1]
+        elif images.ndim == 4:
+            images = images[:1]
+        img = frames_to_uint8(images, rgb=False)[0]
         
         if img.shape[-1] == 4:
             pil_img = Image.fromarray(img, mode='RGBA')
         elif img.shape[-1] == 3:
             pil_img = Image.fromarray(img, mode='RGB')
-        elif len(img.shape) == 2:
-            pil_img = Image.fromarray(img, mode='L')
+        elif img.shape[-1] == 1:
+            pil_img = Image.fromarray(img[:, :, 0], mode='L')
         else:
             raise ValueError(f"Unexpected image shape: {img.shape}")
         
@@ -88,6 +74,7 @@ def save_image(images, output_path):
 @torch.inference_mode()
 def generate(input):
     start_time = time.time()
+    workspace = JobWorkspace(input.get('id'))
     
     try:
         values = input["input"]
@@ -95,8 +82,12 @@ def generate(input):
         # Common parameters
         positive_prompt = values['positive_prompt']
         negative_prompt = values.get('negative_prompt', '')
-        width = values.get('width', 576)
-        height = values.get('height', 576)
+        width = values.get('width', 640)
+        height = values.get('height', 640)
+        # Snap to the model's image buckets within this GPU's budget
+        plan = plan_generation("wan2.2-ti2v-5b-image", width, height)
+        width, height = plan['width'], plan['height']
+        print(f"Resolution plan: {describe_plan(plan)}")
         seed = values.get('seed', 0)
         if seed == 0:
             random.seed(int(time.time()))
@@ -121,7 +112,7 @@ def generate(input):
             print(f"Resolution: {width}x{height}, Seed: {seed}")
             
             # I2I workflow - encode input image
-            input_image_path = get_input_image_path(input_image_param)
+            input_image_path = get_input_image_path(input_image_param, workspace)
             input_image = LoadImage.load_image(input_image_path)[0]
             latent = VAEEncode.encode(vae, input_image)[0]
         
@@ -159,7 +150,9 @@ def generate(input):
             "result": result,
             "status": "DONE",
             "message": f"{'T2I' if is_t2i else 'I2I'} image generated successfully",
-            "execution_time": execution_time
+            "execution_time": execution_time,
+            "plan": plan,
+            "image_cache": cache_stats()
         }
     except Exception as e:
         job_id = values.get('job_id', 'unknown-job') if 'values' in locals() else 'unknown-job'
@@ -173,5 +166,7 @@ def generate(input):
             "status": "FAILED",
             "execution_time": execution_time
         }
+    finally:
+        workspace.cleanup()
 
 runpod.serverless.start({"handler": generate})
\ No newline at end of file
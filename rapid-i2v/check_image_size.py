@@ -6,6 +6,20 @@ from PIL import Image
 import sys
 import os
 
+from resolution_plan import MODELS, nearest_bucket
+
+SUGGESTION_NAMES = {
+    "wide": "Wide format (16:9)",
+    "vertical": "Vertical format (9:16)",
+    "square": "Square format (1:1)",
+}
+
+def suggest_video_size(width, height, model="wan2.2-i2v"):
+    """Aspect-ratio bucket for an image in the model's largest tier: (video_width, video_height, label)"""
+    largest_tier = list(MODELS[model]["tiers"])[-1]
+    label, (video_width, video_height) = nearest_bucket(model, width, height, largest_tier)
+    return video_width, video_height, label
+
 def get_image_info(image_path):
     """Get image dimensions and suggest video dimensions"""
     try:
@@ -18,15 +32,8 @@ def get_image_info(image_path):
             print(f"Aspect ratio: {aspect_ratio:.3f}")
             
             # Suggest video dimensions based on aspect ratio
-            if aspect_ratio > 1.5:  # Wide image
-                video_width, video_height = 1024, 576  # 16:9-ish
-                print("Suggested: Wide format (16:9)")
-            elif aspect_ratio < 0.8:  # Tall image
-                video_width, video_height = 576, 1024  # 9:16 (vertical)
-                print("Suggested: Vertical format (9:16)")
-            else:  # Square-ish
-                video_width, video_height = 720, 720  # Square
-                print("Suggested: Square format (1:1)")
+            video_width, video_height, label = suggest_video_size(width, height)
+            print(f"Suggested: {SUGGESTION_NAMES[label]}")
                 
             print(f"Video dimensions: {video_width}x{video_height}")
             print("-" * 40)
@@ -8,76 +8,33 @@ import json
 import argparse
 import requests
 import time
-from PIL import Image
+from image_probe import probe_image_size
+from resolution_plan import plan_generation, GPU_CLASS, DEFAULT_GPU_CLASS
+from progress import describe_progress, poll_delay
 from urllib.parse import urlparse
 
 def get_image_dimensions(image_path):
-    """Get dimensions of an image from URL or local path."""
+    """Get dimensions of an image from URL or local path, reading only its header."""
     try:
-        if image_path.startswith(('http://', 'https://')):
-            # Download image temporarily to get dimensions
-            response = requests.get(image_path, stream=True)
-            response.raise_for_status()
-            img = Image.open(response.raw)
-        else:
-            # Local file
-            if not os.path.isabs(image_path):
-                # Check in input directory first
-                input_path = os.path.join("input", image_path)
-                if os.path.exists(input_path):
-                    image_path = input_path
-            img = Image.open(image_path)
-        
-        return img.width, img.height
+        if not image_path.startswith(('http://', 'https://')) and not os.path.isabs(image_path):
+            # Check in input directory first
+            input_path = os.path.join("input", image_path)
+            if os.path.exists(input_path):
+                image_path = input_path
+        # Range request / header parse, cached locally; no full image transfer
+        return probe_image_size(image_path)
     except Exception as e:
         print(f"Warning: Could not read image dimensions: {e}")
         return None, None
 
-def calculate_optimal_resolution(orig_width, orig_height, max_pixels=576*576):
+def calculate_optimal_resolution(orig_width, orig_height, length=53):
     """
-    Calculate optimal resolution maintaining aspect ratio while staying within VRAM limits.
-    Based on CLAUDE.md GPU memory safe resolutions for RTX 3090 24GB.
+    Bucket resolution the server will plan for an image of this size (see
+    resolution_plan.py), for the GPU class in GPU_CLASS (default 24gb).
+    Raises ValueError when the length does not fit that class at all.
     """
-    aspect_ratio = orig_width / orig_height
-    
-    # Define safe resolution limits based on aspect ratio
-    if aspect_ratio > 1.5:  # Wide/horizontal video
-        # Maximum safe: 720x480
-        target_width = 720
-        target_height = 480
-    elif aspect_ratio < 0.67:  # Tall/vertical video  
-        # Maximum safe: 480x720
-        target_width = 480
-        target_height = 720
-    else:  # Near square or moderate aspect ratio
-        # Maximum safe: 576x576 for reliability
-        if orig_width * orig_height > max_pixels:
-            # Scale down to fit within max_pixels
-            scale = (max_pixels / (orig_width * orig_height)) ** 0.5
-            target_width = int(orig_width * scale)
-            target_height = int(orig_height * scale)
-        else:
-            target_width = orig_width
-            target_height = orig_height
-    
-    # Ensure dimensions are multiples of 8 (required by model)
-    target_width = (target_width // 8) * 8
-    target_height = (target_height // 8) * 8
-    
-    # Final safety check - ensure we don't exceed 720 in any dimension
-    if target_width > 720:
-        scale = 720 / target_width
-        target_width = 720
-        target_height = int(target_height * scale)
-        target_height = (target_height // 8) * 8
-    
-    if target_height > 720:
-        scale = 720 / target_height
-        target_height = 720
-        target_width = int(target_width * scale)
-        target_width = (target_width // 8) * 8
-    
-    return target_width, target_height
+    plan = plan_generation("wan2.2-i2v", orig_width, orig_height, length, gpu_class=GPU_CLASS or DEFAULT_GPU_CLASS)
+    return plan["width"], plan["height"]
 
 def main():
     # Parse command line arguments
@@ -111,7 +68,11 @@ def main():
     if args.auto_resize and (args.width is None or args.height is None):
         orig_width, orig_height = get_image_dimensions(input_image)
         if orig_width and orig_height:
-            auto_width, auto_height = calculate_optimal_resolution(orig_width, orig_height)
+            try:
+                auto_width, auto_height = calculate_optimal_resolution(orig_width, orig_height, args.length or int(os.getenv("LENGTH", "53")))
+            except ValueError as e:
+                # A length too long for the GPU class is a usage error, not a traceback
+                parser.error(str(e))
             if args.width is None:
                 args.width = auto_width
             if args.height is None:
@@ -170,9 +131,10 @@ def main():
             print(f"Job ID: {job_id}")
             print("Polling for results...")
             
-            # Poll for results
+            # Poll for results, sooner as the reported ETA runs down
+            delay = 5
             while True:
-                time.sleep(5)
+                time.sleep(delay)
                 status_response = requests.get(f"{args.api_url}/status/{job_id}")
                 if status_response.status_code == 200:
                     status_data = status_response.json()
@@ -185,7 +147,10 @@ def main():
                         result = status_data.get("output", {"status": "FAILED", "message": "Job failed"})
                         break
                     else:
-                        print(f"Status: {status}...")
+                        progress = status_data.get("output")
+                        description = describe_progress(progress)
+                        print(f"Status: {status} - {description}" if description else f"Status: {status}...")
+                        delay = poll_delay(progress)
                 else:
                     print(f"Status check failed: {status_response.status_code}")
         
@@ -199,6 +164,9 @@ def main():
         print(f"Total Time (including network): {total_time:.2f} seconds")
         if 'message' in result:
             print(f"Message: {result['message']}")
+        # e.g. the server moved the job to a smaller tier to fit its GPU
+        for warning in (result.get('plan') or {}).get('warnings', []):
+            print(f"⚠️ {warning}")
             
     except requests.exceptions.RequestException as e:
         print(f"\n❌ API Error: {str(e)}")
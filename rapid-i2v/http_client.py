@@ -0,0 +1,105 @@
+"""
+Shared pooled HTTP client for ComfyUI and asset traffic.
+
+Every call goes through one requests.Session per process, so polling
+/history or /system_stats reuses kept-alive connections instead of paying
+TCP setup each time. Each endpoint has a default timeout (TIMEOUTS), and
+failed calls are retried a bounded number of times with jittered
+exponential backoff. Requests that are not idempotent (e.g. POST /prompt)
+are only retried when the connection was never established, so a retry
+can never queue the same workflow twice.
+"""
+import os
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+# Default timeout in seconds per endpoint: (connect, read)
+TIMEOUTS = {
+    "system_stats": (2, 5),
+    "history": (2, 10),
+    "prompt": (5, 30),
+    "upload": (5, 60),
+    "view": (5, 300),
+    "download": (5, 30),
+    "default": (5, 30),
+}
+HTTP_RETRIES = int(os.getenv("HTTP_RETRIES", "3"))
+HTTP_BACKOFF = float(os.getenv("HTTP_BACKOFF", "0.25"))
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "16"))
+
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+RETRY_STATUSES = {502, 503, 504}
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """The process-wide pooled session, created on first use."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _session = session
+        return _session
+
+
+def _never_sent(error):
+    """True when the request cannot have reached the server."""
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0], "reason", None) if error.args else None
+    return isinstance(reason, NewConnectionError)
+
+
+def backoff_delay(attempt, base=None):
+    """Exponential backoff with full jitter for retry number `attempt` (0-based)."""
+    base = HTTP_BACKOFF if base is None else base
+    return random.uniform(0, base * 2 ** attempt)
+
+
+def request(method, url, endpoint="default", timeout=None, retries=None, idempotent=None, **kwargs):
+    """
+    Send a request on the shared session.
+
+    endpoint picks the default timeout from TIMEOUTS. Idempotent requests are
+    retried on connection errors, timeouts and 502/503/504 responses; others
+    only when the connection could not be opened. Pass idempotent=True for
+    POSTs that are safe to repeat (e.g. an overwriting upload). Request
+    bodies must be bytes or dicts, not open files, so a retry can resend them.
+    """
+    method = method.upper()
+    timeout = timeout if timeout is not None else TIMEOUTS.get(endpoint, TIMEOUTS["default"])
+    retries = HTTP_RETRIES if retries is None else retries
+    idempotent = method in IDEMPOTENT_METHODS if idempotent is None else idempotent
+    session = get_session()
+
+    for attempt in range(retries + 1):
+        try:
+            response = session.request(method, url, timeout=timeout, **kwargs)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            if attempt == retries or not (idempotent or _never_sent(e)):
+                raise
+            print(f"{method} {url} failed ({type(e).__name__}), retrying")
+        else:
+            if response.status_code not in RETRY_STATUSES or not idempotent or attempt == retries:
+                return response
+            response.close()
+            print(f"{method} {url} returned {response.status_code}, retrying")
+        time.sleep(backoff_delay(attempt))
+
+
+def get(url, endpoint="default", **kwargs):
+    return request("GET", url, endpoint, **kwargs)
+
+
+def post(url, endpoint="default", **kwargs):
+    return request("POST", url, endpoint, **kwargs)
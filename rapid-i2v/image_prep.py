@@ -0,0 +1,175 @@
+"""
+Input image preparation for the WAN video workers, used instead of LoadImage.
+
+LoadImage decodes an upload at full resolution (a 4000x3000 phone photo is a
+144 MB float tensor) only for WanImageToVideo / WanFirstLastFrameToVideo to
+scale it down to the video size. Here each image is
+
+1. checked from its header alone: dimensions and a decompression-bomb limit
+   (MAX_INPUT_PIXELS) before any pixel data is decoded,
+2. decoded at reduced size where the format allows it (JPEG draft mode makes
+   libjpeg decode at 1/2, 1/4 or 1/8 scale directly),
+3. resized to the target size with the same center crop the WAN nodes apply
+   via common_upscale(..., "center"), so the nodes get a tensor that already
+   has the video size.
+
+The resulting [1,H,W,3] tensors are kept in an in-memory LRU keyed by
+(content hash, width, height, crop), so jobs that reuse an image skip
+decoding entirely. Cached tensors are shared between jobs and must be
+treated as read-only, which the ComfyUI nodes do.
+"""
+import hashlib
+import io
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+import torch
+from PIL import Image, ImageOps
+
+# Largest accepted input, in pixels, checked before decoding
+MAX_INPUT_PIXELS = int(os.getenv("MAX_INPUT_PIXELS", str(64 * 1000 * 1000)))
+# Memory budget for decoded input tensors; 0 disables the cache
+DECODE_CACHE_MB = int(os.getenv("DECODE_CACHE_MB", "256"))
+
+CROP_MODES = ("center", "disabled")
+# EXIF orientations that swap width and height
+_TRANSPOSED_ORIENTATIONS = {5, 6, 7, 8}
+
+
+def _cover_size(size, target):
+    """Smallest size with the aspect ratio of `size` that covers `target`."""
+    scale = max(target[0] / size[0], target[1] / size[1])
+    return math.ceil(size[0] * scale), math.ceil(size[1] * scale)
+
+
+def _crop_box(size, target):
+    """Centered box of `size` with the aspect ratio of `target`."""
+    width, height = size
+    if width * target[1] > height * target[0]:
+        crop_width = height * target[0] / target[1]
+        left = (width - crop_width) / 2
+        return left, 0, left + crop_width, height
+    crop_height = width * target[1] / target[0]
+    top = (height - crop_height) / 2
+    return 0, top, width, top + crop_height
+
+
+def load_resized(data, width, height, crop="center"):
+    """
+    Decode image bytes straight to an RGB PIL image of width x height.
+
+    Returns (image, info) where info has the source size and the size that
+    was actually decoded. Raises ValueError for undecodable or oversized
+    images.
+    """
+    if crop not in CROP_MODES:
+        raise ValueError(f"Unknown crop mode {crop!r}; expected one of {', '.join(CROP_MODES)}")
+    try:
+        image = Image.open(io.BytesIO(data))
+    except (OSError, SyntaxError) as e:
+        raise ValueError(f"Invalid input image: {e}") from e
+    with image:
+        source_size = image.size
+        if source_size[0] * source_size[1] > MAX_INPUT_PIXELS:
+            raise ValueError(f"Input image is {source_size[0]}x{source_size[1]}, "
+                             f"more than the {MAX_INPUT_PIXELS} pixel limit")
+        # Draft sizes are in stored orientation, before EXIF rotation
+        target = (width, height)
+        if image.getexif().get(0x0112) in _TRANSPOSED_ORIENTATIONS:
+            target = (height, width)
+        if image.format == "JPEG":
+            image.draft("RGB", _cover_size(source_size, target) if crop == "center" else target)
+        decoded_size = image.size
+        try:
+            image.load()
+        except (OSError, SyntaxError) as e:
+            raise ValueError(f"Invalid input image: {e}") from e
+
+        image = ImageOps.exif_transpose(image)
+        # 16-bit grayscale, handled the way LoadImage does
+        if image.mode == 'I':
+            image = image.point(lambda i: i * (1 / 255))
+        image = image.convert("RGB")
+        box = _crop_box(image.size, (width, height)) if crop == "center" else None
+        image = image.resize((width, height), Image.LANCZOS, box=box, reducing_gap=3.0)
+
+    return image, {"source_size": list(source_size), "decoded_size": list(decoded_size)}
+
+
+class DecodedImageCache:
+    """Thread-safe LRU of decoded input tensors with a byte budget."""
+
+    def __init__(self, max_bytes=None):
+        self.max_bytes = DECODE_CACHE_MB * 2**20 if max_bytes is None else max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "evictions": 0, "decode_time": 0.0}
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._counters["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._counters["hits"] += 1
+            return entry
+
+    def put(self, key, tensor, info, decode_time):
+        size = tensor.element_size() * tensor.nelement()
+        with self._lock:
+            self._counters["decode_time"] += decode_time
+            if size > self.max_bytes or key in self._entries:
+                return
+            self._entries[key] = (tensor, info)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (evicted, _) = self._entries.popitem(last=False)
+                self._bytes -= evicted.element_size() * evicted.nelement()
+                self._counters["evictions"] += 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats["entries"] = len(self._entries)
+            stats["cache_bytes"] = self._bytes
+        stats["decode_time"] = round(stats["decode_time"], 3)
+        return stats
+
+
+_decode_cache = DecodedImageCache()
+
+
+def load_input_image(data, width, height, crop="center"):
+    """
+    [1,height,width,3] float tensor for the image bytes in data (bytes or a
+    memoryview), like LoadImage.load_image(path)[0] followed by the WAN
+    nodes' resize.
+
+    Returns (tensor, info); info reports the source and decoded sizes, the
+    preparation time and whether the tensor came from the cache. Only the
+    first frame of animated images is used.
+    """
+    start = time.perf_counter()
+    key = (hashlib.sha256(data).hexdigest(), width, height, crop)
+
+    cached = _decode_cache.get(key)
+    if cached is not None:
+        tensor, info = cached
+        return tensor, {**info, "cached": True, "prep_time": round(time.perf_counter() - start, 3)}
+
+    image, info = load_resized(data, width, height, crop)
+    tensor = torch.from_numpy(np.asarray(image, dtype=np.float32) / 255.0)[None,]
+    elapsed = time.perf_counter() - start
+    _decode_cache.put(key, tensor, info, elapsed)
+    return tensor, {**info, "cached": False, "prep_time": round(elapsed, 3)}
+
+
+def decode_cache_stats():
+    """Counters of the process-wide decoded image cache."""
+    return _decode_cache.stats()
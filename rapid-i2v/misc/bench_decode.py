@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Compare windowed VAE decoding (video_io.decode_chunks) with one whole-clip
+VAEDecode on the real WAN VAE: peak GPU memory, decode time and fidelity.
+
+Latents come from encoding a slow pan across an input image with the same
+VAE, so they have real structure. Every window setting is decoded and
+compared frame by frame against the whole-clip decode: PSNR over the clip,
+the worst frame, and the frames at window seams (the first latent frame of
+each window after the first, where the causal VAE restarts with only
+`overlap` latent frames of warm-up) against the frames in between.
+
+Run where ComfyUI, a GPU and the VAE weights are available, e.g. in the worker
+container with this directory mounted (COMFYUI_PATH, default /content/ComfyUI):
+
+    python misc/bench_decode.py --windows 4 8 12 --overlap 2
+    python misc/bench_decode.py --vae wan_2.1_vae.safetensors --length 121
+"""
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+import torch
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.append(os.getenv("COMFYUI_PATH", "/content/ComfyUI"))
+from video_io import VAE_DECODE_OVERLAP, VAE_TEMPORAL_COMPRESSION, decode_chunks
+from nodes import NODE_CLASS_MAPPINGS
+
+
+def load_vae(checkpoint, vae_name):
+    if vae_name:
+        return NODE_CLASS_MAPPINGS["VAELoader"]().load_vae(vae_name)[0]
+    return NODE_CLASS_MAPPINGS["CheckpointLoaderSimple"]().load_checkpoint(checkpoint)[2]
+
+
+def pan_frames(image_path, width, height, length):
+    """[F,H,W,3] float frames panning slowly across the image."""
+    image = Image.open(image_path).convert("RGB")
+    scale = max(width * 1.25 / image.width, height / image.height)
+    image = image.resize((round(image.width * scale), round(image.height * scale)), Image.LANCZOS)
+    pixels = np.asarray(image, dtype=np.float32) / 255
+    travel = pixels.shape[1] - width
+    top = (pixels.shape[0] - height) // 2
+    frames = [pixels[top:top + height, round(travel * i / max(length - 1, 1)):][:, :width] for i in range(length)]
+    return torch.from_numpy(np.stack(frames))
+
+
+def seam_frames(latent_length, window):
+    """Pixel frame indices decoded from the first latent frame of every window after the first."""
+    step = VAE_TEMPORAL_COMPRESSION
+    return [frame for start in range(window, latent_length, window)
+            for frame in range(1 + step * (start - 1), 1 + step * start)]
+
+
+def frame_mse(a, b):
+    """Mean squared error per frame of two [F,H,W,C] tensors in 0..1."""
+    return ((a.float() - b.float()) ** 2).flatten(1).mean(1)
+
+
+def psnr(mse):
+    """PSNR in dB for a mean squared error in 0..1 (identical frames cap at 120 dB)."""
+    return 10 * torch.log10(1 / mse.clamp_min(1e-12))
+
+
+def measure(decode):
+    """(frames on the CPU, seconds, peak GPU MiB) of one decode run."""
+    torch.cuda.synchronize()
+    torch.cuda.empty_cache()
+    torch.cuda.reset_peak_memory_stats()
+    start = time.perf_counter()
+    frames = decode()
+    torch.cuda.synchronize()
+    return frames, time.perf_counter() - start, torch.cuda.max_memory_allocated() / 2**20
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Windowed against whole-clip VAE decode: memory, time and PSNR")
+    parser.add_argument("--image", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "input",
+                                                        "girl1.jpg"))
+    parser.add_argument("--checkpoint", default="wan2.2-i2v-rapid-aio.safetensors", help="Checkpoint to take the VAE from")
+    parser.add_argument("--vae", help="Load this VAE file instead of the checkpoint's")
+    parser.add_argument("--width", type=int, default=480)
+    parser.add_argument("--height", type=int, default=720)
+    parser.add_argument("--length", type=int, default=81, help="Pixel frames, 4n+1")
+    parser.add_argument("--windows", type=int, nargs="+", default=[4, 8, 12], help="Windows in latent frames")
+    parser.add_argument("--overlap", type=int, default=VAE_DECODE_OVERLAP)
+    args = parser.parse_args()
+    if not torch.cuda.is_available():
+        sys.exit("bench_decode.py needs a CUDA GPU")
+
+    VAEDecode = NODE_CLASS_MAPPINGS["VAEDecode"]()
+    VAEEncode = NODE_CLASS_MAPPINGS["VAEEncode"]()
+
+    with torch.inference_mode():
+        vae = load_vae(args.checkpoint, args.vae)
+        samples = VAEEncode.encode(vae, pan_frames(args.image, args.width, args.height, args.length))[0]
+        latent_length = samples["samples"].shape[2]
+        print(f"{args.length} frames at {args.width}x{args.height} ({latent_length} latent frames), "
+              f"overlap {args.overlap}")
+
+        def vae_decode(chunk):
+            return VAEDecode.decode(vae, chunk)[0].detach()
+
+        def decode(window):
+            return torch.cat([frames.cpu() for _, frames in decode_chunks(vae_decode, samples, window, args.overlap)])
+
+        reference, seconds, peak = measure(lambda: decode(0))
+        print(f"{'window':>8} {'peak MiB':>9} {'time s':>7} {'PSNR dB':>8} {'worst':>6} {'seams':>6} {'others':>7}")
+        print(f"{'whole':>8} {peak:9.0f} {seconds:7.2f} {'-':>8} {'-':>6} {'-':>6} {'-':>7}")
+        for window in args.windows:
+            if window >= latent_length:
+                continue
+            frames, seconds, peak = measure(lambda: decode(window))
+            assert frames.shape == reference.shape, (frames.shape, reference.shape)
+            mse = frame_mse(frames, reference)
+            seams = seam_frames(latent_length, window)
+            seam_set = set(seams)
+            others = [i for i in range(len(mse)) if i not in seam_set]
+            print(f"{window:>8} {peak:9.0f} {seconds:7.2f} {psnr(mse.mean()).item():8.2f} "
+                  f"{psnr(mse.max()).item():6.2f} {psnr(mse[seams].mean()).item():6.2f} "
+                  f"{psnr(mse[others].mean()).item():7.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Benchmark the raw frame pipe encoder against the old temp-PNG round-trip,
+and segment-parallel encoding at increasing worker counts.
+
+Usage: python misc/bench_encode.py [--frames 81] [--width 720] [--height 1280]
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+import cv2
+import ffmpeg
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from video_io import SegmentedEncoder, available_cpus, encode_frames
+
+
+def make_frames(count, width, height):
+    """Create moving gradient frames so the encoder has real motion to code."""
+    x = np.linspace(0, 255, width, dtype=np.float32)[None, :]
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    frames = []
+    for i in range(count):
+        r = (x + i * 3) % 256
+        g = (y + i * 2) % 256
+        b = (x + y + i) % 256
+        frames.append(np.stack(np.broadcast_arrays(r, g, b), axis=-1).astype(np.uint8))
+    return frames
+
+
+def png_round_trip(frames, output_path, fps, work_dir):
+    temp_files = [os.path.join(work_dir, f"temp_{i:04d}.png") for i in range(len(frames))]
+    for i, frame in enumerate(frames):
+        if not cv2.imwrite(temp_files[i], frame[:, :, ::-1]):
+            raise ValueError(f"Failed to write {temp_files[i]}")
+    stream = ffmpeg.input(os.path.join(work_dir, 'temp_%04d.png'), framerate=fps)
+    stream = ffmpeg.output(stream, output_path, vcodec='libx264', pix_fmt='yuv420p')
+    ffmpeg.run(stream, overwrite_output=True, quiet=True)
+    for temp_file in temp_files:
+        os.remove(temp_file)
+
+
+def segmented(frames, output_path, fps, workers):
+    height, width = frames[0].shape[:2]
+    with SegmentedEncoder(output_path, width, height, fps, total_frames=len(frames), workers=workers) as encoder:
+        encoder.write(np.stack(frames))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare PNG round-trip and rawvideo pipe encoding")
+    parser.add_argument("--frames", type=int, default=81)
+    parser.add_argument("--width", type=int, default=720)
+    parser.add_argument("--height", type=int, default=1280)
+    parser.add_argument("--fps", type=int, default=24)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    frames = make_frames(args.frames, args.width, args.height)
+    print(f"{args.frames} frames at {args.width}x{args.height}, best of {args.repeat}")
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        output_path = os.path.join(work_dir, "bench.mp4")
+        results = {}
+        for name, run in (
+            ("png round-trip", lambda: png_round_trip(frames, output_path, args.fps, work_dir)),
+            ("rawvideo pipe", lambda: encode_frames(frames, output_path, args.fps, parallel=False)),
+            *[
+                (f"segmented x{workers}", lambda workers=workers: segmented(frames, output_path, args.fps, workers))
+                for workers in sorted({1, 2, 4, 8, available_cpus()}) if workers <= available_cpus()
+            ],
+        ):
+            timings = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                run()
+                timings.append(time.perf_counter() - start)
+            results[name] = min(timings)
+            print(f"{name:>16}: {results[name]:.2f}s")
+
+    speedup = results["png round-trip"] / results["rawvideo pipe"]
+    print(f"{'pipe speedup':>16}: {speedup:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
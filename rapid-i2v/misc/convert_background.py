@@ -2,48 +2,50 @@
 """
 Convert PNG images with transparent background to white background
 """
-from PIL import Image
+from PIL import Image, ImageColor
+import numpy as np
 import os
 
-def convert_transparent_to_white(input_path, output_path):
-    """Convert transparent background to white"""
+def parse_color(value):
+    """Background colour from a name ("white"), hex ("#ff8800") or "r,g,b" string"""
+    if "," in value:
+        color = tuple(int(part) for part in value.split(","))
+        if len(color) != 3 or not all(0 <= part <= 255 for part in color):
+            raise ValueError(f"Invalid colour {value!r}; expected r,g,b with values 0-255")
+        return color
+    return ImageColor.getrgb(value)[:3]
+
+def has_alpha(img):
+    """True for images with an alpha channel or a transparent palette entry"""
+    return img.mode in ('RGBA', 'LA', 'PA') or (img.mode == 'P' and 'transparency' in img.info)
+
+def composite_alpha(rgba, background=(255, 255, 255)):
+    """Flatten an [H,W,4] uint8 array onto a solid colour, returning [H,W,3] uint8"""
+    rgb = rgba[..., :3].astype(np.uint16)
+    alpha = rgba[..., 3:].astype(np.uint16)
+    color = np.asarray(background, dtype=np.uint16)
+    # Integer blend, rounded: (rgb * a + color * (255 - a)) / 255
+    return ((rgb * alpha + color * (255 - alpha) + 127) // 255).astype(np.uint8)
+
+def flatten_image(img, background=(255, 255, 255)):
+    """RGB copy of img with any transparency composited onto background"""
+    if not has_alpha(img):
+        return img.convert('RGB')
+    return Image.fromarray(composite_alpha(np.asarray(img.convert('RGBA')), background))
+
+def convert_background(input_path, output_path, background):
+    """Replace the transparent background of input_path with a solid colour"""
     with Image.open(input_path) as img:
-        # Create a white background image
-        white_bg = Image.new('RGB', img.size, (255, 255, 255))
-        
-        # If image has transparency, paste it on white background
-        if img.mode in ('RGBA', 'LA') or (img.mode == 'P' and 'transparency' in img.info):
-            # Convert to RGBA if not already
-            img = img.convert('RGBA')
-            # Paste the image on white background using alpha channel as mask
-            white_bg.paste(img, (0, 0), img)
-        else:
-            # No transparency, just convert to RGB
-            white_bg = img.convert('RGB')
-        
-        # Save as PNG
-        white_bg.save(output_path, 'PNG')
+        flatten_image(img, background).save(output_path, 'PNG')
         print(f"Converted {input_path} -> {output_path}")
 
+def convert_transparent_to_white(input_path, output_path):
+    """Convert transparent background to white"""
+    convert_background(input_path, output_path, (255, 255, 255))
+
 def convert_transparent_to_black(input_path, output_path):
     """Convert transparent background to black"""
-    with Image.open(input_path) as img:
-        # Create a black background image
-        black_bg = Image.new('RGB', img.size, (0, 0, 0))
-        
-        # If image has transparency, paste it on black background
-        if img.mode in ('RGBA', 'LA') or (img.mode == 'P' and 'transparency' in img.info):
-            # Convert to RGBA if not already
-            img = img.convert('RGBA')
-            # Paste the image on black background using alpha channel as mask
-            black_bg.paste(img, (0, 0), img)
-        else:
-            # No transparency, just convert to RGB
-            black_bg = img.convert('RGB')
-        
-        # Save as PNG
-        black_bg.save(output_path, 'PNG')
-        print(f"Converted {input_path} -> {output_path}")
+    convert_background(input_path, output_path, (0, 0, 0))
 
 if __name__ == "__main__":
     # Convert input images to white background
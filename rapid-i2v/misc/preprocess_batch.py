@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+Batch-prepare input images for I2V jobs.
+
+Every image is flattened onto a solid background (NumPy alpha compositing,
+see convert_background.py), assigned its aspect-ratio bucket and
+center-cropped and resized to the generation size the server would plan
+(resolution_plan.py) in one pass. Images are processed on a process pool
+and each output gets one line in a JSONL manifest; its "input" object is a
+ready-to-submit job payload.
+
+Usage:
+    python misc/preprocess_batch.py input/ "campaign/*.png" -o input/prepared --background white
+    python misc/preprocess_batch.py --benchmark 64
+"""
+import os
+import sys
+import glob
+import json
+import time
+import argparse
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from PIL import Image, ImageOps
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from convert_background import flatten_image, parse_color
+from resolution_plan import plan_generation, snap_length, DEFAULT_GPU_CLASS
+
+IMAGE_EXTENSIONS = {".png", ".jpg", ".jpeg", ".webp", ".bmp"}
+# Matches cli.py's default LENGTH
+DEFAULT_LENGTH = 53
+
+
+def collect_inputs(patterns):
+    """Image files from directories, glob patterns or plain paths, sorted and without duplicates."""
+    paths = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            matches = [os.path.join(pattern, name) for name in os.listdir(pattern)]
+        else:
+            matches = glob.glob(pattern)
+        paths.extend(path for path in matches
+                     if os.path.isfile(path) and os.path.splitext(path)[1].lower() in IMAGE_EXTENSIONS)
+    return sorted(set(paths))
+
+
+def output_names(paths, ext):
+    """One output file name per input, made unique when stems repeat."""
+    names, seen = [], {}
+    for path in paths:
+        stem = os.path.splitext(os.path.basename(path))[0]
+        count = seen.get(stem, 0)
+        seen[stem] = count + 1
+        names.append(f"{stem}{f'-{count}' if count else ''}{ext}")
+    return names
+
+
+def generation_bucket(width, height, length, gpu_class):
+    """(video width, video height, label) the planner picks for an image of this size."""
+    plan = plan_generation("wan2.2-i2v", width, height, length, gpu_class=gpu_class)
+    return plan["width"], plan["height"], plan["aspect"]
+
+
+def center_box(size, target):
+    """Centered crop box of size with the aspect ratio of target."""
+    width, height = size
+    if width * target[1] > height * target[0]:
+        crop_width = height * target[0] / target[1]
+        return (width - crop_width) / 2, 0, (width + crop_width) / 2, height
+    crop_height = width * target[1] / target[0]
+    return 0, (height - crop_height) / 2, width, (height + crop_height) / 2
+
+
+def process_image(task):
+    """Flatten, bucket and resize one image; returns its manifest record (or an error record)."""
+    source, output_path, background, length, gpu_class = task
+    start = time.perf_counter()
+    try:
+        with Image.open(source) as img:
+            img = ImageOps.exif_transpose(img)
+            width, height = img.size
+            video_width, video_height, label = generation_bucket(width, height, length, gpu_class)
+            # Resize first (Pillow premultiplies alpha), so compositing runs on the small image
+            if img.mode not in ('RGB', 'RGBA'):
+                img = img.convert('RGBA' if 'transparency' in img.info or img.mode in ('LA', 'PA') else 'RGB')
+            img = img.resize((video_width, video_height), Image.LANCZOS,
+                             box=center_box(img.size, (video_width, video_height)), reducing_gap=3.0)
+            flatten_image(img, background).save(output_path)
+    except Exception as e:
+        return {"source": source, "error": str(e)}
+    return {
+        "source": source,
+        "output": output_path,
+        "source_size": [width, height],
+        "bucket": label,
+        "width": video_width,
+        "height": video_height,
+        "time": round(time.perf_counter() - start, 4)
+    }
+
+
+def run_batch(paths, output_dir, background, workers, ext=".png", length=DEFAULT_LENGTH, gpu_class=DEFAULT_GPU_CLASS):
+    """Process paths on a pool of workers; returns (records in input order, seconds)."""
+    os.makedirs(output_dir, exist_ok=True)
+    tasks = [(path, os.path.join(output_dir, name), background, length, gpu_class)
+             for path, name in zip(paths, output_names(paths, ext))]
+    start = time.perf_counter()
+    if workers == 1:
+        records = [process_image(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            records = list(pool.map(process_image, tasks, chunksize=max(1, len(tasks) // (workers * 4))))
+    return records, time.perf_counter() - start
+
+
+def job_payload(record, args):
+    """Job input for one prepared image, as accepted by the worker and cli.py."""
+    name = os.path.basename(record["output"])
+    return {
+        "input_image": f"{args.image_prefix.rstrip('/')}/{name}" if args.image_prefix else name,
+        "positive_prompt": args.positive_prompt,
+        "negative_prompt": args.negative_prompt,
+        "crop": "center",
+        "width": record["width"],
+        "height": record["height"],
+        "length": args.length
+    }
+
+
+def write_manifest(records, path, args):
+    with open(path, 'w') as f:
+        for record in records:
+            if "error" not in record:
+                f.write(json.dumps({"input": job_payload(record, args), **record}) + "\n")
+
+
+def make_samples(directory, count, size=1536):
+    """Transparent RGBA PNGs of mixed aspect ratios for benchmarking."""
+    shapes = [(size, size), (size, size * 2 // 3), (size * 2 // 3, size)]
+    paths = []
+    for i in range(count):
+        width, height = shapes[i % len(shapes)]
+        rgba = np.zeros((height, width, 4), dtype=np.uint8)
+        rgba[..., 0] = np.linspace(0, 255, width, dtype=np.uint8)[None, :]
+        rgba[..., 1] = (i * 37) % 256
+        rgba[..., 2] = np.linspace(255, 0, height, dtype=np.uint8)[:, None]
+        # Opaque disc on a transparent background, with a soft edge
+        y, x = np.ogrid[:height, :width]
+        distance = np.hypot(x - width / 2, y - height / 2) / (min(width, height) / 2)
+        rgba[..., 3] = (np.clip((1.0 - distance) * 8, 0, 1) * 255).astype(np.uint8)
+        path = os.path.join(directory, f"sample_{i:04d}.png")
+        Image.fromarray(rgba).save(path)
+        paths.append(path)
+    return paths
+
+
+def benchmark(count):
+    cpus = os.cpu_count() or 1
+    with tempfile.TemporaryDirectory() as work_dir:
+        paths = make_samples(work_dir, count)
+        print(f"{count} transparent 1536px PNGs -> bucket PNGs")
+        baseline = None
+        for workers in sorted({1, 2, 4, 8, cpus}):
+            if workers > cpus:
+                continue
+            records, elapsed = run_batch(paths, os.path.join(work_dir, f"out{workers}"), (255, 255, 255), workers)
+            failed = sum("error" in record for record in records)
+            rate = count / elapsed
+            baseline = baseline or rate
+            print(f"{workers:>3} workers: {elapsed:6.2f}s  {rate:7.1f} images/s  {rate / baseline:4.2f}x"
+                  + (f"  ({failed} failed)" if failed else ""))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Flatten transparency and resize images to generation buckets")
+    parser.add_argument("inputs", nargs="*", help="Image files, directories or glob patterns")
+    parser.add_argument("-o", "--output-dir", default="input/prepared", help="Where processed images are written")
+    parser.add_argument("-m", "--manifest", help="JSONL manifest path (default: OUTPUT_DIR/manifest.jsonl)")
+    parser.add_argument("-b", "--background", default="white", help="Background colour: name, #rrggbb or r,g,b")
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count() or 1, help="Worker processes")
+    parser.add_argument("--format", choices=["png", "jpg"], default="png", help="Output image format")
+    parser.add_argument("-l", "--length", type=int, default=DEFAULT_LENGTH, help="Video length the buckets are planned for")
+    parser.add_argument("--gpu-class", default=os.getenv("GPU_CLASS") or DEFAULT_GPU_CLASS, help="GPU class to plan for")
+    parser.add_argument("--image-prefix", help="URL or directory prepended to output names in the manifest")
+    parser.add_argument("-p", "--positive-prompt", default="A beautiful scene with dynamic movement")
+    parser.add_argument("-n", "--negative-prompt", default="static, blurry, low quality")
+    parser.add_argument("--benchmark", type=int, metavar="COUNT", help="Time COUNT synthetic images at 1..N workers")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        benchmark(args.benchmark)
+        return 0
+
+    paths = collect_inputs(args.inputs)
+    if not paths:
+        parser.error("no input images found")
+    background = parse_color(args.background)
+    # Snap like the server does, so the manifest carries the length that will run
+    args.length = snap_length(args.length, "wan2.2-i2v")
+    records, elapsed = run_batch(paths, args.output_dir, background, max(1, args.workers), f".{args.format}",
+                                 args.length, args.gpu_class)
+
+    for record in records:
+        if "error" in record:
+            print(f"Failed: {record['source']}: {record['error']}")
+    manifest = args.manifest or os.path.join(args.output_dir, "manifest.jsonl")
+    write_manifest(records, manifest, args)
+    done = sum("error" not in record for record in records)
+    print(f"Processed {done}/{len(paths)} images in {elapsed:.2f}s ({len(paths) / elapsed:.1f} images/s, "
+          f"{args.workers} workers); manifest: {manifest}")
+    return 0 if done == len(paths) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,315 @@
+"""
+Job progress for RunPod's /status, from sampler steps and job stages.
+
+A ProgressReporter knows a job's stages in order, e.g.
+
+    prepare -> high_noise (10 steps) -> low_noise (10 steps) -> decode -> encode
+
+where prepare covers input images and prompt/image conditioning, decode the
+VAE decode and encode the video encoding. It sends
+runpod.serverless.progress_update(job, update) whenever the stage changes and
+at most every PROGRESS_INTERVAL seconds while steps advance, so /status of an
+IN_PROGRESS job returns something like
+
+    {"stage": "low_noise", "stage_index": 2, "stages": 5, "step": 4, "steps": 10,
+     "percent": 71.3, "elapsed": 48.2, "eta": 19.4}
+
+step/steps are sampler steps within the stage (absent when the stage has no
+step counter). The ETA adds up the remaining sampler steps at this job's
+measured seconds per step and the remaining other stages at their duration
+in earlier jobs on this worker, both scaled by job size (pixel-frames). It is
+None until there is anything to go on, and a lower bound on the first job.
+
+In-process workers feed steps through ComfyUI's progress bar hook (see
+sampling()), which KSampler and KSamplerAdvanced update once per step; the
+HTTP workers feed the `executing`/`progress` websocket events of their
+prompt (see workflow_stages()).
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import runpod
+except ImportError:
+    runpod = None
+
+# Minimum seconds between updates within a stage
+PROGRESS_INTERVAL = float(os.getenv("PROGRESS_INTERVAL", "1.0"))
+SAMPLING_STAGES = ("high_noise", "low_noise", "sample")
+
+# Seconds per pixel-frame of finished jobs on this worker: stage name -> rate,
+# "step" -> one sampler step
+_rates = {}
+_rates_lock = threading.Lock()
+
+# Node class -> stage for HTTP workflows; samplers are handled separately
+_NODE_STAGES = {
+    "LoadImage": "prepare",
+    "CLIPTextEncode": "prepare",
+    "CLIPVisionEncode": "prepare",
+    "WanImageToVideo": "prepare",
+    "WanFirstLastFrameToVideo": "prepare",
+    "VAEEncode": "prepare",
+    "VAEDecode": "decode",
+    "VAEDecodeTiled": "decode",
+    "VHS_VideoCombine": "encode",
+    "CreateVideo": "encode",
+    "SaveVideo": "encode",
+    "SaveAnimatedWEBP": "encode",
+}
+
+
+def _is_sampling(name):
+    return name in SAMPLING_STAGES or name.startswith("sample_")
+
+
+def _learn(name, rate):
+    with _rates_lock:
+        # Smooth over jobs so one slow job does not skew the estimate
+        _rates[name] = rate if name not in _rates else 0.7 * _rates[name] + 0.3 * rate
+
+
+def workflow_stages(workflow):
+    """
+    (stages, node_stages) for an API-format workflow: the ordered
+    (name, steps) list for ProgressReporter and a node id -> stage map for
+    its executing/progress events. With two KSamplerAdvanced nodes the one
+    starting at step 0 is the high noise stage.
+    """
+    samplers = []
+    node_stages = {}
+    for node_id, node in workflow.items():
+        class_type = node.get("class_type")
+        inputs = node.get("inputs", {})
+        if class_type == "KSamplerAdvanced":
+            start = inputs.get("start_at_step", 0)
+            end = min(inputs.get("end_at_step", 10000), inputs.get("steps", 0))
+            samplers.append((start, node_id, max(0, end - start)))
+        elif class_type == "KSampler":
+            samplers.append((0, node_id, inputs.get("steps", 0)))
+        elif class_type in _NODE_STAGES:
+            node_stages[node_id] = _NODE_STAGES[class_type]
+
+    samplers.sort(key=lambda sampler: (sampler[0], str(sampler[1])))
+    if len(samplers) == 1:
+        names = ["sample"]
+    elif len(samplers) == 2:
+        names = ["high_noise", "low_noise"]
+    else:
+        names = [f"sample_{index}" for index in range(len(samplers))]
+    stages = [("prepare", 0)]
+    for name, (_, node_id, steps) in zip(names, samplers):
+        stages.append((name, steps))
+        node_stages[node_id] = name
+    stages += [("decode", 0), ("encode", 0)]
+    return stages, node_stages
+
+
+class ProgressReporter:
+    """
+    Tracks one job through its stages and relays progress to RunPod.
+
+    stages is the ordered list of (name, sampler steps); work is the job
+    size in pixel-frames (plan["pixel_frames"]), used to scale ETAs learned
+    from earlier jobs. send defaults to runpod.serverless.progress_update.
+    """
+
+    def __init__(self, job, stages, work, send=None, interval=None):
+        self.job = job
+        self.stages = list(stages)
+        self.work = max(1, work)
+        self.send = send
+        self.interval = PROGRESS_INTERVAL if interval is None else interval
+        self.start_time = time.monotonic()
+        self.index = -1
+        self.stage_start = self.start_time
+        self.step = 0
+        self.steps = 0
+        self.steps_done = 0
+        self.sampling_time = 0.0
+        self.durations = {}
+        self.last_sent = 0.0
+        self.lock = threading.Lock()
+
+    def _stage_index(self, name):
+        for index, (stage, _) in enumerate(self.stages):
+            if stage == name:
+                return index
+        raise ValueError(f"Unknown stage {name!r}")
+
+    def stage(self, name):
+        """Enter a stage; the previous one is finished."""
+        with self.lock:
+            index = self._stage_index(name)
+            if index == self.index:
+                return
+            self._close_stage()
+            self.index = index
+            self.stage_start = time.monotonic()
+            self.step = 0
+            self.steps = self.stages[index][1]
+            update = self.snapshot()
+        print(f"Progress: {describe_progress(update)}")
+        self._send(update)
+
+    def update(self, step, steps=None):
+        """Sampler step `step` of `steps` finished in the current stage."""
+        with self.lock:
+            if self.index < 0:
+                return
+            if steps:
+                self.steps = steps
+            self.step = step
+            now = time.monotonic()
+            if now - self.last_sent < self.interval and step < self.steps:
+                return
+            update = self.snapshot()
+        self._send(update)
+
+    def _close_stage(self):
+        if self.index < 0:
+            return
+        name = self.stages[self.index][0]
+        duration = time.monotonic() - self.stage_start
+        self.durations[name] = self.durations.get(name, 0.0) + duration
+        if _is_sampling(name):
+            self.steps_done += self.step
+            self.sampling_time += duration
+
+    def _step_rate(self):
+        """Seconds per sampler step for this job."""
+        steps = self.steps_done + (self.step if self._in_sampling() else 0)
+        if steps:
+            elapsed = self.sampling_time + (time.monotonic() - self.stage_start if self._in_sampling() else 0)
+            return elapsed / steps
+        rate = _rates.get("step")
+        return rate * self.work if rate is not None else None
+
+    def _in_sampling(self):
+        return self.index >= 0 and _is_sampling(self.stages[self.index][0])
+
+    def _eta(self):
+        step_rate = self._step_rate()
+        eta = 0.0
+        known = False
+        for index in range(max(self.index, 0), len(self.stages)):
+            name, steps = self.stages[index]
+            if _is_sampling(name):
+                done = 0
+                if index == self.index:
+                    steps, done = self.steps, self.step
+                if step_rate is None:
+                    continue
+                eta += max(0, steps - done) * step_rate
+                known = True
+            elif name in _rates:
+                estimate = _rates[name] * self.work
+                if index == self.index:
+                    estimate = max(0.0, estimate - (time.monotonic() - self.stage_start))
+                eta += estimate
+                known = True
+        return round(eta, 1) if known else None
+
+    def snapshot(self):
+        """Current progress as sent to RunPod."""
+        now = time.monotonic()
+        elapsed = now - self.start_time
+        eta = self._eta()
+        name = self.stages[self.index][0] if self.index >= 0 else "queued"
+        update = {"stage": name, "stage_index": max(self.index, 0), "stages": len(self.stages)}
+        if self.steps:
+            update.update(step=self.step, steps=self.steps)
+        if eta is not None:
+            percent = 100.0 * elapsed / (elapsed + eta) if elapsed + eta > 0 else 0.0
+        else:
+            percent = 100.0 * max(self.index, 0) / len(self.stages)
+        update.update(percent=round(percent, 1), elapsed=round(elapsed, 1), eta=eta)
+        return update
+
+    def _send(self, update):
+        self.last_sent = time.monotonic()
+        send = self.send
+        if send is None:
+            if runpod is None or not self.job.get("id"):
+                return
+            send = runpod.serverless.progress_update
+        try:
+            send(self.job, update)
+        except Exception as e:
+            print(f"Warning: Could not send progress update: {e}")
+
+    def finish(self):
+        """Close the last stage and remember stage durations for later ETAs."""
+        with self.lock:
+            self._close_stage()
+            self.index = -1
+        for name, duration in self.durations.items():
+            if not _is_sampling(name):
+                _learn(name, duration / self.work)
+        if self.steps_done:
+            _learn("step", self.sampling_time / self.steps_done / self.work)
+        return {name: round(duration, 2) for name, duration in self.durations.items()}
+
+    @contextmanager
+    def sampling(self, name):
+        """
+        Enter sampler stage `name` and count its steps through ComfyUI's
+        global progress bar hook, which KSampler and KSamplerAdvanced update
+        after every step.
+        """
+        import comfy.utils
+
+        self.stage(name)
+        previous = comfy.utils.PROGRESS_BAR_HOOK
+
+        def hook(value, total, preview_image, *args, **kwargs):
+            self.update(value, total)
+            if previous is not None:
+                previous(value, total, preview_image, *args, **kwargs)
+
+        comfy.utils.set_progress_bar_global_hook(hook)
+        try:
+            yield
+        finally:
+            comfy.utils.set_progress_bar_global_hook(previous)
+
+    def track(self, chunks, first="decode", then="encode"):
+        """Pass decoded chunks through, in stage `first` until they run out, then `then`."""
+        self.stage(first)
+        for chunk in chunks:
+            yield chunk
+        self.stage(then)
+
+    def relay(self, node_stages):
+        """PromptWatcher event callback that follows a ComfyUI prompt's nodes."""
+        def on_event(event, data):
+            stage = node_stages.get(data.get("node"))
+            if event == "executing" and stage is not None:
+                self.stage(stage)
+            elif event == "progress" and stage is not None:
+                self.stage(stage)
+                self.update(data.get("value", 0), data.get("max"))
+        return on_event
+
+
+def describe_progress(update):
+    """One-line summary of a progress update, for the CLIs."""
+    if not isinstance(update, dict) or "stage" not in update:
+        return None
+    text = f"{update['stage']} ({update.get('stage_index', 0) + 1}/{update.get('stages', '?')})"
+    if update.get("steps"):
+        text += f" step {update.get('step', 0)}/{update['steps']}"
+    text += f", {update.get('percent', 0):.0f}%"
+    if update.get("eta") is not None:
+        text += f", ~{update['eta']:.0f}s left"
+    return text
+
+
+def poll_delay(update, default=5.0, minimum=1.0, maximum=15.0):
+    """Seconds until the next /status poll: a third of the ETA, within limits."""
+    eta = update.get("eta") if isinstance(update, dict) else None
+    if eta is None:
+        return default
+    return min(maximum, max(minimum, eta / 3))
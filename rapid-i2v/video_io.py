@@ -0,0 +1,874 @@
+"""
+Video encoding helpers for the in-process WAN2.2 workers.
+
+Decoded frames are quantized to uint8 in one batched step and streamed to
+ffmpeg as raw rgb24 bytes over stdin, so no intermediate image files are
+written during encoding. BackgroundEncoder runs the encoder on its own
+thread so frames can be handed over while the GPU is still decoding.
+
+Output settings come from named presets (OUTPUT_PRESETS) and can be encoded
+either through an ffmpeg subprocess or in-process with PyAV. Long or large
+clips are split into segments that are encoded by parallel ffmpeg processes
+and joined with the concat demuxer (SegmentedEncoder). FragmentedMP4Encoder
+writes fragmented MP4 and hands every fragment to a callback as soon as
+ffmpeg emits it, so output can be relayed before encoding has finished.
+
+The in-process workers share the decode-to-file path built on these:
+decode_chunks() decodes latents in temporal windows, images_to_videos()
+feeds each batch item to its own BackgroundEncoder, and stream_fragments()
+relays the fragments of a job from a generator handler.
+"""
+import base64
+import os
+import queue
+import shutil
+import struct
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from interpolation import FrameInterpolator, interpolated_frame_count
+
+try:
+    import av
+except ImportError:
+    av = None
+
+# Named output presets. codec_options and format_options are ffmpeg
+# AVOption names, so they work both as ffmpeg CLI flags and as PyAV options.
+# "segmentable" presets can be split for parallel encoding and stream-copied
+# back together. "vhs" maps the preset onto VHS_VideoCombine inputs.
+OUTPUT_PRESETS = {
+    "preview": {
+        "ext": "mp4", "vcodec": "libx264", "pix_fmt": "yuv420p",
+        "codec_options": {"preset": "ultrafast", "crf": "28"},
+        "segmentable": True,
+        "vhs": {"format": "video/h264-mp4", "pix_fmt": "yuv420p", "crf": 28}
+    },
+    "balanced": {
+        "ext": "mp4", "vcodec": "libx264", "pix_fmt": "yuv420p",
+        "codec_options": {"preset": "medium", "crf": "19"},
+        "segmentable": True,
+        "vhs": {"format": "video/h264-mp4", "pix_fmt": "yuv420p", "crf": 19}
+    },
+    "archival_h265": {
+        "ext": "mp4", "vcodec": "libx265", "pix_fmt": "yuv420p",
+        "codec_options": {"preset": "slow", "crf": "18"},
+        "segmentable": True,
+        "vhs": {"format": "video/h265-mp4", "pix_fmt": "yuv420p", "crf": 18}
+    },
+    "archival_vp9": {
+        "ext": "webm", "vcodec": "libvpx-vp9", "pix_fmt": "yuv420p",
+        "codec_options": {"crf": "18", "b": "0", "row-mt": "1"},
+        "segmentable": True,
+        "vhs": {"format": "video/webm", "pix_fmt": "yuv420p", "crf": 18}
+    },
+    "archival_av1": {
+        "ext": "webm", "vcodec": "libaom-av1", "pix_fmt": "yuv420p",
+        "codec_options": {"crf": "24", "b": "0", "cpu-used": "4", "row-mt": "1"},
+        "segmentable": True,
+        "vhs": {"format": "video/av1-webm", "pix_fmt": "yuv420p", "crf": 24}
+    },
+    "webp": {
+        "ext": "webp", "vcodec": "libwebp_anim", "pix_fmt": "yuv420p",
+        "codec_options": {"quality": "80"},
+        "format_options": {"loop": "0"},
+        "vhs": {"format": "image/webp"}
+    },
+    "gif": {
+        "ext": "gif", "vcodec": "gif", "pix_fmt": "pal8",
+        # Per-clip palette; only applied by the ffmpeg backend
+        "filter": "split[a][b];[a]palettegen[p];[b][p]paletteuse",
+        "format_options": {"loop": "0"},
+        "vhs": {"format": "image/gif"}
+    }
+}
+
+DEFAULT_OUTPUT_PRESET = os.getenv("OUTPUT_PRESET", "balanced")
+DEFAULT_ENCODER_BACKEND = os.getenv("ENCODER_BACKEND", "ffmpeg")
+
+# Clips with at least this many frames x pixels are encoded in parallel segments
+SEGMENT_PARALLEL_MIN_PIXELS = int(os.getenv("SEGMENT_PARALLEL_MIN_PIXELS", str(81 * 720 * 720)))
+# Segment lengths are rounded up to a multiple of this many frames
+SEGMENT_GOP = int(os.getenv("SEGMENT_GOP", "16"))
+# Keyframe interval for fragmented MP4; every keyframe starts a new fragment
+FMP4_GOP = int(os.getenv("FMP4_GOP", str(SEGMENT_GOP)))
+FMP4_MOVFLAGS = "frag_keyframe+empty_moov+default_base_moof"
+
+# Temporal VAE decode windows, in latent frames (0 decodes the whole clip at once).
+# Opt-in: windows cap decode memory and let encoding start while later windows
+# decode, but each window restarts the causal VAE with only VAE_DECODE_OVERLAP
+# latent frames of warm-up, so frames near the seams differ from a whole-clip
+# decode. rapid-i2v/misc/bench_decode.py measures memory and PSNR of both.
+VAE_DECODE_WINDOW = int(os.getenv("VAE_DECODE_WINDOW", "0"))
+VAE_DECODE_OVERLAP = int(os.getenv("VAE_DECODE_OVERLAP", "2"))
+# The WAN VAE turns the first latent frame into 1 image and every later one into 4
+VAE_TEMPORAL_COMPRESSION = 4
+
+
+def get_output_preset(name=None):
+    """Look up an output preset by name, falling back to DEFAULT_OUTPUT_PRESET."""
+    name = name or DEFAULT_OUTPUT_PRESET
+    if name not in OUTPUT_PRESETS:
+        raise ValueError(f"Unknown output preset: {name} (choose from {', '.join(OUTPUT_PRESETS)})")
+    return OUTPUT_PRESETS[name]
+
+
+def frames_to_uint8(images, rgb=True):
+    """
+    Quantize decoded frames into one contiguous uint8 array of shape [F,H,W,C].
+
+    Accepts the float [F,H,W,C] tensor returned by VAEDecode, or a numpy
+    array. Channel-first and 5D [B,F,...] inputs are normalized first. For
+    tensors the scale, clamp and cast run on the tensor's device, so only
+    the uint8 result is copied to host memory. With rgb=True alpha is
+    dropped and grayscale is expanded to three channels.
+    """
+    if images.ndim == 5:
+        images = images.reshape(-1, *images.shape[2:])
+    if images.ndim == 3:
+        images = images[None]
+    if images.shape[-1] not in (1, 3, 4) and images.shape[1] in (1, 3, 4):
+        images = images.permute(0, 2, 3, 1) if hasattr(images, 'permute') else images.transpose(0, 2, 3, 1)
+    if rgb and images.shape[-1] == 4:
+        images = images[..., :3]
+
+    if hasattr(images, 'detach'):
+        frames = (images.detach() * 255).clamp_(0, 255).byte().cpu().numpy()
+    else:
+        frames = np.clip(np.asarray(images, dtype=np.float32) * 255, 0, 255).astype(np.uint8)
+    frames = np.ascontiguousarray(frames)
+
+    if rgb and frames.shape[-1] == 1:
+        frames = np.repeat(frames, 3, axis=-1)
+    return frames
+
+
+def preset_ffmpeg_args(preset=None):
+    """Return the ffmpeg output arguments (codec, filter, options) for a preset."""
+    settings = get_output_preset(preset)
+    args = ["-c:v", settings["vcodec"]]
+    if settings.get("filter"):
+        args += ["-vf", settings["filter"]]
+    args += ["-pix_fmt", settings["pix_fmt"]]
+    for key, value in {**settings.get("codec_options", {}), **settings.get("format_options", {})}.items():
+        args += [f"-{key}", str(value)]
+    return args
+
+
+def build_ffmpeg_command(output_path, width, height, fps=24, preset=None, extra_args=()):
+    """Build an ffmpeg command line that reads rawvideo rgb24 frames from stdin."""
+    return [
+        "ffmpeg", "-y",
+        "-loglevel", "error",
+        "-f", "rawvideo",
+        "-pix_fmt", "rgb24",
+        "-s", f"{width}x{height}",
+        "-framerate", str(fps),
+        "-i", "pipe:0",
+        *preset_ffmpeg_args(preset),
+        *extra_args,
+        output_path
+    ]
+
+
+def available_cpus():
+    """CPUs this process may run on (respects container affinity limits)."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def _frame_stack(frames, width, height):
+    frames = np.ascontiguousarray(frames, dtype=np.uint8)
+    if frames.ndim == 3:
+        frames = frames[None]
+    if frames.shape[1:] != (height, width, 3):
+        raise ValueError(f"Expected frames of shape ({height}, {width}, 3), got {frames.shape[1:]}")
+    return frames
+
+
+class FramePipeEncoder:
+    """
+    Encode RGB uint8 frames by piping them into an ffmpeg subprocess.
+
+    Frames are written as HxWx3 arrays (or NxHxWx3 stacks) and must all share
+    the width and height given at construction time.
+    """
+
+    def __init__(self, output_path, width, height, fps=24, preset=None, extra_args=(), stdout=subprocess.DEVNULL):
+        self.output_path = output_path
+        self.width = width
+        self.height = height
+        self.frame_count = 0
+        self.process = subprocess.Popen(
+            build_ffmpeg_command(output_path, width, height, fps, preset, extra_args),
+            stdin=subprocess.PIPE,
+            stdout=stdout,
+            stderr=subprocess.PIPE
+        )
+
+    def write(self, frames):
+        """Write one frame or a stack of frames to the encoder."""
+        frames = _frame_stack(frames, self.width, self.height)
+        try:
+            self.process.stdin.write(memoryview(frames).cast('B'))
+        except BrokenPipeError:
+            self._fail()
+        self.frame_count += len(frames)
+
+    def close(self):
+        """Flush remaining frames and wait for ffmpeg to finish the file."""
+        try:
+            self.process.stdin.close()
+        except BrokenPipeError:
+            pass
+        stderr = self.process.stderr.read()
+        self.process.stderr.close()
+        if self.process.wait() != 0:
+            raise RuntimeError(f"ffmpeg failed: {stderr.decode(errors='replace').strip()}")
+        return self.output_path
+
+    def abort(self):
+        """Stop the encoder without finishing the output file."""
+        if self.process.poll() is None:
+            self.process.kill()
+        self.process.wait()
+        for stream in (self.process.stdin, self.process.stderr):
+            try:
+                stream.close()
+            except (BrokenPipeError, OSError):
+                pass
+
+    def _fail(self):
+        self.process.wait()
+        stderr = self.process.stderr.read().decode(errors='replace').strip()
+        raise RuntimeError(f"ffmpeg exited while receiving frames: {stderr}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+        return False
+
+
+def _read_exact(stream, size):
+    data = b""
+    while len(data) < size:
+        chunk = stream.read(size - len(data))
+        if not chunk:
+            break
+        data += chunk
+    return data
+
+
+def iter_mp4_fragments(stream):
+    """
+    Split a fragmented MP4 byte stream into playable pieces.
+
+    Yields the init segment (ftyp+moov) first, then one moof+mdat fragment
+    at a time, each as soon as its last byte has been read. Trailing boxes
+    such as mfra are yielded as a final piece.
+    """
+    pending = []
+    while True:
+        header = _read_exact(stream, 8)
+        if not header:
+            break
+        if len(header) < 8:
+            raise ValueError("Truncated MP4 box header")
+        size, box_type = struct.unpack(">I4s", header)
+        if size == 1:
+            header += _read_exact(stream, 8)
+            size = struct.unpack(">Q", header[8:16])[0]
+        body = _read_exact(stream, size - len(header)) if size else stream.read()
+        if size and len(header) + len(body) != size:
+            raise ValueError(f"Truncated MP4 box: {box_type.decode(errors='replace')}")
+        pending.append(header + body)
+        if box_type in (b"moov", b"mdat"):
+            yield b"".join(pending)
+            pending = []
+    if pending:
+        yield b"".join(pending)
+
+
+def remux_fragments(input_path, fragment_seconds=1.0):
+    """
+    Stream-copy a finished MP4 into fragmented MP4 and yield its pieces.
+
+    For files that were encoded elsewhere (e.g. by VHS_VideoCombine inside
+    ComfyUI). No re-encoding happens; fragments are cut every
+    fragment_seconds as well as at keyframes.
+    """
+    process = subprocess.Popen(
+        ["ffmpeg", "-loglevel", "error", "-i", input_path, "-c", "copy",
+         "-movflags", FMP4_MOVFLAGS, "-frag_duration", str(int(fragment_seconds * 1_000_000)),
+         "-f", "mp4", "pipe:1"],
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE
+    )
+    try:
+        yield from iter_mp4_fragments(process.stdout)
+        stderr = process.stderr.read()
+        if process.wait() != 0:
+            raise RuntimeError(f"ffmpeg remux failed: {stderr.decode(errors='replace').strip()}")
+    finally:
+        if process.poll() is None:
+            process.kill()
+        process.wait()
+        process.stdout.close()
+        process.stderr.close()
+
+
+class FragmentedMP4Encoder(FramePipeEncoder):
+    """
+    Frame-pipe encoder that produces fragmented MP4 on ffmpeg's stdout.
+
+    A reader thread splits the output into the init segment and moof+mdat
+    fragments, appends each one to output_path and passes it to
+    on_fragment(data). The first call always carries the init segment. The
+    finished file is a regular, playable MP4.
+    """
+
+    def __init__(self, output_path, width, height, fps=24, preset=None, on_fragment=None):
+        if get_output_preset(preset)["ext"] != "mp4":
+            raise ValueError(f"Fragmented MP4 output needs an mp4 preset, not {preset or DEFAULT_OUTPUT_PRESET}")
+        super().__init__("pipe:1", width, height, fps, preset,
+                         extra_args=("-g", str(FMP4_GOP), "-movflags", FMP4_MOVFLAGS, "-f", "mp4"),
+                         stdout=subprocess.PIPE)
+        self.output_path = output_path
+        self.on_fragment = on_fragment
+        self.fragment_count = 0
+        self.relay_error = None
+        self._reader = threading.Thread(target=self._relay, name="fmp4-reader", daemon=True)
+        self._reader.start()
+
+    def close(self):
+        """Finish encoding and wait until every fragment has been relayed."""
+        try:
+            super().close()
+        finally:
+            self._reader.join()
+            self.process.stdout.close()
+        if self.relay_error is not None:
+            raise RuntimeError(f"Relaying MP4 fragments failed: {self.relay_error}") from self.relay_error
+        return self.output_path
+
+    def abort(self):
+        """Stop the encoder and the reader without finishing the output file."""
+        super().abort()
+        self._reader.join()
+        self.process.stdout.close()
+
+    def _relay(self):
+        try:
+            with open(self.output_path, 'wb') as f:
+                for fragment in iter_mp4_fragments(self.process.stdout):
+                    f.write(fragment)
+                    if self.on_fragment is not None:
+                        self.on_fragment(fragment)
+                    self.fragment_count += 1
+        except Exception as e:
+            self.relay_error = e
+            # Stop ffmpeg so the producer sees a broken pipe instead of blocking
+            if self.process.poll() is None:
+                self.process.kill()
+            self.process.stdout.read()
+
+
+class PyAVEncoder:
+    """
+    Encode RGB uint8 frames in-process with PyAV.
+
+    Same interface as FramePipeEncoder. Avoids the subprocess and pipe copy,
+    but the preset "filter" (GIF palette generation) is not applied.
+    """
+
+    def __init__(self, output_path, width, height, fps=24, preset=None):
+        if av is None:
+            raise RuntimeError("PyAV is not installed; use the ffmpeg backend or pip install av")
+        settings = get_output_preset(preset)
+        self.output_path = output_path
+        self.width = width
+        self.height = height
+        self.frame_count = 0
+        self.container = av.open(output_path, mode='w', options=dict(settings.get("format_options", {})))
+        try:
+            self.stream = self.container.add_stream(settings["vcodec"], rate=fps)
+            self.stream.width = width
+            self.stream.height = height
+            self.stream.pix_fmt = settings["pix_fmt"]
+            self.stream.options = dict(settings.get("codec_options", {}))
+        except Exception:
+            self.container.close()
+            raise
+
+    def write(self, frames):
+        """Write one frame or a stack of frames to the encoder."""
+        for frame in _frame_stack(frames, self.width, self.height):
+            video_frame = av.VideoFrame.from_ndarray(frame, format='rgb24')
+            self.container.mux(self.stream.encode(video_frame))
+            self.frame_count += 1
+
+    def close(self):
+        """Flush the codec and finalize the container."""
+        self.container.mux(self.stream.encode())
+        self.container.close()
+        return self.output_path
+
+    def abort(self):
+        """Close the container without flushing buffered frames."""
+        try:
+            self.container.close()
+        except Exception:
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+        return False
+
+
+class SegmentedEncoder:
+    """
+    Encode a clip as GOP-aligned segments in parallel ffmpeg processes.
+
+    Incoming frames are cut into segments of segment_frames (a multiple of
+    SEGMENT_GOP). Each segment is encoded independently, so it starts on a
+    keyframe, by its own ffmpeg process with an equal share of the CPUs.
+    close() joins the segments with the concat demuxer using stream copy.
+    The ffmpeg processes do the work, so only threads are needed here and
+    the worker process is never forked.
+    """
+
+    def __init__(self, output_path, width, height, fps=24, preset=None, total_frames=None, workers=None):
+        if not get_output_preset(preset).get("segmentable"):
+            raise ValueError(f"Output preset {preset or DEFAULT_OUTPUT_PRESET} cannot be encoded in segments")
+        self.output_path = output_path
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.preset = preset
+        self.frame_count = 0
+        self.workers = max(1, workers or available_cpus())
+        per_worker = -(-(total_frames or SEGMENT_GOP * self.workers) // self.workers)
+        self.segment_frames = max(SEGMENT_GOP, -(-per_worker // SEGMENT_GOP) * SEGMENT_GOP)
+        self.threads = max(1, available_cpus() // self.workers)
+        self.work_dir = tempfile.mkdtemp(prefix=".segments-", dir=os.path.dirname(os.path.abspath(output_path)))
+        self.segment_paths = []
+        self._futures = []
+        self._pending = []
+        self._pending_count = 0
+        # Bound how many finished-but-unencoded segments are held in memory
+        self._slots = threading.BoundedSemaphore(self.workers * 2)
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="segment-encoder")
+
+    def write(self, frames):
+        """Write one frame or a stack of frames; full segments start encoding immediately."""
+        frames = _frame_stack(frames, self.width, self.height)
+        self.frame_count += len(frames)
+        while len(frames):
+            take = self.segment_frames - self._pending_count
+            self._pending.append(frames[:take])
+            self._pending_count += len(frames[:take])
+            frames = frames[take:]
+            if self._pending_count == self.segment_frames:
+                self._flush()
+
+    def _flush(self):
+        if not self._pending:
+            return
+        for future in self._futures:
+            if future.done() and future.exception() is not None:
+                raise RuntimeError(f"Segment encoding failed: {future.exception()}") from future.exception()
+        pieces, self._pending, self._pending_count = self._pending, [], 0
+        path = os.path.join(self.work_dir, f"segment_{len(self.segment_paths):04d}.mkv")
+        self.segment_paths.append(path)
+        self._slots.acquire()
+        future = self._pool.submit(self._encode_segment, pieces, path)
+        future.add_done_callback(lambda _: self._slots.release())
+        self._futures.append(future)
+
+    def _encode_segment(self, pieces, path):
+        with FramePipeEncoder(path, self.width, self.height, self.fps, self.preset, ["-threads", str(self.threads)]) as encoder:
+            for piece in pieces:
+                encoder.write(piece)
+
+    def close(self):
+        """Encode the final partial segment, wait for all segments and concatenate them."""
+        try:
+            self._flush()
+            for future in self._futures:
+                future.result()
+            if not self.segment_paths:
+                raise ValueError("No frames to encode")
+            list_path = os.path.join(self.work_dir, "segments.txt")
+            with open(list_path, 'w') as f:
+                for path in self.segment_paths:
+                    f.write(f"file '{path}'\n")
+            result = subprocess.run([
+                "ffmpeg", "-y",
+                "-loglevel", "error",
+                "-f", "concat",
+                "-safe", "0",
+                "-i", list_path,
+                "-c", "copy",
+                self.output_path
+            ], capture_output=True, text=True)
+            if result.returncode != 0:
+                raise RuntimeError(f"ffmpeg concat failed: {result.stderr.strip()}")
+            return self.output_path
+        finally:
+            self._pool.shutdown(wait=True)
+            shutil.rmtree(self.work_dir, ignore_errors=True)
+
+    def abort(self):
+        """Drop pending segments and remove partial output."""
+        for future in self._futures:
+            future.cancel()
+        self._pool.shutdown(wait=True)
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+        return False
+
+
+ENCODER_BACKENDS = {
+    "ffmpeg": FramePipeEncoder,
+    "pyav": PyAVEncoder
+}
+
+
+def use_segment_parallel(width, height, total_frames=None, preset=None, parallel="auto"):
+    """
+    Decide whether to encode in parallel segments. parallel may be True,
+    False or "auto"; auto picks segments once total_frames x width x height
+    reaches SEGMENT_PARALLEL_MIN_PIXELS and more than one CPU is available.
+    """
+    if parallel is False or not get_output_preset(preset).get("segmentable"):
+        return False
+    if parallel is True:
+        return True
+    return (bool(total_frames) and available_cpus() > 1
+            and total_frames * width * height >= SEGMENT_PARALLEL_MIN_PIXELS)
+
+
+def open_encoder(output_path, width, height, fps=24, preset=None, backend=None, total_frames=None, parallel="auto"):
+    """
+    Create an encoder for the given backend name ("ffmpeg" or "pyav"), or a
+    SegmentedEncoder when use_segment_parallel() selects it. An explicit
+    "pyav" backend is only overridden when parallel is True.
+    """
+    backend = backend or DEFAULT_ENCODER_BACKEND
+    if backend not in ENCODER_BACKENDS:
+        raise ValueError(f"Unknown encoder backend: {backend} (choose from {', '.join(ENCODER_BACKENDS)})")
+    if backend == "pyav" and parallel == "auto":
+        parallel = False
+    if use_segment_parallel(width, height, total_frames, preset, parallel):
+        return SegmentedEncoder(output_path, width, height, fps, preset, total_frames)
+    return ENCODER_BACKENDS[backend](output_path, width, height, fps, preset)
+
+
+def encode_frames(frames, output_path, fps=24, preset=None, backend=None, parallel="auto"):
+    """Encode an [F,H,W,3] uint8 array or a sequence of HxWx3 RGB frames to a video file."""
+    if len(frames) == 0:
+        raise ValueError("No frames to encode")
+    height, width = frames[0].shape[:2]
+    with open_encoder(output_path, width, height, fps, preset, backend, len(frames), parallel) as encoder:
+        if isinstance(frames, np.ndarray):
+            encoder.write(frames)
+        else:
+            for frame in frames:
+                encoder.write(frame)
+    return output_path
+
+
+class BackgroundEncoder:
+    """
+    Encode frames on a background thread fed through a bounded queue.
+
+    submit() blocks once max_pending chunks are waiting, which keeps host
+    memory bounded when the producer runs ahead of the encoder. The encoder
+    is opened when the first chunk arrives, so the frame size does not need
+    to be known up front. An encoder failure is re-raised from the next
+    submit() or from close(). After close(), encode_time holds the seconds
+    the encoder thread spent encoding and output_size the file size in bytes.
+
+    An optional transform (for example a frame interpolator) is applied to
+    every chunk on the encoder thread before it is encoded; its time is
+    tracked separately in transform_time. With on_fragment the output is
+    fragmented MP4 and every fragment is passed to on_fragment(data) while
+    encoding is still running (see FragmentedMP4Encoder).
+    """
+
+    def __init__(self, output_path, fps=24, preset=None, backend=None, max_pending=4, total_frames=None, parallel="auto",
+                 transform=None, on_fragment=None):
+        get_output_preset(preset)
+        self.output_path = output_path
+        self.fps = fps
+        self.preset = preset
+        self.backend = backend
+        self.total_frames = total_frames
+        self.parallel = parallel
+        self.transform = transform
+        self.on_fragment = on_fragment
+        self.encode_mode = None
+        self.source_frame_count = 0
+        self.frame_count = 0
+        self.encode_time = 0.0
+        self.transform_time = 0.0
+        self.output_size = None
+        self.error = None
+        self._cancelled = False
+        self._closed = False
+        self._encoder = None
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._thread = threading.Thread(target=self._run, name="video-encoder", daemon=True)
+        self._thread.start()
+
+    def submit(self, frames):
+        """Queue an [N,H,W,3] uint8 chunk (or a single HxWx3 frame) for encoding."""
+        if self.error is not None:
+            raise RuntimeError(f"Video encoding failed: {self.error}") from self.error
+        if frames.ndim == 3:
+            frames = frames[None]
+        self._queue.put(frames)
+        self.source_frame_count += len(frames)
+
+    def close(self):
+        """Wait for all queued frames to be encoded and the file to be finalized."""
+        self._finish()
+        if self.error is not None:
+            raise RuntimeError(f"Video encoding failed: {self.error}") from self.error
+        if self.frame_count == 0:
+            raise ValueError("No frames to encode")
+        self.output_size = os.path.getsize(self.output_path)
+        return self.output_path
+
+    def stats(self):
+        """Encoding metrics for the job result."""
+        stats = {
+            "encode_time": round(self.encode_time, 2),
+            "output_size": self.output_size,
+            "frame_count": self.frame_count,
+            "encode_mode": self.encode_mode
+        }
+        if self.transform is not None:
+            stats["source_frame_count"] = self.source_frame_count
+            stats["transform_time"] = round(self.transform_time, 2)
+        if isinstance(self._encoder, FragmentedMP4Encoder):
+            stats["fragment_count"] = self._encoder.fragment_count
+        return stats
+
+    def abort(self):
+        """Drop queued frames and stop the encoder without finalizing the file."""
+        self._cancelled = True
+        self._finish()
+
+    def _finish(self):
+        if not self._closed:
+            self._closed = True
+            self._queue.put(None)
+        self._thread.join()
+
+    def _run(self):
+        encoder = None
+        try:
+            while True:
+                frames = self._queue.get()
+                if frames is None or self._cancelled:
+                    break
+                if self.transform is not None:
+                    busy_start = time.perf_counter()
+                    frames = self.transform(frames)
+                    self.transform_time += time.perf_counter() - busy_start
+                    if len(frames) == 0:
+                        continue
+                self.frame_count += len(frames)
+                busy_start = time.perf_counter()
+                if encoder is None:
+                    height, width = frames.shape[1:3]
+                    if self.on_fragment is not None:
+                        encoder = FragmentedMP4Encoder(self.output_path, width, height, self.fps, self.preset, self.on_fragment)
+                        self.encode_mode = "fragmented"
+                    else:
+                        encoder = open_encoder(self.output_path, width, height, self.fps, self.preset, self.backend,
+                                               self.total_frames, self.parallel)
+                        self.encode_mode = "segmented" if isinstance(encoder, SegmentedEncoder) else "single"
+                    self._encoder = encoder
+                encoder.write(frames)
+                self.encode_time += time.perf_counter() - busy_start
+            if encoder is not None:
+                if self._cancelled:
+                    encoder.abort()
+                else:
+                    busy_start = time.perf_counter()
+                    encoder.close()
+                    self.encode_time += time.perf_counter() - busy_start
+        except Exception as e:
+            self.error = e
+            if encoder is not None:
+                encoder.abort()
+        # Unblock a producer waiting on a full queue until the sentinel arrives
+        while frames is not None:
+            frames = self._queue.get()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+        return False
+
+
+def resolve_decode_window(window=None, overlap=VAE_DECODE_OVERLAP):
+    """
+    A job's decode window: window, or VAE_DECODE_WINDOW when None. Raises
+    ValueError unless it is a non-negative int, and for an overlap below 1.
+    A window decoded cold turns its first latent frame into 1 image instead
+    of 4, so without overlap every window after the first loses 3 frames.
+    """
+    window = VAE_DECODE_WINDOW if window is None else window
+    if isinstance(window, bool) or not isinstance(window, int) or window < 0:
+        raise ValueError(f"vae_decode_window must be a non-negative integer, got {window!r}")
+    if window and overlap < 1:
+        raise ValueError(f"VAE_DECODE_OVERLAP must be at least 1 latent frame, got {overlap}")
+    return window
+
+
+def decode_chunks(decode, samples, window=0, overlap=VAE_DECODE_OVERLAP):
+    """
+    Decode latents one batch item at a time, yielding (batch_index, [F,H,W,C]
+    frames) pairs. decode(samples) is the VAE decode, e.g. VAEDecode.decode
+    bound to a VAE. With a window, each item is decoded in temporal slices of
+    that many latent frames. Every slice after the first is decoded together
+    with `overlap` (at least 1) preceding latent frames to warm up the causal
+    VAE, and the frames those produce are dropped.
+    """
+    window = resolve_decode_window(window, overlap)
+    latent = samples["samples"]
+    for i in range(latent.shape[0]):
+        item = latent[i:i + 1]
+        length = item.shape[2]
+        if window <= 0 or window >= length:
+            yield i, decode({**samples, "samples": item})
+            continue
+        for start in range(0, length, window):
+            end = min(start + window, length)
+            context = max(0, start - overlap)
+            frames = decode({**samples, "samples": item[:, :, context:end]})
+            if start > 0:
+                frames = frames[-VAE_TEMPORAL_COMPRESSION * (end - start):]
+            yield i, frames
+            del frames
+
+
+def decoded_frame_count(samples):
+    """Number of frames decode_chunks will produce per batch item."""
+    return 1 + VAE_TEMPORAL_COMPRESSION * (samples["samples"].shape[2] - 1)
+
+
+def images_to_videos(chunks, output_paths, fps=24, preset=None, backend=None, frames_per_video=None, parallel="auto",
+                     interpolate=1, interpolation_method=None, on_fragment=None):
+    """
+    Encode each batch item to its own file. Every video has its own encoder
+    thread, so all of them encode concurrently while later items decode.
+    With interpolate > 1 the frame rate is multiplied on the encoder threads.
+    With on_fragment the videos are fragmented MP4 and each fragment is
+    passed to on_fragment(batch_index, data) as soon as it is encoded.
+    """
+    encoders = [
+        BackgroundEncoder(path, fps * interpolate, preset, backend,
+                          total_frames=interpolated_frame_count(frames_per_video, interpolate) if frames_per_video else None,
+                          parallel=parallel,
+                          transform=FrameInterpolator(interpolate, interpolation_method) if interpolate > 1 else None,
+                          on_fragment=(lambda data, index=index: on_fragment(index, data)) if on_fragment else None)
+        for index, path in enumerate(output_paths)
+    ]
+    try:
+        for index, images in chunks:
+            encoders[index].submit(frames_to_uint8(images))
+            # Free the float frames before the next chunk is decoded
+            del images
+        for encoder in encoders:
+            encoder.close()
+    except BaseException:
+        for encoder in encoders:
+            encoder.abort()
+        raise
+    return [encoder.stats() for encoder in encoders]
+
+
+def interpolation_stats(stats):
+    """Rename the encoder's transform metrics for the job result."""
+    if "transform_time" not in stats:
+        return stats
+    stats = dict(stats)
+    stats["interpolation_time"] = stats.pop("transform_time")
+    stats["original_frame_count"] = stats.pop("source_frame_count")
+    return stats
+
+
+def stream_fragments(generate, job):
+    """
+    Run generate(job, on_fragment=...) on a thread and yield every fragmented
+    MP4 piece as soon as it is encoded, then the job result. Fragment 0 of
+    each video is its init segment; concatenating a video's fragments gives
+    the file. An exception from generate is re-raised here once the pieces
+    sent before it are out, so the job fails instead of ending with an
+    empty result.
+    """
+    fragments = queue.Queue()
+    result = {}
+    error = []
+
+    def run():
+        try:
+            result.update(generate(job, on_fragment=lambda batch_index, data: fragments.put((batch_index, data))))
+        except BaseException as e:
+            error.append(e)
+        finally:
+            fragments.put(None)
+
+    threading.Thread(target=run, name="generate", daemon=True).start()
+    fragment_counts = {}
+    while True:
+        item = fragments.get()
+        if item is None:
+            break
+        batch_index, data = item
+        fragment_index = fragment_counts.get(batch_index, 0)
+        fragment_counts[batch_index] = fragment_index + 1
+        yield {
+            "batch_index": batch_index,
+            "fragment_index": fragment_index,
+            "data": base64.b64encode(data).decode('utf-8')
+        }
+    if error:
+        raise error[0]
+    yield result
@@ -1,17 +1,25 @@
-import os, json, requests, random, time, cv2, ffmpeg, runpod
+import os, json, shutil, random, time, runpod
 from moviepy.video.io.VideoFileClip import VideoFileClip
-from urllib.parse import urlsplit
 
 import torch
 import numpy as np
 
+from workspace import JobWorkspace
+from image_cache import cache_stats
+from image_source import resolve_image
+from image_prep import load_input_image, decode_cache_stats
+from resolution_plan import plan_generation, describe_plan
+from video_io import (decode_chunks, decoded_frame_count, images_to_videos, interpolation_stats, stream_fragments,
+                      resolve_decode_window, get_output_preset, DEFAULT_OUTPUT_PRESET)
+from interpolation import FrameInterpolator
+from progress import ProgressReporter
+
 from nodes import NODE_CLASS_MAPPINGS
 from comfy_extras import nodes_wan, nodes_model_advanced
 
 CheckpointLoaderSimple = NODE_CLASS_MAPPINGS["CheckpointLoaderSimple"]()
 CLIPVisionLoader = NODE_CLASS_MAPPINGS["CLIPVisionLoader"]()
 
-LoadImage = NODE_CLASS_MAPPINGS["LoadImage"]()
 CLIPTextEncode = NODE_CLASS_MAPPINGS["CLIPTextEncode"]()
 CLIPVisionEncode = NODE_CLASS_MAPPINGS["CLIPVisionEncode"]()
 WanImageToVideo = nodes_wan.NODE_CLASS_MAPPINGS["WanImageToVideo"]()
@@ -23,78 +31,27 @@ with torch.inference_mode():
     unet, clip, vae = CheckpointLoaderSimple.load_checkpoint("wan2.2-i2v-rapid-aio.safetensors")
     clip_vision = CLIPVisionLoader.load_clip("clip_vision_vit_h.safetensors")[0]
 
-def get_input_image_path(input_image):
-    """
-    Get the path to the input image.
-    Supports both URLs and local file paths.
-    """
-    # Check if it's a local file path
-    if not input_image.startswith(('http://', 'https://')):
-        # Assume it's a local file path relative to /content/ComfyUI/input/
-        local_path = f"/content/ComfyUI/input/{input_image}"
-        if os.path.exists(local_path):
-            print(f"Using local image: {local_path}")
-            return local_path
-        else:
-            # Check if it's an absolute path
-            if os.path.exists(input_image):
-                print(f"Using absolute path image: {input_image}")
-                return input_image
-            else:
-                raise FileNotFoundError(f"Local image not found: {input_image}")
-    
-    # It's a URL, download it
-    print(f"Downloading image from URL: {input_image}")
-    os.makedirs("/content/ComfyUI/input", exist_ok=True)
-    file_suffix = os.path.splitext(urlsplit(input_image).path)[1]
-    if not file_suffix:
-        file_suffix = '.jpg'  # Default extension
-    file_name_with_suffix = f"downloaded_image{file_suffix}"
-    file_path = os.path.join("/content/ComfyUI/input", file_name_with_suffix)
-    
-    response = requests.get(input_image)
-    response.raise_for_status()
-    with open(file_path, 'wb') as file:
-        file.write(response.content)
-    print(f"Image downloaded to: {file_path}")
-    return file_path
-
-def images_to_mp4(images, output_path, fps=24):
-    try:
-        frames = []
-        for image in images:
-            i = 255. * image.cpu().numpy()
-            img = np.clip(i, 0, 255).astype(np.uint8)
-            if img.shape[0] in [1, 3, 4]:
-                img = np.transpose(img, (1, 2, 0))
-            if img.shape[-1] == 4:
-                img = img[:, :, :3]
-            frames.append(img)
-        temp_files = [f"temp_{i:04d}.png" for i in range(len(frames))]
-        for i, frame in enumerate(frames):
-            success = cv2.imwrite(temp_files[i], frame[:, :, ::-1])
-            if not success:
-                raise ValueError(f"Failed to write {temp_files[i]}")
-        if not os.path.exists(temp_files[0]):
-            raise FileNotFoundError("Temporary PNG files were not created")
-        stream = ffmpeg.input('temp_%04d.png', framerate=fps)
-        stream = ffmpeg.output(stream, output_path, vcodec='libx264', pix_fmt='yuv420p')
-        ffmpeg.run(stream, overwrite_output=True)
-        for temp_file in temp_files:
-            os.remove(temp_file)
-    except Exception as e:
-        print(f"Error: {e}")
+# Relative input image paths are looked up here
+INPUT_DIR = "/content/ComfyUI/input"
+
+# Stream fragmented MP4 pieces from a generator handler instead of returning once done
+STREAM_OUTPUT = os.getenv("STREAM_OUTPUT", "false").lower() == "true"
+
+def vae_decode(samples):
+    return VAEDecode.decode(vae, samples)[0].detach()
 
 @torch.inference_mode()
-def generate(input):
+def generate(input, on_fragment=None):
     # Start timing the entire generation process
     start_time = time.time()
+    workspace = JobWorkspace(input.get('id'))
     
     try:
         values = input["input"]
 
         input_image = values['input_image']
-        input_image_path = get_input_image_path(input_image)
+        # URL, data URI, base64 or local path, kept in memory
+        input_source = resolve_image(input_image, [INPUT_DIR])
         positive_prompt = values['positive_prompt']
         negative_prompt = values['negative_prompt']
         crop = values['crop']
@@ -102,6 +59,13 @@ def generate(input):
         height = values['height']
         length = values['length']
         batch_size = values['batch_size']
+        # Snap size and length to the model's buckets within this GPU's budget
+        plan = plan_generation("wan2.2-i2v", width, height, length, batch_size)
+        width, height, length = plan['width'], plan['height'], plan['length']
+        print(f"Resolution plan: {describe_plan(plan)}")
+        progress = ProgressReporter(input, [("prepare", 0), ("sample", values['steps']), ("decode", 0), ("encode", 0)],
+                                    plan['pixel_frames'])
+        progress.stage("prepare")
         shift = values['shift']
         cfg = values['cfg']
         sampler_name = values['sampler_name']
@@ -112,22 +76,48 @@ def generate(input):
             random.seed(int(time.time()))
             seed = random.randint(0, 18446744073709551615)
         fps = values['fps']
+        output_preset = values.get('output_preset')
+        output_ext = get_output_preset(output_preset)['ext']
+        encoder_backend = values.get('encoder_backend')
+        interpolate = int(values.get('interpolate', 1))
+        interpolation_method = values.get('interpolation_method')
+        # Reject bad interpolation and decode settings before spending time on sampling
+        FrameInterpolator(interpolate, interpolation_method)
+        decode_window = resolve_decode_window(values.get('vae_decode_window'))
+        if on_fragment is not None and output_ext != "mp4":
+            raise ValueError(f"Streaming output needs an mp4 output preset, got {output_preset}")
 
         model = ModelSamplingSD3.patch(unet, shift)[0]
         positive = CLIPTextEncode.encode(clip, positive_prompt)[0]
         negative = CLIPTextEncode.encode(clip, negative_prompt)[0]
 
-        input_image = LoadImage.load_image(input_image_path)[0]
+        # Decoded straight to width x height (reduced-size JPEG decode, cached by content)
+        input_image, input_info = load_input_image(input_source.data, width, height)
         clip_vision_output = CLIPVisionEncode.encode(clip_vision, input_image, crop)[0]
         positive, negative, out_latent = WanImageToVideo.encode(positive, negative, vae, width, height, length, batch_size, start_image=input_image, clip_vision_output=clip_vision_output)
-        out_samples = KSampler.sample(model, seed, steps, cfg, sampler_name, scheduler, positive, negative, out_latent)[0]
+        with progress.sampling("sample"):
+            out_samples = KSampler.sample(model, seed, steps, cfg, sampler_name, scheduler, positive, negative, out_latent)[0]
 
-        decoded_images = VAEDecode.decode(vae, out_samples)[0].detach()
-        
         # Create output directory and save video locally
         os.makedirs("/content/ComfyUI/output", exist_ok=True)
-        result = f"/content/ComfyUI/output/wan2.2-i2v-rapid-{seed}-local.mp4"
-        images_to_mp4(decoded_images, result, fps)
+        if torch.cuda.is_available():
+            torch.cuda.reset_peak_memory_stats()
+        # One video per batch item, encoded inside the job workspace and only
+        # moved into the output directory once finished
+        batch_count = out_samples["samples"].shape[0]
+        suffixes = [""] if batch_count == 1 else [f"-{i}" for i in range(batch_count)]
+        result_paths = [f"/content/ComfyUI/output/wan2.2-i2v-rapid-{seed}{suffix}-local.{output_ext}" for suffix in suffixes]
+        scratch_paths = [workspace.file(path) for path in result_paths]
+        encode_stats = images_to_videos(progress.track(decode_chunks(vae_decode, out_samples, decode_window)), scratch_paths, fps, output_preset, encoder_backend,
+                                        decoded_frame_count(out_samples), values.get('parallel_encode', "auto"),
+                                        interpolate, interpolation_method, on_fragment)
+        scratch_bytes = workspace.disk_usage()
+        videos = []
+        for batch_index, (scratch_path, result_path, stats) in enumerate(zip(scratch_paths, result_paths, encode_stats)):
+            shutil.move(scratch_path, result_path)
+            videos.append({"result": result_path, "seed": seed, "batch_index": batch_index, **interpolation_stats(stats)})
+        decode_peak_memory_mb = round(torch.cuda.max_memory_allocated() / 2**20) if torch.cuda.is_available() else None
+        stage_times = progress.finish()
         
         job_id = values.get('job_id', f'local-job-{seed}')
         
@@ -137,10 +127,22 @@ def generate(input):
         # Return local file path instead of upload URL with execution time
         return {
             "jobId": job_id,
-            "result": result,
+            "result": result_paths[0],
             "status": "DONE",
             "message": "Video saved locally",
-            "execution_time": execution_time
+            "execution_time": execution_time,
+            "plan": plan,
+            "stage_times": stage_times,
+            "vae_decode_window": decode_window,
+            "decode_peak_memory_mb": decode_peak_memory_mb,
+            "output_preset": output_preset or DEFAULT_OUTPUT_PRESET,
+            "interpolate": interpolate,
+            "output_fps": fps * interpolate,
+            "videos": videos,
+            "scratch_bytes": scratch_bytes,
+            "input_images": [{**input_source.describe(), **input_info}],
+            "image_cache": cache_stats(),
+            "decode_cache": decode_cache_stats()
         }
     except Exception as e:
         job_id = values.get('job_id', 'unknown-job') if 'values' in locals() else 'unknown-job'
@@ -152,5 +154,17 @@ def generate(input):
             "status": "FAILED",
             "execution_time": execution_time
         }
+    finally:
+        workspace.cleanup()
+
+def generate_stream(input):
+    """
+    Streaming handler (STREAM_OUTPUT=true). Yields every fragmented MP4 piece
+    as soon as it is encoded, then the job result (see stream_fragments).
+    """
+    yield from stream_fragments(generate, input)
 
-runpod.serverless.start({"handler": generate})
\ No newline at end of file
+if STREAM_OUTPUT:
+    runpod.serverless.start({"handler": generate_stream, "return_aggregate_stream": True})
+else:
+    runpod.serverless.start({"handler": generate})
\ No newline at end of file
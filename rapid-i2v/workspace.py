@@ -0,0 +1,91 @@
+"""
+Per-job scratch directories for the WAN2.2 workers.
+
+Every job gets its own directory, on tmpfs (/dev/shm) when it is available,
+so concurrent jobs in one container never share temporary file names. The
+directory is removed when the job finishes, whether it succeeded or failed.
+"""
+import os
+import re
+import shutil
+import tempfile
+import threading
+import uuid
+
+
+def _default_scratch_root():
+    if os.path.isdir("/dev/shm") and os.access("/dev/shm", os.W_OK):
+        return "/dev/shm/wan-jobs"
+    return os.path.join(tempfile.gettempdir(), "wan-jobs")
+
+
+SCRATCH_ROOT = os.getenv("SCRATCH_ROOT") or _default_scratch_root()
+
+_active = {}
+_active_lock = threading.Lock()
+
+
+class JobWorkspace:
+    """
+    Scratch directory owned by a single job.
+
+    Use as a context manager, or call cleanup() from a finally block.
+    `token` is unique per workspace and can be embedded in file names that
+    leave the directory (for example images uploaded to ComfyUI).
+    """
+
+    def __init__(self, job_id=None, root=None):
+        self.root = root or SCRATCH_ROOT
+        safe_id = re.sub(r'[^A-Za-z0-9_.-]', '_', str(job_id or "job"))[:64]
+        self.token = f"{safe_id}-{uuid.uuid4().hex[:8]}"
+        os.makedirs(self.root, exist_ok=True)
+        self.path = tempfile.mkdtemp(prefix=f"{self.token}-", dir=self.root)
+        self.peak_bytes = 0
+        with _active_lock:
+            _active[self.path] = self
+
+    def file(self, name):
+        """Absolute path for a file inside this workspace."""
+        return os.path.join(self.path, os.path.basename(name))
+
+    def unique_name(self, name):
+        """File name prefixed with this workspace's token."""
+        return f"{self.token}-{os.path.basename(name)}"
+
+    def disk_usage(self):
+        """Bytes currently stored in the workspace; also updates peak_bytes."""
+        total = 0
+        for dirpath, _, filenames in os.walk(self.path):
+            for filename in filenames:
+                try:
+                    total += os.path.getsize(os.path.join(dirpath, filename))
+                except OSError:
+                    pass
+        self.peak_bytes = max(self.peak_bytes, total)
+        return total
+
+    def cleanup(self):
+        """Remove the workspace directory. Safe to call more than once."""
+        with _active_lock:
+            if _active.pop(self.path, None) is None:
+                return
+        if os.path.isdir(self.path):
+            self.disk_usage()
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.cleanup()
+        return False
+
+
+def active_usage():
+    """Number of live workspaces and the bytes they currently hold."""
+    with _active_lock:
+        workspaces = list(_active.values())
+    return {
+        "active_workspaces": len(workspaces),
+        "scratch_bytes": sum(workspace.disk_usage() for workspace in workspaces)
+    }